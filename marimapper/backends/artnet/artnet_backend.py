@@ -1,15 +1,23 @@
 import socket
-from time import sleep
+import threading
+import time
 import enum
 from functools import partial
 import argparse
+from multiprocessing import get_logger
+
+logger = get_logger()
 
 
 def artnet_set_args(parser):
-    parser.add_argument("--fixture_count", default=160, help="The Fixture count")
-    parser.add_argument("--base_universe", default=0, help="The base universe")
     parser.add_argument(
-        "--channels_per_fixture", default=4, help="The channels per fixture"
+        "--fixture_count", type=int, default=160, help="The Fixture count"
+    )
+    parser.add_argument(
+        "--base_universe", type=int, default=0, help="The base universe"
+    )
+    parser.add_argument(
+        "--channels_per_fixture", type=int, default=4, help="The channels per fixture"
     )
     parser.add_argument(
         "--server", default="255.255.255.255", help="The server address"
@@ -42,12 +50,19 @@ class Backend:
 
     To switch a fixture on, it'll set all the brightness channels for a fixture to full.
 
+    Some Art-Net devices expect a constant stream of data and won't update if they only see a single packet,
+    so a background thread resends every universe at 40Hz followed by an ArtSync packet.
+
     https://art-net.org.uk/art-net-specification/
     """
 
     # Art-Net implementation constants
     UDP_PORT = 6454
     ARTNET_VERSION = 14
+    REFRESH_RATE = 40
+    CHANNELS_PER_UNIVERSE = 512
+    DMX_HEADER_LENGTH = 18  # header + sequence + physical + universe + length
+    SEQUENCE_OFFSET = 12
 
     def __init__(
         self,
@@ -56,21 +71,48 @@ class Backend:
         channels_per_fixture: int,
         server_address: str,
         broadcast: bool,
+        udp_port: int = UDP_PORT,
     ):
         self.fixture_count = fixture_count
         self.base_universe = base_universe
         self.channels_per_fixture = channels_per_fixture
         self.server_address = server_address
+        self.udp_port = udp_port
         self.sequence = 0
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         if broadcast:
             self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
+        # Calculate how many universes we need to cover all the LEDs
+        universe_count = (
+            self.get_led_count() * self.channels_per_fixture
+        ) // self.CHANNELS_PER_UNIVERSE + 1
+
+        self.channels = bytearray(self.CHANNELS_PER_UNIVERSE * universe_count)
+
+        # Packets are built once and only have their channel data replaced when a universe changes
+        self.packets = [
+            self.get_artdmx_packet(u, self.get_universe_channels(u), 0)
+            for u in range(universe_count)
+        ]
+        self.artsync_packet = self.get_artsync_packet()
+
+        self.dirty_universes: set[int] = set()
+        self.lock = threading.Lock()
+
+        self.running = True
+        self.refresh_thread = threading.Thread(target=self._run, daemon=True)
+        self.refresh_thread.start()
+
     def get_led_count(self):
         return self.fixture_count
 
+    def stop(self):
+        self.running = False
+        self.refresh_thread.join()
+
     def send_packet(self, packet: bytearray):
-        self.sock.sendto(packet, (self.server_address, self.UDP_PORT))
+        self.sock.sendto(packet, (self.server_address, self.udp_port))
 
     def artnet_header(self, opcode: OpCode) -> bytearray:
         packet = bytearray("Art-Net\0", "utf8")  # Header
@@ -79,7 +121,7 @@ class Backend:
         return packet
 
     def get_artdmx_packet(
-        self, universe: int, channels: list[int], sequence: int
+        self, universe: int, channels: bytes, sequence: int
     ) -> bytearray:
         packet = self.artnet_header(OpCode.ArtDMX)
         packet.append(sequence)  # Sequence
@@ -101,35 +143,64 @@ class Backend:
         packet.extend([0, 0])
         return packet
 
-    def send_universe(self, universe: int, channels: list[int]) -> None:
-        packet = self.get_artdmx_packet(universe, channels, self.sequence)
-        self.send_packet(packet)
-        self.sequence = (self.sequence + 1) % 256
-
-    def set_led(self, led_index: int, on: bool) -> None:
-        # Calculate how many universes we need to cover all the LEDs
-        universe_count = (self.get_led_count() * self.channels_per_fixture) // 512 + 1
-
-        # Generate a zeroed list of all channels we need to send
-        channels = [0] * (512 * universe_count)
-
-        # Set the brightness for the selected fixture
+    def get_universe_channels(self, universe: int) -> bytearray:
+        start = universe * self.CHANNELS_PER_UNIVERSE
+        return self.channels[start : start + self.CHANNELS_PER_UNIVERSE]
+
+    def send_frame(self) -> None:
+        with self.lock:
+            for universe in self.dirty_universes:
+                self.packets[universe][self.DMX_HEADER_LENGTH :] = (
+                    self.get_universe_channels(universe)
+                )
+            self.dirty_universes.clear()
+
+        for packet in self.packets:
+            packet[self.SEQUENCE_OFFSET] = self.sequence
+            self.send_packet(packet)
+            self.sequence = (self.sequence + 1) % 256
+
+        # ArtSync tells devices that support it to latch every universe of this frame at once
+        self.send_packet(self.artsync_packet)
+
+    def _run(self):
+        frame_period = 1.0 / self.REFRESH_RATE
+        send_failed = False
+        while self.running:
+            frame_start = time.monotonic()
+            # keep refreshing through network errors, only logging the first of each run of failures
+            try:
+                self.send_frame()
+                send_failed = False
+            except OSError:
+                if not send_failed:
+                    logger.exception("Art-Net backend failed to send a frame")
+                send_failed = True
+            time.sleep(max(0.0, frame_period - (time.monotonic() - frame_start)))
+
+    def _set_fixture(self, led_index: int, brightness: int) -> None:
+        # must be called with the lock held
         fixture_base_channel = led_index * self.channels_per_fixture
-        for c in range(0, self.channels_per_fixture):
-            channels[fixture_base_channel + c] = 255 if on else 0
+        fixture_end_channel = fixture_base_channel + self.channels_per_fixture
 
-        # Split the channels into universes
-        universes = [
-            channels[u * 512 : (u + 1) * 512] for u in range(0, universe_count)
-        ]
+        self.channels[fixture_base_channel:fixture_end_channel] = bytes(
+            [brightness] * self.channels_per_fixture
+        )
 
-        # Some Art-Net devices expect a constant stream of data and won't immediately update
-        # if they only see a single packet. Ideally we would spawn a separate thread and keep sending
-        # packets at 40Hz, but this works on my hardware, although it slows things down a bit.
-        for _ in range(0, 5):
-            for u in range(0, len(universes)):
-                self.send_universe(u, universes[u])
-            sleep(0.05)
+        # fixtures can straddle two universes
+        self.dirty_universes.update(
+            range(
+                fixture_base_channel // self.CHANNELS_PER_UNIVERSE,
+                (fixture_end_channel - 1) // self.CHANNELS_PER_UNIVERSE + 1,
+            )
+        )
 
-        # Send an ArtSync packet for good measure, although I'm not sure many devices actually use it.
-        self.send_packet(self.get_artsync_packet())
+    def set_led(self, led_index: int, on: bool) -> None:
+        with self.lock:
+            self._set_fixture(led_index, 255 if on else 0)
+
+    def set_leds(self, buffer: list[list[int]]) -> None:
+        # fixtures only have brightness channels, so use the brightest colour channel
+        with self.lock:
+            for led_index, color in enumerate(buffer[: self.get_led_count()]):
+                self._set_fixture(led_index, max(color))
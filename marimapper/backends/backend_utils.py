@@ -1,27 +1,55 @@
-from marimapper.backends.custom import custom_backend
-from marimapper.backends.dummy import dummy_backend
-from marimapper.backends.fadecandy import fadecandy_backend
-from marimapper.backends.fcmega import fcmega_backend
-from marimapper.backends.pixelblaze import pixelblaze_backend
-from marimapper.backends.wled import wled_backend
-from marimapper.backends.artnet import artnet_backend
+from importlib import import_module
 
-backend_factories = {
-    "custom": custom_backend.custom_backend_factory,
-    "dummy": dummy_backend.dummy_backend_factory,
-    "fadecandy": fadecandy_backend.fadecandy_backend_factory,
-    "fcmega": fcmega_backend.fcmega_backend_factory,
-    "pixelblaze": pixelblaze_backend.pixelblaze_backend_factory,
-    "wled": wled_backend.wled_backend_factory,
-    "artnet": artnet_backend.artnet_backend_factory,
+# backends are registered by name and only imported when they're used,
+# the module, factory and arg setter of each one
+backends = {
+    "custom": (
+        "marimapper.backends.custom.custom_backend",
+        "custom_backend_factory",
+        "custom_backend_set_args",
+    ),
+    "dummy": (
+        "marimapper.backends.dummy.dummy_backend",
+        "dummy_backend_factory",
+        "dummy_backend_set_args",
+    ),
+    "fadecandy": (
+        "marimapper.backends.fadecandy.fadecandy_backend",
+        "fadecandy_backend_factory",
+        "fadecandy_backend_set_args",
+    ),
+    "fcmega": (
+        "marimapper.backends.fcmega.fcmega_backend",
+        "fcmega_backend_factory",
+        "fcmega_backend_set_args",
+    ),
+    "pixelblaze": (
+        "marimapper.backends.pixelblaze.pixelblaze_backend",
+        "pixelblaze_backend_factory",
+        "pixelblaze_backend_set_args",
+    ),
+    "wled": (
+        "marimapper.backends.wled.wled_backend",
+        "wled_backend_factory",
+        "wled_backend_set_args",
+    ),
+    "artnet": (
+        "marimapper.backends.artnet.artnet_backend",
+        "artnet_backend_factory",
+        "artnet_set_args",
+    ),
 }
 
-backend_arg_setters = {
-    "custom": custom_backend.custom_backend_set_args,
-    "dummy": dummy_backend.dummy_backend_set_args,
-    "fadecandy": fadecandy_backend.fadecandy_backend_set_args,
-    "fcmega": fcmega_backend.fcmega_backend_set_args,
-    "pixelblaze": pixelblaze_backend.pixelblaze_backend_set_args,
-    "wled": wled_backend.wled_backend_set_args,
-    "artnet": artnet_backend.artnet_set_args,
-}
+
+def get_backend_names() -> list[str]:
+    return list(backends.keys())
+
+
+def get_backend_factory(backend_name: str):
+    module_name, factory_name, _ = backends[backend_name]
+    return getattr(import_module(module_name), factory_name)
+
+
+def get_backend_arg_setter(backend_name: str):
+    module_name, _, arg_setter_name = backends[backend_name]
+    return getattr(import_module(module_name), arg_setter_name)
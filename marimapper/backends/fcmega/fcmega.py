@@ -1,5 +1,6 @@
 import serial
 import struct
+import numpy as np
 import serial.tools.list_ports
 from multiprocessing import get_logger
 
@@ -32,10 +33,9 @@ class FCMega:
         return None
 
     def set_pixels(self, pixels, offset=0):
+        pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
         update_buffer = struct.pack("<BHH", self.DATA_MODE, offset, len(pixels))
-        for led in pixels:
-            update_buffer += struct.pack("BBB", led[0], led[1], led[2])
-        self.serial.write(update_buffer)
+        self.serial.write(update_buffer + pixels.tobytes())
 
         buffer_update_response = struct.unpack("<B", self.serial.read(1))[0]
 
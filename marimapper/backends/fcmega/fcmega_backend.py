@@ -1,7 +1,7 @@
 import time
 import threading
+import numpy as np
 
-from marimapper.backends.fcmega.fcmega import FCMega
 from functools import partial
 
 
@@ -16,8 +16,17 @@ def fcmega_backend_set_args(parser):
 class Backend:
 
     def __init__(self):
+        # pyserial is only needed once the backend is actually started
+        from marimapper.backends.fcmega.fcmega import FCMega
+
         self.fc_mega = FCMega()
-        self.leds = [(0, 0, 0) for _ in range(self.get_led_count())]
+        self.leds = np.zeros((self.get_led_count(), 3), dtype=np.uint8)
+        self.lock = threading.Lock()
+
+        # [dirty_start, dirty_stop) is the range of leds that needs sending, everything to start with
+        self.dirty_start = 0
+        self.dirty_stop = self.get_led_count()
+
         self.running = True
         self.update_thread = threading.Thread(target=self._run, daemon=True)
         self.update_thread.start()
@@ -25,15 +34,38 @@ class Backend:
     def get_led_count(self):
         return 24 * 400
 
+    def _mark_dirty(self, start: int, stop: int):
+        self.dirty_start = min(self.dirty_start, start)
+        self.dirty_stop = max(self.dirty_stop, stop)
+
+    def _send_dirty(self) -> bool:
+        with self.lock:
+            if self.dirty_stop <= self.dirty_start:
+                return False
+            offset = self.dirty_start
+            pixels = self.leds[self.dirty_start : self.dirty_stop].copy()
+            self.dirty_start = self.get_led_count()
+            self.dirty_stop = 0
+
+        self.fc_mega.set_pixels(pixels, offset)
+        self.fc_mega.update()
+        return True
+
     def _run(self):
         while self.running:
-            self.fc_mega.set_pixels(self.leds)
-            self.fc_mega.update()
+            self._send_dirty()
             time.sleep(0.02)
 
     def set_led(self, led_index: int, on: bool):
-
-        self.leds[led_index] = (100, 100, 100) if on else (0, 0, 0)
+        with self.lock:
+            self.leds[led_index] = 100 if on else 0
+            self._mark_dirty(led_index, led_index + 1)
 
     def set_leds(self, buffer: list[list[int]]):
-        self.leds = buffer
+        colors = np.array(buffer[: self.get_led_count()], dtype=np.uint8).reshape(-1, 3)
+        with self.lock:
+            current = self.leds[: len(colors)]
+            changed = np.flatnonzero((current != colors).any(axis=1))
+            current[:] = colors
+            if len(changed) > 0:
+                self._mark_dirty(int(changed[0]), int(changed[-1]) + 1)
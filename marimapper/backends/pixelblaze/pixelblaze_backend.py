@@ -1,13 +1,5 @@
 from multiprocessing import get_logger
-
-# see https://github.com/TheMariday/marimapper/issues/78
-# why this is a UserWarning and not a DepreciationWarning is beyond me...
 import warnings
-
-with warnings.catch_warnings():
-    warnings.filterwarnings("ignore", category=UserWarning, module="py_mini_racer")
-    import pixelblaze
-
 from ipaddress import ip_address
 from functools import partial
 import argparse
@@ -34,6 +26,15 @@ class Backend:
                 f"Pixelblaze backend failed to start due as {pixelblaze_ip} is not a valid IP address"
             )
 
+        # pixelblaze brings in a whole javascript engine, so it's only imported once the backend is started
+        # see https://github.com/TheMariday/marimapper/issues/78
+        # why this is a UserWarning and not a DepreciationWarning is beyond me...
+        with warnings.catch_warnings():
+            warnings.filterwarnings(
+                "ignore", category=UserWarning, module="py_mini_racer"
+            )
+            import pixelblaze
+
         self.pb = pixelblaze.Pixelblaze(pixelblaze_ip)
         try:
             self.pb.setActivePatternByName(
@@ -1,20 +1,64 @@
-import requests
+import socket
+import threading
+import time
+import numpy as np
 from ipaddress import ip_address
 from functools import partial
 import argparse
+from multiprocessing import get_logger
+
+logger = get_logger()
 
 
 def wled_backend_factory(argparse_args: argparse.Namespace):
-    return partial(Backend, argparse_args.server)
+    return partial(Backend, argparse_args.server, argparse_args.udp)
 
 
 def wled_backend_set_args(parser):
     parser.add_argument("--server", default="4.3.2.1")
+    parser.add_argument(
+        "--udp",
+        action="store_true",
+        help="Drive the leds over WLED's realtime UDP protocol rather than the JSON API",
+    )
+
+
+def get_color_ranges(buffer: list[list[int]]) -> list:
+    # WLED's "i" array accepts [start, stop, colour] ranges, so runs of the same colour collapse into one entry
+    ranges = []
+    run_start = 0
+    for led_index in range(1, len(buffer) + 1):
+        if led_index == len(buffer) or buffer[led_index] != buffer[run_start]:
+            color = "".join(f"{int(channel):02X}" for channel in buffer[run_start])
+            ranges += [run_start, led_index, color]
+            run_start = led_index
+    return ranges
+
+
+def get_changed_runs(changed: np.ndarray, max_gap: int) -> list[tuple[int, int]]:
+    # groups sorted led indices into [start, stop) runs, bridging gaps that are cheaper to resend than split
+    if len(changed) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(changed) > max_gap)
+    starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+    stops = np.concatenate((changed[breaks], [changed[-1]])) + 1
+    return list(zip(starts.tolist(), stops.tolist()))
 
 
 class Backend:
 
-    def __init__(self, wled_base_url):
+    # WLED devices have a limited json buffer, so large buffers are split across requests
+    MAX_RANGES_PER_REQUEST = 256
+
+    # https://kno.wled.ge/interfaces/udp-realtime/
+    UDP_PORT = 21324
+    DNRGB = 4
+    DNRGB_MAX_LEDS = 489
+    REALTIME_TIMEOUT = 2  # seconds until WLED leaves realtime mode
+    REALTIME_REFRESH = 1.0  # resend the strip if idle this long
+    UDP_MAX_GAP = 2  # a DNRGB packet header costs about as much as 2 leds
+
+    def __init__(self, wled_base_url, udp: bool = False, udp_port: int = UDP_PORT):
 
         try:
             ip_address(wled_base_url)
@@ -25,12 +69,56 @@ class Backend:
 
         self.state_endpoint = f"http://{wled_base_url}/json/state"
         self.info_endpoint = f"http://{wled_base_url}/json/info"
+
+        # requests is only needed once the backend is actually started
+        import requests
+
+        # keeps the connection alive between requests
+        self.session = requests.Session()
+        self.led_count = None
+
+        # in udp mode the JSON API is only used to discover the led count
+        self.udp = udp
+        if self.udp:
+            self.udp_address = (wled_base_url, udp_port)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.leds = np.zeros((self.get_led_count(), 3), dtype=np.uint8)
+            self.lock = threading.Lock()
+            self.last_sent = time.monotonic()
+
         self.reset_wled()
 
+        if self.udp:
+            self.stopped = threading.Event()
+            self.keep_alive_thread = threading.Thread(
+                target=self._keep_alive, daemon=True
+            )
+            self.keep_alive_thread.start()
+
+    def stop(self):
+        if self.udp:
+            self.stopped.set()
+            self.keep_alive_thread.join()
+
+    def _keep_alive(self):
+        # WLED only leaves realtime mode after a timeout, so the device returns to normal once we stop
+        while not self.stopped.wait(self.REALTIME_REFRESH / 4):
+            with self.lock:
+                if time.monotonic() - self.last_sent < self.REALTIME_REFRESH:
+                    continue
+                try:
+                    self.send_dnrgb(0, self.get_led_count())
+                except OSError:
+                    logger.exception("WLED backend failed to refresh the leds")
+                    self.last_sent = time.monotonic()
+
     def get_led_count(self):
 
+        if self.led_count is not None:
+            return self.led_count
+
         # Send the HTTP GET request to WLED info API
-        response = requests.get(self.info_endpoint)
+        response = self.session.get(self.info_endpoint)
 
         # Get the LED Count straight from the WLED Device :D
         if response.status_code != 200:
@@ -39,37 +127,89 @@ class Backend:
             )
 
         info_data = response.json()
-        return info_data["leds"]["count"]
+        self.led_count = info_data["leds"]["count"]
+        return self.led_count
 
-    def reset_wled(self):
-
-        # Set all the LED's to black on launch
-        payload = {
-            "seg": [
-                {"start": 0, "stop": self.get_led_count(), "sel": True},
-                {"stop": 0},
-            ]
-        }
+    def post_state(self, payload: dict):
 
         # Send the HTTP POST request to WLED API
-        response = requests.post(self.state_endpoint, json=payload)
+        response = self.session.post(self.state_endpoint, json=payload)
 
         # Check if the request was successful (HTTP status code 200)
         if response.status_code != 200:
             raise ConnectionError(
-                f"Failed to retrieve LED count. Status code: {response.status_code}"
+                f"WLED Backend failed to set LED state. Status code: {response.status_code}"
             )
-        [self.set_led(i, False) for i in range(self.get_led_count())]
+
+    def send_dnrgb(self, start: int, stop: int):
+        for packet_start in range(start, stop, self.DNRGB_MAX_LEDS):
+            packet_stop = min(packet_start + self.DNRGB_MAX_LEDS, stop)
+            packet = bytearray([self.DNRGB, self.REALTIME_TIMEOUT])
+            packet.extend(packet_start.to_bytes(2, byteorder="big"))
+            packet.extend(self.leds[packet_start:packet_stop].tobytes())
+            self.sock.sendto(packet, self.udp_address)
+        self.last_sent = time.monotonic()
+
+    def update_udp(self, start: int, colors: np.ndarray):
+        # only the leds that actually changed are sent
+        with self.lock:
+            current = self.leds[start : start + len(colors)]
+            changed = np.flatnonzero((current != colors).any(axis=1)) + start
+            current[:] = colors
+
+            for run_start, run_stop in get_changed_runs(changed, self.UDP_MAX_GAP):
+                self.send_dnrgb(run_start, run_stop)
+
+    def reset_wled(self):
+
+        led_count = self.get_led_count()
+
+        if self.udp:
+            with self.lock:
+                self.leds[:] = 0
+                self.send_dnrgb(0, led_count)
+            return
+
+        # Set all the LED's to black on launch, covering the strip with one segment in the same request
+        self.post_state(
+            {
+                "seg": [
+                    {
+                        "start": 0,
+                        "stop": led_count,
+                        "sel": True,
+                        "i": [0, led_count, "000000"],
+                    },
+                    {"stop": 0},
+                ]
+            }
+        )
 
     def set_led(self, led_index: int, on: bool):
 
-        payload = {"seg": {"i": [led_index, "FFFFFF" if on else "000000"]}}
+        if self.udp:
+            self.update_udp(
+                led_index, np.full((1, 3), 255 if on else 0, dtype=np.uint8)
+            )
+            return
 
-        # Send the HTTP POST request to WLED API
-        response = requests.post(self.state_endpoint, json=payload)
+        self.post_state({"seg": {"i": [led_index, "FFFFFF" if on else "000000"]}})
 
-        # Check if the request was successful (HTTP status code 200)
-        if response.status_code != 200:
-            raise ConnectionError(
-                f"WLED Backend failed to set LED state. Status code: {response.status_code}"
+    def set_leds(self, buffer: list[list[int]]):
+
+        if self.udp:
+            colors = np.array(buffer[: self.get_led_count()], dtype=np.uint8)
+            self.update_udp(0, colors.reshape(-1, 3))
+            return
+
+        ranges = get_color_ranges(buffer[: self.get_led_count()])
+
+        entries_per_request = self.MAX_RANGES_PER_REQUEST * 3
+        for request_start in range(0, len(ranges), entries_per_request):
+            self.post_state(
+                {
+                    "seg": {
+                        "i": ranges[request_start : request_start + entries_per_request]
+                    }
+                }
             )
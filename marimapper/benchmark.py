@@ -0,0 +1,141 @@
+# sfm_process has to be imported before anything else pulls in pycolmap, see scanner.py
+from marimapper.sfm_process import add_normals
+
+import os
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from marimapper.camera import Camera
+from marimapper.database_populator import populate_database
+from marimapper.detector import find_led
+from marimapper.file_tools import get_all_2d_led_maps
+from marimapper.led import LED2D, get_view_ids
+from marimapper.led_map import LEDMap3D
+from marimapper.sfm import sfm
+from multiprocessing import get_logger
+
+logger = get_logger()
+
+PERCENTILES = [50, 90, 99]
+
+
+def get_stage_stats(latencies: list[float], led_count: int) -> dict:
+    # led_count is how many leds a single run of the stage handles
+    latencies_ms = np.array(latencies) * 1000
+    stats = {
+        "runs": len(latencies),
+        "leds": led_count,
+        "mean_ms": float(np.mean(latencies_ms)),
+    }
+    for percentile in PERCENTILES:
+        stats[f"p{percentile}_ms"] = float(np.percentile(latencies_ms, percentile))
+
+    total_time = float(np.sum(latencies))
+    stats["leds_per_second"] = (
+        led_count * len(latencies) / total_time if total_time > 0 else 0.0
+    )
+    return stats
+
+
+def get_sequence_dirs(sequence_root: Path) -> list[Path]:
+    # a recorded capture is a set of cam_N folders holding capture_0000.png, capture_0001.png...
+    return [
+        Path(sequence_root, name)
+        for name in sorted(os.listdir(sequence_root))
+        if Path(sequence_root, name, "capture_0000.png").exists()
+    ]
+
+
+def benchmark_detection(
+    sequence_root: Path, threshold: int = 128
+) -> tuple[list[LED2D], dict]:
+
+    leds_2d = []
+    latencies = []
+
+    for view_id, sequence_dir in enumerate(get_sequence_dirs(sequence_root)):
+        frame_count = len(
+            [name for name in os.listdir(sequence_dir) if name.endswith(".png")]
+        )
+        cam = Camera(str(Path(sequence_dir, "capture_%04d.png")))
+
+        for led_id in range(frame_count):
+            start = time.perf_counter()
+            point = find_led(cam, threshold, display=False)
+            latencies.append(time.perf_counter() - start)
+
+            if point is not None:
+                leds_2d.append(LED2D(led_id, view_id, point))
+
+    return leds_2d, get_stage_stats(latencies, 1)
+
+
+def benchmark_reconstruction(
+    leds_2d: list[LED2D],
+    repeats: int = 3,
+    interpolation_max_fill: int = 5,
+    interpolation_max_error: float = 0.2,
+) -> dict:
+
+    view_count = len(get_view_ids(leds_2d))
+    latencies = {"populate_database": [], "sfm": [], "post_process": []}
+    leds_3d = []
+
+    for _ in range(repeats):
+        with TemporaryDirectory() as temp_dir:
+            start = time.perf_counter()
+            populate_database(Path(temp_dir, "database.db"), leds_2d)
+            latencies["populate_database"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        leds_3d = sfm(leds_2d)
+        latencies["sfm"].append(time.perf_counter() - start)
+
+        # the same post process the sfm process runs on every reconstruction
+        start = time.perf_counter()
+        led_map = LEDMap3D.from_leds(leds_3d)
+        if len(led_map) > 0:
+            led_map.rescale()
+            led_map.fill_gaps(
+                min_distance=1 - interpolation_max_error,
+                max_distance=1 + interpolation_max_error,
+                max_missing=interpolation_max_fill,
+            )
+            led_map.recenter()
+            add_normals(led_map)
+        latencies["post_process"].append(time.perf_counter() - start)
+
+    results = {
+        "views": view_count,
+        "detections": len(leds_2d),
+        "reconstructed": len(leds_3d),
+        "populate_database": get_stage_stats(
+            latencies["populate_database"], len(leds_2d)
+        ),
+        "sfm": get_stage_stats(latencies["sfm"], len(leds_2d)),
+        "post_process": get_stage_stats(latencies["post_process"], len(leds_3d)),
+    }
+    return results
+
+
+def run_benchmark(
+    sequence_roots: list[Path], map_dirs: list[Path], repeats: int = 3
+) -> dict:
+    results = {}
+
+    for sequence_root in sequence_roots:
+        name = sequence_root.name
+        logger.info(f"benchmarking detection on {name}")
+        leds_2d, detection_stats = benchmark_detection(sequence_root)
+        results[name] = benchmark_reconstruction(leds_2d, repeats)
+        results[name]["detection"] = detection_stats
+
+    for map_dir in map_dirs:
+        name = map_dir.name
+        logger.info(f"benchmarking reconstruction on {name}")
+        results[name] = benchmark_reconstruction(get_all_2d_led_maps(map_dir), repeats)
+
+    return results
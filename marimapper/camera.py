@@ -1,8 +1,55 @@
 import cv2
+import time
+import threading
+from collections import deque
+from typing import Optional
+import numpy as np
 from multiprocessing import get_logger
 
 logger = get_logger()
 
+# how many frames a device holds on to if we can't set CAP_PROP_BUFFERSIZE, most drivers default to 4
+DEFAULT_DEVICE_BUFFER_SIZE = 4
+
+# after a settings change, the camera has settled once this many frames in a row have the same brightness
+SETTLE_STABLE_FRAMES = 3
+# the same being within this many grey levels, or this fraction of the brightness, whichever is larger
+SETTLE_TOLERANCE = 1.0
+SETTLE_RELATIVE_TOLERANCE = 0.02
+# if the brightness never moves, the change either had no effect or hasn't come through yet, so give it longer
+SETTLE_UNCHANGED_FRAMES = 8
+SETTLE_MAX_FRAMES = 30
+# only every nth pixel in each direction is needed to see the exposure change
+SETTLE_SUBSAMPLE = 8
+
+
+def get_brightness(image: np.ndarray) -> float:
+    return float(image[::SETTLE_SUBSAMPLE, ::SETTLE_SUBSAMPLE].mean())
+
+
+def is_brightness_settled(
+    brightness: list[float], reference: Optional[float] = None
+) -> bool:
+    # brightness is of every frame since the settings change and reference from just before it
+
+    def is_similar(a: float, b: float) -> bool:
+        return abs(a - b) <= max(
+            SETTLE_TOLERANCE, SETTLE_RELATIVE_TOLERANCE * max(a, b)
+        )
+
+    if len(brightness) < SETTLE_STABLE_FRAMES:
+        return False
+
+    recent = brightness[-SETTLE_STABLE_FRAMES:]
+    if not all(is_similar(value, recent[0]) for value in recent):
+        return False
+
+    if reference is None:
+        return True
+
+    changed = any(not is_similar(value, reference) for value in brightness)
+    return changed or len(brightness) >= SETTLE_UNCHANGED_FRAMES
+
 
 class CameraSettings:
 
@@ -20,6 +67,84 @@ class CameraSettings:
         camera.set_exposure(self.exposure)
 
 
+class Frame:
+
+    def __init__(self, image: np.ndarray, timestamp: float, frame_id: int):
+        self.image = image
+        # time.monotonic() from when the capture of this frame started
+        self.timestamp = timestamp
+        self.frame_id = frame_id
+
+
+class CaptureThread(threading.Thread):
+    """Continuously reads frames from a camera into a small ring buffer of timestamped frames."""
+
+    def __init__(self, camera, buffer_size: int = 4):
+        super().__init__(daemon=True)
+        self._camera = camera
+        self._frames: deque[Frame] = deque(maxlen=buffer_size)
+        self._frame_available = threading.Condition()
+        self._last_returned_frame_id = -1
+        self._running = True
+        self._failed = False
+
+    def run(self):
+        frame_id = 0
+        while self._running:
+            timestamp = time.monotonic()
+            ret_val, image = self._camera.read_device()
+
+            with self._frame_available:
+                if not ret_val:
+                    self._failed = True
+                    self._frame_available.notify_all()
+                    return
+
+                self._frames.append(Frame(image, timestamp, frame_id))
+                self._frame_available.notify_all()
+
+            frame_id += 1
+
+    def stop(self):
+        self._running = False
+
+    def get_frame(self, after: float = -1, newest: bool = False, timeout=5.0) -> Frame:
+        """Returns a frame that has not been returned before and was captured at or after the given time.
+
+        If newest is set, the latest matching frame is returned, otherwise the first.
+        """
+
+        def find_frame() -> Optional[Frame]:
+            frames = [
+                frame
+                for frame in self._frames
+                if frame.timestamp >= after
+                and frame.frame_id > self._last_returned_frame_id
+            ]
+            if len(frames) == 0:
+                return None
+            return frames[-1] if newest else frames[0]
+
+        with self._frame_available:
+            deadline = time.monotonic() + timeout
+            frame = find_frame()
+            while frame is None:
+                if self._failed:
+                    raise Exception("Failed to read image")
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(
+                        f"Timed out waiting for image after {timeout} seconds"
+                    )
+
+                self._frame_available.wait(remaining)
+                frame = find_frame()
+
+            self._last_returned_frame_id = frame.frame_id
+            return frame
+
+
 class Camera:
 
     def __init__(self, device_id):
@@ -37,67 +162,149 @@ class Camera:
         if not self.device.isOpened():
             raise RuntimeError(f"Failed to connect to camera {device_id}")
 
+        # VideoCapture isn't thread safe, so all device access goes through this lock
+        self._device_lock = threading.Lock()
+        self._capture_thread: Optional[CaptureThread] = None
+
+        # the fewer frames the driver holds on to, the fewer stale ones there are to flush after a settings change
+        if self._set_property(cv2.CAP_PROP_BUFFERSIZE, 1):
+            self._device_buffer_size = 1
+        else:
+            logger.debug(f"Device {device_id} doesn't support setting its buffer size")
+            self._device_buffer_size = DEFAULT_DEVICE_BUFFER_SIZE
+
         self.default_settings = CameraSettings(self)
 
     def reset(self):
         self.default_settings.apply(self)
 
+    def _get_property(self, prop_id: int) -> float:
+        with self._device_lock:
+            return self.device.get(prop_id)
+
+    def _set_property(self, prop_id: int, value) -> bool:
+        with self._device_lock:
+            return self.device.set(prop_id, value)
+
     def get_af_mode(self):
-        return int(self.device.get(cv2.CAP_PROP_AUTOFOCUS))
+        return int(self._get_property(cv2.CAP_PROP_AUTOFOCUS))
 
     def get_focus(self):
-        return int(self.device.get(cv2.CAP_PROP_FOCUS))
+        return int(self._get_property(cv2.CAP_PROP_FOCUS))
 
     def get_exposure_mode(self):
-        return int(self.device.get(cv2.CAP_PROP_AUTO_EXPOSURE))
+        return int(self._get_property(cv2.CAP_PROP_AUTO_EXPOSURE))
 
     def get_exposure(self):
-        return int(self.device.get(cv2.CAP_PROP_EXPOSURE))
+        return int(self._get_property(cv2.CAP_PROP_EXPOSURE))
 
     def get_gain(self):
-        return int(self.device.get(cv2.CAP_PROP_GAIN))
+        return int(self._get_property(cv2.CAP_PROP_GAIN))
 
     def set_autofocus(self, mode, focus=0):
 
         logger.debug(f"Setting autofocus to mode {mode} with focus {focus}")
 
-        if not self.device.set(cv2.CAP_PROP_AUTOFOCUS, mode):
+        if not self._set_property(cv2.CAP_PROP_AUTOFOCUS, mode):
             logger.info(f"Failed to set autofocus to {mode}")
 
-        if not self.device.set(cv2.CAP_PROP_FOCUS, focus):
+        if not self._set_property(cv2.CAP_PROP_FOCUS, focus):
             logger.info(f"Failed to set focus to {focus}")
 
     def set_exposure_mode(self, mode):
 
         logger.debug(f"Setting exposure to mode {mode}")
 
-        if not self.device.set(cv2.CAP_PROP_AUTO_EXPOSURE, mode):
+        if not self._set_property(cv2.CAP_PROP_AUTO_EXPOSURE, mode):
             logger.info(f"Failed to put camera into manual exposure mode {mode}")
 
     def set_gain(self, gain):
 
         logger.debug(f"Setting gain to {gain}")
 
-        if not self.device.set(cv2.CAP_PROP_GAIN, gain):
+        if not self._set_property(cv2.CAP_PROP_GAIN, gain):
             logger.info(f"failed to set camera gain to {gain}")
 
     def set_exposure(self, exposure: int) -> bool:
 
         logger.debug(f"Setting exposure to {exposure}")
 
-        if not self.device.set(cv2.CAP_PROP_EXPOSURE, exposure):
+        if not self._set_property(cv2.CAP_PROP_EXPOSURE, exposure):
             logger.info(f"Failed to set exposure to {exposure}")
             return False
 
         return True
 
+    def start_capture(self, buffer_size: int = 4):
+        """Starts reading frames in the background so reads return as soon as a new frame exists."""
+        if self._capture_thread is not None:
+            return
+
+        self._capture_thread = CaptureThread(self, buffer_size)
+        self._capture_thread.start()
+
+    def stop_capture(self):
+        if self._capture_thread is None:
+            return
+
+        self._capture_thread.stop()
+        self._capture_thread.join(timeout=1)
+        self._capture_thread = None
+
     def eat(self, count=30):
-        for _ in range(count):
-            self.read()
+        # frames are only grabbed, not decoded, as they're being thrown away
+        with self._device_lock:
+            for _ in range(count):
+                if not self.device.grab():
+                    break
+
+    def flush(self):
+        """Drops any frames the device captured before now."""
+        if self._capture_thread is not None:
+            return  # read_after already skips frames captured before it was called
+
+        self.eat(self._device_buffer_size)
+
+    def wait_for_settle(
+        self, reference: Optional[float] = None, max_frames: int = SETTLE_MAX_FRAMES
+    ) -> int:
+        """Reads frames until their brightness stops changing after a settings change, returns how many it took.
+
+        Changes to exposure and gain take a camera dependent number of frames to come through, so rather than
+        always waiting for the worst case this waits for the brightness to level off. If a reference brightness
+        from before the change is given, it also waits a little longer for a change that hasn't shown up yet.
+        """
+        self.flush()
+
+        start = time.monotonic()
+        brightness = []
+        for frame_count in range(1, max_frames + 1):
+            brightness.append(get_brightness(self.read_after(start)))
+            if is_brightness_settled(brightness, reference):
+                logger.debug(f"Camera settled after {frame_count} frames")
+                return frame_count
+
+        logger.debug(f"Camera still hadn't settled after {max_frames} frames")
+        return max_frames
+
+    def read_device(self) -> tuple[bool, np.ndarray]:
+        with self._device_lock:
+            return self.device.read()
 
     def read(self):
-        ret_val, image = self.device.read()
+        if self._capture_thread is not None:
+            return self._capture_thread.get_frame(newest=True).image
+
+        ret_val, image = self.read_device()
         if not ret_val:
             raise Exception("Failed to read image")
 
         return image
+
+    def read_after(self, timestamp: float):
+        """Returns the first new frame whose capture started at or after timestamp (from time.monotonic)."""
+        if self._capture_thread is not None:
+            return self._capture_thread.get_frame(after=timestamp).image
+
+        # Without a capture thread, the best we can do is a fresh blocking read
+        return self.read()
@@ -1,12 +1,16 @@
-from itertools import combinations
 from math import radians, tan
 from pathlib import Path
 from multiprocessing import get_logger
-from typing import Union
+from typing import Optional, Union
 import numpy as np
 
-from marimapper.pycolmap_tools.database import COLMAPDatabase
-from marimapper.led import LED2D, get_view_ids, get_leds_with_view
+from marimapper.pycolmap_tools.database import (
+    COLMAPDatabase,
+    array_to_blob,
+    image_ids_to_pair_id,
+)
+from marimapper.led import LED2D
+from marimapper.led_map import LEDMap2D
 
 ARBITRARY_SCALE = 2000
 logger = get_logger()
@@ -55,29 +59,54 @@ camera_model_type = Union[
 ]
 
 
+def get_visibility(leds: list[LED2D], keypoint_count: int = 1):
+    # returns the views, each view's keypoints and a view x led bitmap of which leds each view can see
+    led_map = LEDMap2D.from_leds(leds)
+    views = np.unique(led_map.view_ids)
+
+    keypoint_count = max(keypoint_count, int(led_map.led_ids.max()) + 1)
+    map_features = np.zeros((int(views.max()) + 1, keypoint_count, 2))
+    visibility = np.zeros((int(views.max()) + 1, keypoint_count), dtype=bool)
+
+    # we flip this here so that the resulting 3D model is oriented with y+ up
+    map_features[led_map.view_ids, led_map.led_ids] = (
+        1 - led_map.positions
+    ) * ARBITRARY_SCALE
+    visibility[led_map.view_ids, led_map.led_ids] = True
+
+    return views, map_features, visibility
+
+
+def get_view_pairs(
+    views: np.ndarray, visibility: np.ndarray, max_pairs_per_view: Optional[int] = None
+) -> list[tuple[int, int]]:
+
+    # how many leds every pair of views has in common
+    overlap = visibility[views].astype(np.int32) @ visibility[views].T.astype(np.int32)
+    np.fill_diagonal(overlap, 0)
+
+    paired = overlap > 0
+    if max_pairs_per_view is not None and max_pairs_per_view < len(views) - 1:
+        # keep a pair if it's in the top k of either view so no view loses all of its partners
+        top_k = np.argsort(-overlap, axis=1, kind="stable")[:, :max_pairs_per_view]
+        in_top_k = np.zeros_like(paired)
+        np.put_along_axis(in_top_k, top_k, True, axis=1)
+        paired &= in_top_k | in_top_k.T
+
+    view_1_indices, view_2_indices = np.nonzero(np.triu(paired, k=1))
+    return list(zip(views[view_1_indices].tolist(), views[view_2_indices].tolist()))
+
+
 def populate_database(
     db_path: Path,
     leds: list[LED2D],
     camera_model_func: camera_model_type = camera_model_radial,
     fov_in_degrees: int = 60,
+    keypoint_count: int = 1,
+    max_pairs_per_view: Optional[int] = None,
 ):
     logger.debug(f"Populating sfm database with {len(leds)} leds, path: {db_path}")
-    views = get_view_ids(leds)
-    map_features = np.zeros((max(views) + 1, 1, 2))
-
-    for view in views:
-
-        for led in get_leds_with_view(leds, view):
-
-            pad_needed = led.led_id - map_features.shape[1] + 1
-            if pad_needed > 0:
-                map_features = np.pad(map_features, [(0, 0), (0, pad_needed), (0, 0)])
-
-            # we flip this here so that the resulting 3D model is oriented with y+ up
-            map_features[view][led.led_id] = (
-                np.array((1 - led.point.position[0], 1 - led.point.position[1]))
-                * ARBITRARY_SCALE
-            )
+    views, map_features, visibility = get_visibility(leds, keypoint_count)
 
     db = COLMAPDatabase.connect(db_path)
 
@@ -101,27 +130,47 @@ def populate_database(
 
     # Create dummy images_all_the_same.
 
-    image_ids = [db.add_image(str(view), camera_id) for view in range(max(views) + 1)]
+    image_ids = [
+        db.add_image(str(view), camera_id) for view in range(len(map_features))
+    ]
 
     # Create some keypoints
-    for i, keypoints in enumerate(map_features):
-        db.add_keypoints(image_ids[i], keypoints)
+    keypoints = map_features.astype(np.float32)
+    db.executemany(
+        "INSERT INTO keypoints VALUES (?, ?, ?, ?)",
+        (
+            (image_id,) + view_keypoints.shape + (array_to_blob(view_keypoints),)
+            for image_id, view_keypoints in zip(image_ids, keypoints)
+        ),
+    )
 
-    for view_1_id, view_2_id in combinations(views, 2):
-        view_1_keypoints = map_features[view_1_id]
-        view_2_keypoints = map_features[view_2_id]
+    # Every pair shares the same dummy geometry, only the matches differ
+    geometry_blobs = tuple(
+        array_to_blob(np.asarray(array, dtype=np.float64))
+        for array in (
+            np.eye(3),
+            np.eye(3),
+            np.eye(3),
+            [1.0, 0.0, 0.0, 0.0],
+            np.zeros(3),
+        )
+    )
 
-        shared_led_ids = []
+    geometries = []
+    for view_1_id, view_2_id in get_view_pairs(views, visibility, max_pairs_per_view):
+        shared_led_ids = np.flatnonzero(visibility[view_1_id] & visibility[view_2_id])
+        matches = np.repeat(shared_led_ids, 2).reshape(-1, 2).astype(np.uint32)
 
-        for i in range(len(view_1_keypoints)):
-            in_both = view_1_keypoints[i].any() and view_2_keypoints[i].any()
-            if in_both:
-                shared_led_ids.append([i, i])
+        # image ids ascend with view ids, so the matches never need flipping
+        pair_id = image_ids_to_pair_id(image_ids[view_1_id], image_ids[view_2_id])
+        geometries.append(
+            (pair_id,) + matches.shape + (array_to_blob(matches), 2) + geometry_blobs
+        )
 
-        if shared_led_ids:
-            db.add_two_view_geometry(
-                image_ids[view_1_id], image_ids[view_2_id], np.array(shared_led_ids)
-            )
+    db.executemany(
+        "INSERT INTO two_view_geometries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        geometries,
+    )
 
     db.commit()
     db.close()
@@ -6,7 +6,7 @@ from typing import Optional
 import numpy as np
 from multiprocessing import get_logger
 
-from marimapper.camera import Camera
+from marimapper.camera import Camera, get_brightness
 from marimapper.timeout_controller import TimeoutController
 from marimapper.led import Point2D, LED2D
 
@@ -14,29 +14,88 @@ from marimapper.led import Point2D, LED2D
 logger = get_logger()
 
 
-def contour_brightness(image: np.ndarray, contour: np.ndarray) -> int:
-    """Calculate the sum of all pixels within a contour."""
-    mask = np.zeros(image.shape, dtype=np.uint8)
-    cv2.drawContours(mask, [contour], -1, 255, -1)
-    masked_image = cv2.bitwise_and(image, image, mask=mask)
-    return cv2.sumElems(masked_image)
+def get_brightest_blob(image_thresh: np.ndarray) -> tuple[np.ndarray, int]:
+    """Label all blobs in a single pass and return the label image and the brightest label."""
+    label_count, labels = cv2.connectedComponents(
+        image_thresh, connectivity=8, ltype=cv2.CV_32S
+    )
+
+    # sum the intensity of every blob at once, label 0 is the background
+    brightness = np.bincount(
+        labels.ravel(), weights=image_thresh.ravel(), minlength=label_count
+    )
+    brightness[0] = -1
+
+    return labels, int(np.argmax(brightness))
 
 
-def find_led_in_image(image: np.ndarray, threshold: int = 128) -> Optional[Point2D]:
+def get_roi_bounds(
+    roi: tuple[float, float, float, float], img_width: int, img_height: int
+) -> tuple[int, int, int, int]:
+    # roi is u_min, v_min, u_max, v_max in the same normalised coordinates as Point2D
+    u_min, v_min, u_max, v_max = roi
+    v_offset = (img_width - img_height) / 2.0
+
+    x_min, x_max = np.clip(
+        [int(u_min * img_width), int(np.ceil(u_max * img_width))], 0, img_width
+    )
+    y_min, y_max = np.clip(
+        [int(v_min * img_width - v_offset), int(np.ceil(v_max * img_width - v_offset))],
+        0,
+        img_height,
+    )
+    return int(x_min), int(y_min), int(x_max), int(y_max)
+
+
+def find_led_in_image(
+    image: np.ndarray,
+    threshold: int = 128,
+    outline: bool = False,
+    roi: Optional[tuple[float, float, float, float]] = None,
+) -> Optional[Point2D]:
 
     if len(image.shape) > 2:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
+    img_height, img_width = image.shape
+
+    # only search the region we expect the led to be in, the result is still relative to the whole frame
+    x_offset, y_offset = 0, 0
+    if roi is not None:
+        x_offset, y_offset, x_max, y_max = get_roi_bounds(roi, img_width, img_height)
+        image = image[y_offset:y_max, x_offset:x_max]
+        if image.size == 0:
+            return None
+
+    # If nothing is brighter than the threshold, there's no point looking for contours
+    _, max_value, _, _ = cv2.minMaxLoc(image)
+    if max_value <= threshold:
+        return None
+
     _, image_thresh = cv2.threshold(image, threshold, 255, cv2.THRESH_TOZERO)
 
-    contours, _ = cv2.findContours(image_thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    contours, hierarchy = cv2.findContours(
+        image_thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
+    )
 
     if len(contours) == 0:
         return None
 
-    brightest_contour = sorted(
-        contours, key=lambda c: contour_brightness(image, c), reverse=True
-    )[0]
+    labels, brightest_label = get_brightest_blob(image_thresh)
+
+    # Every contour point lies on its blob, so the first point tells us which blob an outer contour belongs to
+    brightest_contour = next(
+        (
+            contour
+            for contour, contour_hierarchy in zip(contours, hierarchy[0])
+            if contour_hierarchy[3] == -1
+            and labels[contour[0, 0, 1], contour[0, 0, 0]] == brightest_label
+        ),
+        None,
+    )
+
+    if brightest_contour is None:
+        return None
 
     moments = cv2.moments(brightest_contour)
 
@@ -48,13 +107,23 @@ def find_led_in_image(image: np.ndarray, threshold: int = 128) -> Optional[Point
     if center_u == 0 or center_v == 0:
         return None
 
-    img_height, img_width = image.shape
+    # only look for the peak within the blob's bounding box rather than the whole frame
+    x, y, width, height = cv2.boundingRect(brightest_contour)
+    blob_mask = labels[y : y + height, x : x + width] == brightest_label
+    peak = int(image_thresh[y : y + height, x : x + width][blob_mask].max())
 
-    center_u = center_u / img_width
+    center_u = (center_u + x_offset) / img_width
     v_offset = (img_width - img_height) / 2.0
-    center_v = (center_v + v_offset) / img_width
+    center_v = (center_v + y_offset + v_offset) / img_width
 
-    return Point2D(center_u, center_v, contours)  # todo, normalise contours
+    blob_outline = None
+    if outline:
+        blob_outline = brightest_contour.reshape(-1, 2) + np.array(
+            [x_offset, y_offset + v_offset]
+        )
+        blob_outline = (blob_outline / img_width).astype(np.float32)
+
+    return Point2D(center_u, center_v, moments["m00"], peak, blob_outline)
 
 
 def draw_led_detections(image: cv2.Mat, led_detection: Optional[Point2D]) -> np.ndarray:
@@ -68,13 +137,15 @@ def draw_led_detections(image: cv2.Mat, led_detection: Optional[Point2D]) -> np.
     img_height = render_image.shape[0]
     img_width = render_image.shape[1]
 
-    cv2.drawContours(
-        render_image, led_detection.contours, -1, (255, 0, 0), 1
-    )  # TODO, de-normalise contours once normalised
+    v_offset = (img_width - img_height) / 2.0
 
-    u_abs = int(led_detection.u() * img_width)
+    if led_detection.outline is not None:
+        outline_abs = led_detection.outline * img_width - np.array([0, v_offset])
+        cv2.drawContours(
+            render_image, [outline_abs.astype(np.int32)], -1, (255, 0, 0), 1
+        )
 
-    v_offset = (img_width - img_height) / 2.0
+    u_abs = int(led_detection.u() * img_width)
 
     v_abs = int(led_detection.v() * img_width - v_offset)
 
@@ -99,12 +170,14 @@ def show_image(image: np.ndarray) -> None:
 def set_cam_default(cam: Camera) -> None:
 
     logger.info("resetting cam to default")
+    reference = get_brightness(cam.read())
     cam.reset()
-    cam.eat()
+    cam.wait_for_settle(reference)
 
 
 def set_cam_dark(cam: Camera, exposure: int) -> bool:
     logger.info("setting cam to dark mode")
+    reference = get_brightness(cam.read())
     cam.set_autofocus(0, 0)
     cam.set_exposure_mode(0)
     cam.set_gain(0)
@@ -115,22 +188,30 @@ def set_cam_dark(cam: Camera, exposure: int) -> bool:
         )
 
     exposure_success = cam.set_exposure(exposure)
-    cam.eat()
+    cam.wait_for_settle(reference)
 
     return exposure_success
 
 
 def find_led(
-    cam: Camera, threshold: int = 128, display: bool = True
+    cam: Camera,
+    threshold: int = 128,
+    display: bool = True,
+    captured_after: Optional[float] = None,
+    roi: Optional[tuple[float, float, float, float]] = None,
 ) -> Optional[Point2D]:
 
-    image = cam.read()
-    results = find_led_in_image(image, threshold)
+    image = cam.read() if captured_after is None else cam.read_after(captured_after)
+    results = find_led_in_image(image, threshold, outline=display, roi=roi)
 
     if display:
         rendered_image = draw_led_detections(image, results)
         show_image(rendered_image)
 
+        # the outline is only for drawing, don't ship it around with the detection
+        if results is not None:
+            results.outline = None
+
     return results
 
 
@@ -142,10 +223,15 @@ def enable_and_find_led(
     timeout_controller: TimeoutController,
     threshold: int,
     display: bool = False,
+    roi: Optional[tuple[float, float, float, float]] = None,
+    timeout: Optional[float] = None,
 ) -> Optional[LED2D]:
 
     darkness_timeout_seconds = 3.0
 
+    if timeout is None:
+        timeout = timeout_controller.timeout
+
     # First wait for no leds to be visible, this should always be false
     start = time.time()
     while find_led(cam, threshold, display) is not None:
@@ -160,14 +246,23 @@ def enable_and_find_led(
 
     led_backend.set_led(led_id, True)
 
+    # Any frame captured before the backend returned can't contain the led, so skip them
+    led_on_time = time.monotonic()
+
+    # A bad pose estimate can put the roi in the wrong place, so it's only searched for the first half
+    # of the timeout before falling back to the whole frame
+    roi_end_time = response_time_start + timeout / 2
+
     # Wait until either we have a result or we run out of time
     point = None
-    while (
-        point is None and time.time() < response_time_start + timeout_controller.timeout
-    ):
-        point = find_led(cam, threshold, display)
+    while point is None and time.time() < response_time_start + timeout:
+        search_roi = roi if time.time() < roi_end_time else None
+        point = find_led(
+            cam, threshold, display, captured_after=led_on_time, roi=search_roi
+        )
 
     led_backend.set_led(led_id, False)
+    led_off_time = time.monotonic()
 
     if point is None:
         return None
@@ -175,12 +270,173 @@ def enable_and_find_led(
     timeout_controller.add_response_time(time.time() - response_time_start)
 
     start = time.time()
-    while find_led(cam, threshold, display) is not None:
+    while find_led(cam, threshold, display, captured_after=led_off_time) is not None:
         if time.time() - start > darkness_timeout_seconds:
             logging.warning(
                 f"Detector can't stop detecting led {led_id} as an led is already visible, retrying backend..."
             )
             led_backend.set_led(led_id, False)
+            led_off_time = time.monotonic()
             start = time.time()
 
     return LED2D(led_id, view_id, point)
+
+
+def set_leds_enabled(led_backend, led_ids: range, led_count: int, on: bool) -> None:
+    buffer = [[0, 0, 0] for _ in range(led_count)]
+    if on:
+        for led_id in led_ids:
+            buffer[led_id] = [255, 255, 255]
+    led_backend.set_leds(buffer)
+
+
+def enable_and_find_leds(
+    cam: Camera,
+    led_backend,
+    led_ids: range,
+    led_count: int,
+    timeout_controller: TimeoutController,
+    threshold: int,
+    display: bool = False,
+) -> bool:
+    # Lights a whole block of leds at once and returns whether any of them are visible.
+    # The position isn't returned as it's a blend of every visible led in the block
+
+    darkness_timeout_seconds = 3.0
+
+    response_time_start = time.time()
+
+    set_leds_enabled(led_backend, led_ids, led_count, True)
+
+    leds_on_time = time.monotonic()
+
+    point = None
+    while (
+        point is None and time.time() < response_time_start + timeout_controller.timeout
+    ):
+        point = find_led(cam, threshold, display, captured_after=leds_on_time)
+
+    set_leds_enabled(led_backend, led_ids, led_count, False)
+    leds_off_time = time.monotonic()
+
+    if point is None:
+        return False
+
+    timeout_controller.add_response_time(time.time() - response_time_start)
+
+    start = time.time()
+    while find_led(cam, threshold, display, captured_after=leds_off_time) is not None:
+        if time.time() - start > darkness_timeout_seconds:
+            logging.warning(
+                f"Detector can't stop detecting leds {led_ids.start} to {led_ids.stop}, retrying backend..."
+            )
+            set_leds_enabled(led_backend, led_ids, led_count, False)
+            leds_off_time = time.monotonic()
+            start = time.time()
+
+    return True
+
+
+# the colours used to light three leds at once, in the same order as the channels they're found in
+PRIMARIES = [[255, 0, 0], [0, 255, 0], [0, 0, 255]]
+
+
+def find_leds_in_channels(
+    image: np.ndarray, threshold: int = 128
+) -> list[Optional[Point2D]]:
+    # returns the led found in each of the red, green and blue channels of a BGR image
+
+    if len(image.shape) < 3:
+        return [None, None, None]
+
+    channels = cv2.split(image.astype(np.int16))
+    red, green, blue = channels[2], channels[1], channels[0]
+
+    points = []
+    for channel, others in (
+        (red, (green, blue)),
+        (green, (red, blue)),
+        (blue, (red, green)),
+    ):
+        # camera sensors pick up some of every colour in every channel, so only count how much brighter
+        # a pixel is in this channel than in any other, which also throws away white light entirely
+        excess = np.clip(channel - np.maximum(*others), 0, 255).astype(np.uint8)
+        points.append(find_led_in_image(excess, threshold))
+
+    return points
+
+
+def set_leds_colored(led_backend, led_ids: list[int], led_count: int) -> None:
+    buffer = [[0, 0, 0] for _ in range(led_count)]
+    for led_id, color in zip(led_ids, PRIMARIES):
+        buffer[led_id] = color
+    led_backend.set_leds(buffer)
+
+
+def enable_and_find_leds_colored(
+    cam: Camera,
+    led_backend,
+    led_ids: list[int],
+    led_count: int,
+    view_id: int,
+    timeout_controller: TimeoutController,
+    threshold: int,
+    display: bool = False,
+) -> list[Optional[LED2D]]:
+    # Lights up to three leds at once, one in each primary, and finds each of them in its own channel
+
+    darkness_timeout_seconds = 3.0
+
+    start = time.time()
+    while find_led(cam, threshold, display) is not None:
+        if time.time() - start > darkness_timeout_seconds:
+            logging.warning(
+                f"Detector can't start detecting leds {led_ids} as an led is already visible"
+            )
+            return [None for _ in led_ids]
+
+    response_time_start = time.time()
+
+    set_leds_colored(led_backend, led_ids, led_count)
+
+    leds_on_time = time.monotonic()
+
+    # each led keeps the first position it was found at, we wait until all of them are found or we run out of time
+    points = [None for _ in led_ids]
+    response_time = 0.0
+    while (
+        any(point is None for point in points)
+        and time.time() < response_time_start + timeout_controller.timeout
+    ):
+        image = cam.read_after(leds_on_time)
+        for index, point in enumerate(find_leds_in_channels(image, threshold)):
+            if index < len(points) and points[index] is None and point is not None:
+                points[index] = point
+                response_time = time.time() - response_time_start
+
+        if display:
+            show_image(image)
+
+    set_leds_colored(led_backend, [], led_count)
+    leds_off_time = time.monotonic()
+
+    if all(point is None for point in points):
+        return points
+
+    # hidden leds would make every response look as slow as the timeout, so only time the ones we found
+    timeout_controller.add_response_time(response_time)
+
+    start = time.time()
+    while find_led(cam, threshold, display, captured_after=leds_off_time) is not None:
+        if time.time() - start > darkness_timeout_seconds:
+            logging.warning(
+                f"Detector can't stop detecting leds {led_ids}, retrying backend..."
+            )
+            set_leds_colored(led_backend, [], led_count)
+            leds_off_time = time.monotonic()
+            start = time.time()
+
+    return [
+        LED2D(led_id, view_id, point) if point is not None else None
+        for led_id, point in zip(led_ids, points)
+    ]
@@ -1,42 +1,142 @@
 """
-I've left this file in here unused because, well, it kind of works but I can't in good consciousness
-offer it as an option as even I can't get much use out of it.
-It works in ideal scenarios but little else beside.
-If it works, then it would reduce the complexity from O(n) to O(logn) which is insane.
-Howeverrrr, it's not great, even in ideal environments.
-Keep it simple, keep it reliable.
+Structured light detection, finds every LED in a view in 2 * log2(n) frames rather than one LED at a time.
+
+Every LED is given a Gray code and for every bit we capture a frame with the LEDs whose bit is set,
+followed by the complementary frame with the rest. Whichever of the two frames is brighter says which bit
+each pixel saw, the threshold only picks out pixels that are lit in at least one frame of every pair,
+so the whole image stack is decoded to a per pixel LED id in one pass.
+It needs a backend with set_leds and a camera and scene that are completely still for the whole sequence.
 """
 
 from marimapper.camera import Camera
 from marimapper.detector import show_image
 from marimapper.led import LED2D, Point2D
 from marimapper.timeout_controller import TimeoutController
-from marimapper.queues import Queue2D, DetectionControlEnum
-import logging
+from marimapper.queues import Bus2D, DetectionControlEnum
 from multiprocessing import get_logger
 import time
 import cv2
+import numpy as np
 
-from marimapper.utils import backend_black
+logger = get_logger()
 
+# blobs smaller than this are more likely to be noise than leds
+MIN_BLOB_AREA = 2
 
-logger = get_logger()
 
+def get_gray_code_bit_count(led_count: int) -> int:
+    return max(1, (led_count - 1).bit_length())
+
+
+def get_gray_code_patterns(led_count: int) -> np.ndarray:
+    # bit count x led count, whether each led is lit in the positive frame of each bit, most significant bit first
+    codes = np.arange(led_count)
+    gray_codes = codes ^ (codes >> 1)
+
+    bit_count = get_gray_code_bit_count(led_count)
+    shifts = np.arange(bit_count - 1, -1, -1)
+    return ((gray_codes[None, :] >> shifts[:, None]) & 1).astype(bool)
+
+
+def decode_gray_code(
+    positives: np.ndarray, negatives: np.ndarray, threshold: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # positives and negatives are bit count x height x width greyscale frames
+    # returns the decoded code of every pixel, -1 where there isn't one,
+    # and how much each pixel changed between the frames of a pair on average
+
+    # the brighter frame of each pair decides the bit, so glow spilling into the other frame doesn't matter
+    bits = positives > negatives
+
+    # a pixel belongs to an led if it was lit in one of the frames of every pair and they differ
+    lit = np.maximum(positives, negatives) > threshold
+    valid = np.all(lit & (positives != negatives), axis=0)
+
+    # Gray to binary is a running xor from the most significant bit down
+    binary = np.bitwise_xor.accumulate(bits, axis=0)
+    shifts = np.arange(len(binary) - 1, -1, -1, dtype=np.int64)
+    codes = np.tensordot(1 << shifts, binary, axes=1)
+
+    contrast = np.abs(positives.astype(np.int16) - negatives.astype(np.int16)).mean(
+        axis=0
+    )
+
+    return np.where(valid, codes, -1), contrast
+
+
+def find_leds_in_codes(
+    codes: np.ndarray, contrast: np.ndarray, code_count: int
+) -> dict[int, Point2D]:
+    # every code gets the centroid of its strongest blob, normalised the same way as find_led_in_image
+
+    img_height, img_width = codes.shape
+
+    # a code can decode to more ids than there are leds when the count isn't a power of two
+    valid = (codes >= 0) & (codes < code_count)
+    _, labels = cv2.connectedComponents(
+        valid.astype(np.uint8), connectivity=8, ltype=cv2.CV_32S
+    )
+
+    pixels = np.flatnonzero(valid)
+    if len(pixels) == 0:
+        return {}
+
+    pixel_codes = codes.ravel()[pixels]
+    pixel_contrast = contrast.ravel()[pixels].astype(float)
+    pixel_v, pixel_u = np.divmod(pixels, img_width)
+
+    # neighbouring leds can touch, so blobs are split by code as well as by connectivity
+    blob_keys = labels.ravel()[pixels].astype(np.int64) * code_count + pixel_codes
+    blob_keys, blob_index = np.unique(blob_keys, return_inverse=True)
+    blob_codes = blob_keys % code_count
+
+    area = np.bincount(blob_index)
+    weight = np.bincount(blob_index, weights=pixel_contrast)
+    center_u = np.bincount(blob_index, weights=pixel_contrast * pixel_u) / weight
+    center_v = np.bincount(blob_index, weights=pixel_contrast * pixel_v) / weight
+    peak = np.zeros(len(blob_keys))
+    np.maximum.at(peak, blob_index, pixel_contrast)
+
+    # the strongest blob of each code wins, anything else is a reflection or a misread
+    order = np.lexsort((-weight, blob_codes))
+    _, first = np.unique(blob_codes[order], return_index=True)
+    strongest = order[first]
+    strongest = strongest[area[strongest] >= MIN_BLOB_AREA]
 
-def get_binary_length(led_id: int) -> int:
-    return len(bin(led_id)[2:])
+    v_offset = (img_width - img_height) / 2.0
 
+    return {
+        int(blob_codes[blob]): Point2D(
+            center_u[blob] / img_width,
+            (center_v[blob] + v_offset) / img_width,
+            float(area[blob]),
+            int(peak[blob]),
+        )
+        for blob in strongest
+    }
+
+
+def capture_pattern(
+    cam: Camera,
+    led_backend,
+    buffer: np.ndarray,
+    settle_time: float,
+    display: bool,
+) -> np.ndarray:
 
-def led_id_to_binary(led_id: int, binary_length: int) -> list[int]:
+    led_backend.set_leds(buffer.tolist())
 
-    binary_as_text = bin(led_id)[2:]
-    binary_as_bool = [int(v) for v in binary_as_text]
+    # give the leds as long to turn on as we'd wait for a single led
+    time.sleep(settle_time)
+    image = cam.read_after(time.monotonic())
 
-    binary_padded = [0 for _ in range(binary_length)]
+    if display:
+        show_image(image)
 
-    binary_padded[-len(binary_as_bool) :] = binary_as_bool
+    if len(image.shape) > 2:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-    return binary_padded
+    return image
 
 
 def detect_leds_fast(
@@ -48,85 +148,52 @@ def detect_leds_fast(
     timeout_controller: TimeoutController,
     threshold: int,
     display: bool,
-    output_queues: list[Queue2D],
-):
-    # threshold_float = threshold / 255.0
-    # this isn't very smart if the led_id_from is non zero, oh well
-    binary_length = get_binary_length(led_id_to)
-
-    images = []
-
-    # woah led0 is 0,0,0,0,0. nope
-    led_binaries = [
-        led_id_to_binary(led_id, binary_length) for led_id in range(led_id_to)
-    ]
-
-    for binary_index in range(binary_length):
-        buffer = [
-            [255, 255, 255] if led_binaries[led_id][binary_index] else [0, 0, 0]
-            for led_id in range(led_id_to)
-        ]
-        led_backend.set_leds(buffer)
-        # set backend
-        cam.eat(count=10)
-        image = cam.read()
-        if display:
-            show_image(image)
-
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) / 255.0
-        images.append(image)
-
-    backend_black(led_backend)
-
-    leds: list[LED2D] = []
+    output_bus: Bus2D,
+) -> list[LED2D]:
+
+    led_count = led_backend.get_led_count()
+    code_count = led_id_to - led_id_from
+    patterns = get_gray_code_patterns(code_count)
+
+    logger.debug(
+        f"detecting {code_count} leds with {2 * len(patterns)} gray code frames"
+    )
+
+    buffer = np.zeros((led_count, 3), dtype=np.uint8)
+
+    positives = []
+    negatives = []
+    for pattern in patterns:
+        buffer[led_id_from:led_id_to] = np.where(pattern, 255, 0)[:, None]
+        positives.append(
+            capture_pattern(
+                cam, led_backend, buffer, timeout_controller.timeout, display
+            )
+        )
 
-    img_height = images[0].shape[0]
-    img_width = images[0].shape[1]
-
-    for led_id in range(1, led_id_to):  # this needs fixing
-        mat = 1
-        for binary_index in range(binary_length):
-            if led_binaries[led_id][binary_index]:
-                mat = images[binary_index] * mat
-            else:
-                mat = (1.0 - images[binary_index]) * mat
-
-        _, mat_max, _, mat_max_loc = cv2.minMaxLoc(mat)
-        min_response = min(
-            [
-                float(image[mat_max_loc[1], mat_max_loc[0]])
-                for i, image in enumerate(images)
-                if led_binaries[led_id][i]
-            ]
+        buffer[led_id_from:led_id_to] = np.where(pattern, 0, 255)[:, None]
+        negatives.append(
+            capture_pattern(
+                cam, led_backend, buffer, timeout_controller.timeout, display
+            )
         )
 
-        if min_response > 0.95:
-            point = Point2D(mat_max_loc[0] / img_width, mat_max_loc[1] / img_height)
-            led = LED2D(led_id, view_id, point)
+    buffer[:] = 0
+    led_backend.set_leds(buffer.tolist())
+
+    codes, contrast = decode_gray_code(
+        np.array(positives), np.array(negatives), threshold
+    )
+    points = find_leds_in_codes(codes, contrast, code_count)
+
+    leds: list[LED2D] = []
+    for code in range(code_count):
+        led_id = led_id_from + code
+        if code in points:
+            led = LED2D(led_id, view_id, points[code])
             leds.append(led)
-            for queue in output_queues:
-                queue.put(DetectionControlEnum.DETECT, led)
+            output_bus.put(DetectionControlEnum.DETECT, led)
         else:
-            for queue in output_queues:
-                queue.put(DetectionControlEnum.SKIP, led_id)
+            output_bus.put(DetectionControlEnum.SKIP, led_id)
 
     return leds
-
-
-if __name__ == "__main__":
-
-    from marimapper.backends.fcmega import fcmega_backend
-
-    logger.setLevel(logging.DEBUG)
-
-    cam = Camera(0)
-
-    cam.set_exposure(-10)
-
-    backend = fcmega_backend.Backend()
-
-    timeout_controller = TimeoutController()
-
-    leds = detect_leds_fast(0, 400, cam, backend, 0, timeout_controller, 128, True, [])
-
-    time.sleep(1)
@@ -1,4 +1,4 @@
-from multiprocessing import get_logger, Process, Queue, Event
+from multiprocessing import get_logger, Process, Queue
 import time
 from marimapper.detector import (
     show_image,
@@ -7,15 +7,26 @@ from marimapper.detector import (
     TimeoutController,
     set_cam_dark,
     enable_and_find_led,
+    enable_and_find_leds,
+    enable_and_find_leds_colored,
     find_led,
 )
 from marimapper.led import get_distance, get_color, LEDInfo
+from marimapper.led_map import LEDMap3D
 from marimapper.queues import (
     RequestDetectionsQueue,
     Queue2D,
+    Bus2D,
+    Queue3D,
     DetectionControlEnum,
     Queue3DInfo,
+    WaitableEvent,
+    wait_for_queues,
 )
+from marimapper.import_report import report_imports
+from marimapper.view_prediction import ViewPredictor, UNLIKELY_TIMEOUT_FACTOR
+from marimapper.detector_fast import detect_leds_fast
+from typing import Optional
 from functools import partial
 
 logger = get_logger()
@@ -46,6 +57,54 @@ def render_led_info(led_info: dict[int, LEDInfo], led_backend):
         return False
 
 
+def find_visible_led_ids(
+    led_id_from: int,
+    led_id_to: int,
+    cam: Camera,
+    led_backend,
+    timeout_controller: TimeoutController,
+    threshold: int,
+    display: bool,
+    block_size: int,
+) -> list[int]:
+    # Lights blocks of leds together and only splits the blocks that can be seen,
+    # so leds hidden from this view cost one timeout per block rather than one each
+    led_count = led_backend.get_led_count()
+
+    blocks = [
+        range(block_start, min(block_start + block_size, led_id_to))
+        for block_start in range(led_id_from, led_id_to, block_size)
+    ]
+
+    visible_led_ids = []
+    while blocks:
+        block = blocks.pop()
+
+        # single leds are left to the full detection pass
+        if len(block) == 1:
+            visible_led_ids.append(block.start)
+            continue
+
+        if enable_and_find_leds(
+            cam,
+            led_backend,
+            block,
+            led_count,
+            timeout_controller,
+            threshold,
+            display,
+        ):
+            middle = len(block) // 2
+            blocks += [block[middle:], block[:middle]]
+
+    logger.debug(
+        f"visibility pass found {len(visible_led_ids)} candidate leds "
+        f"out of {led_id_to - led_id_from}"
+    )
+
+    return sorted(visible_led_ids)
+
+
 def detect_leds(
     led_id_from: int,
     led_id_to: int,
@@ -55,27 +114,121 @@ def detect_leds(
     timeout_controller: TimeoutController,
     threshold: int,
     display: bool,
-    output_queues: list[Queue2D],
+    output_bus: Bus2D,
+    visibility_block_size: int = 0,
+    leds_3d: Optional[LEDMap3D] = None,
+    camera_fov: int = 60,
 ):
+    candidate_led_ids = set(range(led_id_from, led_id_to))
+    if visibility_block_size > 1:
+        try:
+            candidate_led_ids = set(
+                find_visible_led_ids(
+                    led_id_from,
+                    led_id_to,
+                    cam,
+                    led_backend,
+                    timeout_controller,
+                    threshold,
+                    display,
+                    visibility_block_size,
+                )
+            )
+        except AttributeError:
+            logger.warning(
+                "backend has no set_leds method, skipping the visibility pass"
+            )
+
+    predictor = None
+    if leds_3d is not None and len(leds_3d) > 0:
+        img_height, img_width = cam.read().shape[:2]
+        predictor = ViewPredictor(leds_3d, camera_fov, img_height / img_width)
+
     leds = []
-    for led_id in range(led_id_from, led_id_to):
-        led = enable_and_find_led(
+    pending_led_ids = list(range(led_id_from, led_id_to))
+    while pending_led_ids:
+
+        # once we know roughly where the camera is, go for the leds it's most likely to see first
+        if predictor is not None and predictor.update_pose():
+            pending_led_ids = predictor.sort_led_ids(pending_led_ids)
+
+        led_id = pending_led_ids.pop(0)
+
+        led = None
+        if led_id in candidate_led_ids:
+            roi, timeout = None, None
+            if predictor is not None:
+                roi = predictor.get_roi(led_id)
+                if predictor.is_unlikely(led_id):
+                    timeout = timeout_controller.timeout * UNLIKELY_TIMEOUT_FACTOR
+
+            led = enable_and_find_led(
+                cam,
+                led_backend,
+                led_id,
+                view_id,
+                timeout_controller,
+                threshold,
+                display,
+                roi,
+                timeout,
+            )
+
+            if led is not None and predictor is not None:
+                predictor.add_detection(led)
+
+        if led is not None:
+            output_bus.put(DetectionControlEnum.DETECT, led)
+            leds.append(led)
+        else:
+            output_bus.put(DetectionControlEnum.SKIP, led_id)
+    return leds
+
+
+def get_colored_led_groups(led_id_from: int, led_id_to: int) -> list[list[int]]:
+    # leds lit together come from different thirds of the range, so they're far apart on the strip
+    # and don't land in each other's blobs
+    third = -(-(led_id_to - led_id_from) // 3)
+    return [
+        list(range(group_start, led_id_to, third))
+        for group_start in range(led_id_from, led_id_from + third)
+    ]
+
+
+def detect_leds_colored(
+    led_id_from: int,
+    led_id_to: int,
+    cam: Camera,
+    led_backend,
+    view_id: int,
+    timeout_controller: TimeoutController,
+    threshold: int,
+    display: bool,
+    output_bus: Bus2D,
+):
+    led_count = led_backend.get_led_count()
+
+    leds = []
+    for led_ids in get_colored_led_groups(led_id_from, led_id_to):
+        found = enable_and_find_leds_colored(
             cam,
             led_backend,
-            led_id,
+            led_ids,
+            led_count,
             view_id,
             timeout_controller,
             threshold,
             display,
         )
 
-        for queue in output_queues:
+        for led_id, led in zip(led_ids, found):
             if led is not None:
-                queue.put(DetectionControlEnum.DETECT, led)
+                output_bus.put(DetectionControlEnum.DETECT, led)
                 leds.append(led)
             else:
-                queue.put(DetectionControlEnum.SKIP, led_id)
-    return leds
+                output_bus.put(DetectionControlEnum.SKIP, led_id)
+
+    return sorted(leds, key=lambda led: led.led_id)
 
 
 class DetectorProcess(Process):
@@ -88,14 +241,19 @@ class DetectorProcess(Process):
         backend_factory: partial,
         display: bool = True,
         check_movement=True,
+        visibility_block_size: int = 0,
+        view_prediction: bool = False,
+        camera_fov: int = 60,
+        detection_mode: str = "sequential",
     ):
         super().__init__()
         self._request_detections_queue = RequestDetectionsQueue()  # {led_id, view_id}
-        self._output_queues: list[Queue2D] = []  # LED3D
+        self._output_bus = Bus2D()
         self._led_count: Queue = Queue()
         self._led_count.cancel_join_thread()
         self._input_3d_info_queue = Queue3DInfo()
-        self._exit_event = Event()
+        self._input_3d_queue = Queue3D()
+        self._exit_event = WaitableEvent()
 
         self._device = device
         self._dark_exposure = dark_exposure
@@ -103,15 +261,28 @@ class DetectorProcess(Process):
         self._led_backend_factory = backend_factory
         self._display = display
         self._check_movement = check_movement
+        self._visibility_block_size = visibility_block_size
+        self._view_prediction = view_prediction
+        self._camera_fov = camera_fov
+
+        assert detection_mode in [
+            "sequential",
+            "gray_code",
+            "colored",
+        ], f"Cannot find detection mode {detection_mode}"
+        self._detection_mode = detection_mode
 
     def get_input_3d_info_queue(self):
         return self._input_3d_info_queue
 
+    def get_input_3d_queue(self) -> Queue3D:
+        return self._input_3d_queue
+
     def get_request_detections_queue(self) -> RequestDetectionsQueue:
         return self._request_detections_queue
 
     def add_output_queue(self, queue: Queue2D):
-        self._output_queues.append(queue)
+        self._output_bus.subscribe(queue)
 
     def detect(self, led_id_from: int, led_id_to: int, view_id: int):
         self._request_detections_queue.request(led_id_from, led_id_to, view_id)
@@ -123,19 +294,23 @@ class DetectorProcess(Process):
         self._exit_event.set()
 
     def put_in_all_output_queues(self, control: DetectionControlEnum, data):
-        for queue in self._output_queues:
-            queue.put(control, data)
+        self._output_bus.put(control, data)
 
     def run(self):
+        report_imports("detector")
 
         led_backend = self._led_backend_factory()
 
         self._led_count.put(led_backend.get_led_count())
 
         cam = Camera(self._device)
+        cam.start_capture()
 
         timeout_controller = TimeoutController()
 
+        # the latest model from the sfm process, used to predict what the next view can see
+        leds_3d: Optional[LEDMap3D] = None
+
         # we quickly switch to dark mode here to throw any exceptions about the camera early
         set_cam_dark(cam, self._dark_exposure)
         set_cam_default(cam)
@@ -160,22 +335,49 @@ class DetectorProcess(Process):
                     logger.error(
                         "Detector process can detect an LED when no LEDs should be visible"
                     )
-                    for queue in self._output_queues:
-                        queue.put(DetectionControlEnum.FAIL, None)
+                    self._output_bus.put(DetectionControlEnum.FAIL, None)
                     set_cam_default(cam)
                     continue
 
-                leds = detect_leds(
-                    led_id_from,
-                    led_id_to,
-                    cam,
-                    led_backend,
-                    view_id,
-                    timeout_controller,
-                    self._threshold,
-                    self._display,
-                    self._output_queues,
-                )
+                leds = None
+                if self._detection_mode in ["gray_code", "colored"]:
+                    try:
+                        detect = (
+                            detect_leds_fast
+                            if self._detection_mode == "gray_code"
+                            else detect_leds_colored
+                        )
+                        leds = detect(
+                            led_id_from,
+                            led_id_to,
+                            cam,
+                            led_backend,
+                            view_id,
+                            timeout_controller,
+                            self._threshold,
+                            self._display,
+                            self._output_bus,
+                        )
+                    except AttributeError:
+                        logger.warning(
+                            "backend has no set_leds method, falling back to sequential detection"
+                        )
+
+                if leds is None:
+                    leds = detect_leds(
+                        led_id_from,
+                        led_id_to,
+                        cam,
+                        led_backend,
+                        view_id,
+                        timeout_controller,
+                        self._threshold,
+                        self._display,
+                        self._output_bus,
+                        self._visibility_block_size,
+                        leds_3d if self._view_prediction else None,
+                        self._camera_fov,
+                    )
 
                 if leds is not None and len(leds) > 0:
 
@@ -206,15 +408,17 @@ class DetectorProcess(Process):
                             )  # this is failing unexpectedly, needs test
                             movement = False
 
-                    for queue in self._output_queues:
-                        queue.put(
-                            (
-                                DetectionControlEnum.DONE
-                                if not movement
-                                else DetectionControlEnum.DELETE
-                            ),
-                            view_id,
-                        )
+                    self._output_bus.put(
+                        (
+                            DetectionControlEnum.DONE
+                            if not movement
+                            else DetectionControlEnum.DELETE
+                        ),
+                        view_id,
+                    )
+
+                # anything left over from a scan that found nothing
+                self._output_bus.flush()
 
                 # and lets reset everything back to normal
                 set_cam_default(cam)
@@ -223,18 +427,34 @@ class DetectorProcess(Process):
                 if self._display:
                     image = cam.read()
                     show_image(image)
-                    time.sleep(1 / 60)
+
+                if not self._input_3d_queue.empty():
+                    latest_leds_3d = self._input_3d_queue.get_latest()
+                    if latest_leds_3d is not None:
+                        leds_3d = latest_leds_3d
 
                 if not self._input_3d_info_queue.empty():
-                    led_info: dict[int, LEDInfo] = self._input_3d_info_queue.get()
+                    led_info = self._input_3d_info_queue.get_latest()
 
-                    success = render_led_info(led_info, led_backend)
+                    success = led_info is None or render_led_info(led_info, led_backend)
                     if not success:
                         logger.debug(
                             "failed to update colourful backend buffer due to a missing attribute"
                         )
 
+                # sleep until there's something to do, or just until the next frame if we're displaying
+                wait_for_queues(
+                    [
+                        self._request_detections_queue,
+                        self._input_3d_queue,
+                        self._input_3d_info_queue,
+                        self._exit_event,
+                    ],
+                    timeout=1 / 60 if self._display else None,
+                )
+
         logger.info("detector closing, resetting camera and backend")
         set_cam_default(cam)
+        cam.stop_capture()
         backend_black(led_backend)
         time.sleep(1)  # wait a moment for the backend to update before closing
@@ -38,8 +38,9 @@ def load_detections(filename: Path, view_id) -> typing.Optional[list[LED2D]]:
     return leds
 
 
-def get_all_2d_led_maps(directory: Path) -> list[LED2D]:
-    points = []
+def load_2d_led_map_files(directory: Path) -> dict[int, tuple[Path, list[LED2D]]]:
+    # every 2D map in the directory by view id, along with the file it came from
+    led_maps = {}
 
     for view_id, filename in enumerate(sorted(os.listdir(directory))):
         full_path = Path(directory, filename)
@@ -49,7 +50,16 @@ def get_all_2d_led_maps(directory: Path) -> list[LED2D]:
         )  # this is wrong < WHY DID I WRITE THIS???? IS IT NOT???
 
         if detections is not None:
-            points.extend(detections)
+            led_maps[view_id] = (full_path, detections)
+
+    return led_maps
+
+
+def get_all_2d_led_maps(directory: Path) -> list[LED2D]:
+    points = []
+
+    for _, detections in load_2d_led_map_files(directory).values():
+        points.extend(detections)
 
     return points
 
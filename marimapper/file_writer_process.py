@@ -1,8 +1,19 @@
-from multiprocessing import Process, Event
-from marimapper.queues import Queue2D, Queue3D, DetectionControlEnum
+from multiprocessing import Process
+from marimapper.queues import (
+    Queue2D,
+    Queue3D,
+    DetectionControlEnum,
+    WaitableEvent,
+    wait_for_queues,
+)
 from marimapper.led import LED2D
 import time
-from marimapper.file_tools import write_3d_leds_to_file, write_2d_leds_to_file
+from marimapper.file_tools import (
+    write_3d_leds_to_file,
+    write_2d_leds_to_file,
+    load_2d_led_map_files,
+)
+from marimapper.import_report import report_imports
 from pathlib import Path
 import os
 
@@ -13,7 +24,7 @@ class FileWriterProcess(Process):
         super().__init__()
         self._input_queue_2d = Queue2D()
         self._input_queue_3d = Queue3D()
-        self._exit_event = Event()
+        self._exit_event = WaitableEvent()
         self._base_path = base_path
         os.makedirs(self._base_path, exist_ok=True)
         self.daemon = True
@@ -32,32 +43,64 @@ class FileWriterProcess(Process):
         return self._base_path / f"led_map_2d_{string_time}.csv"
 
     def run(self):
+        report_imports("file writer")
+
         views: dict[int, list[LED2D]] = {}
         view_id_to_filename: dict[int, Path] = {}
 
+        # views from earlier sessions, so a rescan of one merges into and rewrites its original file
+        for view_id, (filename, detections) in load_2d_led_map_files(
+            self._base_path
+        ).items():
+            views[view_id] = detections
+            view_id_to_filename[view_id] = filename
+
+        # rescans are kept apart until they complete so a deleted one leaves the view as it was
+        complete_view_ids = set(views)
+        rescans: dict[int, dict[int, LED2D]] = {}
+
         while not self._exit_event.is_set():
 
+            wait_for_queues(
+                [self._input_queue_2d, self._input_queue_3d, self._exit_event]
+            )
+
             if not self._input_queue_3d.empty():
-                leds = self._input_queue_3d.get()
-                write_3d_leds_to_file(leds, self._base_path / "led_map_3d.csv")
+                led_map = self._input_queue_3d.get_latest()
+                if led_map is not None:
+                    write_3d_leds_to_file(
+                        led_map.to_leds(), self._base_path / "led_map_3d.csv"
+                    )
 
             if not self._input_queue_2d.empty():
                 control, data = self._input_queue_2d.get()
 
                 if control == DetectionControlEnum.DONE:
                     view_id = data
+                    if view_id in rescans:
+                        # a rescanned led replaces its previous detection in this view
+                        rescanned = rescans.pop(view_id)
+                        views[view_id] = [
+                            led for led in views[view_id] if led.led_id not in rescanned
+                        ] + list(rescanned.values())
+                    complete_view_ids.add(view_id)
                     write_2d_leds_to_file(views[view_id], view_id_to_filename[view_id])
 
                 if control == DetectionControlEnum.DETECT:
                     led = data
 
-                    if led.view_id not in view_id_to_filename:
-                        view_id_to_filename[led.view_id] = self.get_new_filename()
-                        views[led.view_id] = []
-
-                    views[led.view_id].append(led)
+                    if led.view_id in complete_view_ids:
+                        rescans.setdefault(led.view_id, {})[led.led_id] = led
+                    else:
+                        if led.view_id not in view_id_to_filename:
+                            view_id_to_filename[led.view_id] = self.get_new_filename()
+                            views[led.view_id] = []
+                        views[led.view_id].append(led)
 
                 if control == DetectionControlEnum.DELETE:
                     view_id = data
-                    del views[view_id]
-                    del view_id_to_filename[view_id]
+                    if view_id in complete_view_ids:
+                        rescans.pop(view_id, None)
+                    else:
+                        views.pop(view_id, None)
+                        view_id_to_filename.pop(view_id, None)
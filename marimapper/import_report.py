@@ -0,0 +1,49 @@
+"""
+Reports how much each marimapper process spends starting up and which heavy dependencies it has loaded.
+
+Enabled with --import_report, which sets an environment variable so every process spawned afterwards
+reports as well. For a per module breakdown, run with python -X importtime.
+"""
+
+import os
+import sys
+import time
+
+IMPORT_REPORT_ENV = "MARIMAPPER_IMPORT_REPORT"
+
+# dependencies that are slow to import, so should only be loaded by the processes that use them
+HEAVY_MODULES = [
+    "open3d",
+    "pycolmap",
+    "cv2",
+    "tqdm",
+    "requests",
+    "serial",
+    "pixelblaze",
+]
+
+
+def enable_import_report() -> None:
+    os.environ[IMPORT_REPORT_ENV] = "1"
+
+
+def is_import_report_enabled() -> bool:
+    return os.environ.get(IMPORT_REPORT_ENV, "0") == "1"
+
+
+def get_loaded_heavy_modules() -> list[str]:
+    return [module for module in HEAVY_MODULES if module in sys.modules]
+
+
+def report_imports(process_name: str) -> None:
+    if not is_import_report_enabled():
+        return
+
+    # imports are almost all cpu bound, so the cpu time a process has used so far is a good measure of its startup
+    heavy_modules = get_loaded_heavy_modules()
+    print(
+        f"{process_name} started in {time.process_time():.2f}s of cpu time "
+        f"with {len(sys.modules)} modules loaded, "
+        f"heavy modules: {', '.join(heavy_modules) if heavy_modules else 'none'}",
+        file=sys.stderr,
+    )
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from copy import copy
 import numpy as np
 import typing
@@ -17,9 +18,19 @@ class View:
 
 
 class Point2D:
-    def __init__(self, u: float, v: float, contours=()):
+    def __init__(
+        self,
+        u: float,
+        v: float,
+        area: float = 0.0,
+        peak: int = 0,
+        outline: typing.Optional[np.ndarray] = None,
+    ):
         self.position: np.ndarray = np.array([u, v])
-        self.contours = contours
+        self.area = area  # in pixels
+        self.peak = peak  # brightest pixel in the blob
+        # normalised blob outline, only kept for drawing as it's much larger than everything else
+        self.outline = outline
 
     def u(self):
         return self.position[0]
@@ -166,6 +177,24 @@ def get_next(
     return closest
 
 
+# same as calling get_next on every led, but sorts once rather than scanning the whole list for each led
+def get_next_leds(
+    leds: list[Union[LED2D, LED3D]],
+) -> list[typing.Optional[Union[LED2D, LED3D]]]:
+
+    leds_sorted = sorted(leds, key=lambda led: led.led_id)
+    led_ids = [led.led_id for led in leds_sorted]
+
+    next_leds = []
+    for led in leds:
+        next_index = bisect_right(led_ids, led.led_id)
+        next_leds.append(
+            leds_sorted[next_index] if next_index < len(leds_sorted) else None
+        )
+
+    return next_leds
+
+
 def get_gap(led_a: Union[LED2D, LED3D], led_b: Union[LED2D, LED3D]) -> int:
     return abs(led_a.led_id - led_b.led_id)
 
@@ -191,8 +220,7 @@ def last_view(leds: list[LED2D]):
 def find_inter_led_distance(leds: list[Union[LED2D, LED3D]]):
     distances = []
 
-    for led in leds:
-        next_led = get_next(led, leds)
+    for led, next_led in zip(leds, get_next_leds(leds)):
         if next_led is not None:
             if get_gap(led, next_led) == 1:
                 dist = get_distance(led, next_led)
@@ -255,9 +283,7 @@ def fill_gaps(
 
     new_leds = []
 
-    for led in leds:
-
-        next_led = get_next(led, leds)
+    for led, next_led in zip(leds, get_next_leds(leds)):
 
         if next_led is None:
             continue
@@ -304,9 +330,11 @@ def merge(leds: list[LED3D]) -> LED3D:
 def remove_duplicates(leds: list[LED3D]) -> list[LED3D]:
     new_leds = []
 
-    led_ids = set([led.led_id for led in leds])
-    for led_id in led_ids:
-        leds_found = get_leds(leds, led_id)
+    leds_by_id: dict[int, list[LED3D]] = {}
+    for led in leds:
+        leds_by_id.setdefault(led.led_id, []).append(led)
+
+    for leds_found in leds_by_id.values():
         if len(leds_found) == 1:
             new_leds.append(leds_found[0])
         else:
@@ -346,11 +374,18 @@ def get_max_led_id(leds3d: list[LED3D]):
 def combine_2d_3d(leds_2d: list[LED2D], leds_3d: list[LED3D]) -> list[LED3D]:
 
     new_leds_3d = copy(leds_3d)
+
+    leds_by_id: dict[int, list[LED3D]] = {}
+    for led in new_leds_3d:
+        leds_by_id.setdefault(led.led_id, []).append(led)
+
     for led_2d in leds_2d:
-        if led_2d.led_id not in [o.led_id for o in new_leds_3d]:
-            new_leds_3d.append(LED3D(led_2d.led_id))
+        if led_2d.led_id not in leds_by_id:
+            new_led = LED3D(led_2d.led_id)
+            new_leds_3d.append(new_led)
+            leds_by_id[led_2d.led_id] = [new_led]
 
-        for led in get_leds(new_leds_3d, led_2d.led_id):
+        for led in leds_by_id[led_2d.led_id]:
             led.detections.append(led_2d)
 
     return new_leds_3d
@@ -0,0 +1,376 @@
+from multiprocessing import get_logger
+from typing import Optional, Iterable
+import numpy as np
+
+from marimapper.led import LED2D, LED3D, LEDInfo, Point2D, View
+
+logger = get_logger()
+
+
+class LEDMap2D:
+    """A column per attribute of a set of 2D detections, sorted by led id and then view id."""
+
+    def __init__(self, led_ids=(), view_ids=(), positions=()):
+        led_ids = np.asarray(led_ids, dtype=np.int64)
+        view_ids = np.asarray(view_ids, dtype=np.int64)
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+
+        order = np.lexsort((view_ids, led_ids))
+
+        self.led_ids: np.ndarray = led_ids[order]
+        self.view_ids: np.ndarray = view_ids[order]
+        self.positions: np.ndarray = positions[order]
+
+    @staticmethod
+    def from_leds(leds: list[LED2D]) -> "LEDMap2D":
+        return LEDMap2D(
+            [led.led_id for led in leds],
+            [led.view_id for led in leds],
+            [led.point.position for led in leds],
+        )
+
+    def to_leds(self) -> list[LED2D]:
+        return [
+            LED2D(int(led_id), int(view_id), Point2D(*position))
+            for led_id, view_id, position in zip(
+                self.led_ids, self.view_ids, self.positions
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.led_ids)
+
+    def _subset(self, mask: np.ndarray) -> "LEDMap2D":
+        subset = LEDMap2D()
+        subset.led_ids = self.led_ids[mask]
+        subset.view_ids = self.view_ids[mask]
+        subset.positions = self.positions[mask]
+        return subset
+
+    def get_leds(self, led_id: int) -> list[LED2D]:
+        start, end = np.searchsorted(self.led_ids, [led_id, led_id + 1])
+        return self._subset(slice(start, end)).to_leds()
+
+    def get_view_ids(self) -> set[int]:
+        return set(np.unique(self.view_ids).tolist())
+
+    def with_views(self, view_ids: Iterable[int]) -> "LEDMap2D":
+        return self._subset(np.isin(self.view_ids, list(view_ids)))
+
+    def last_view(self) -> int:
+        if len(self) == 0:
+            return -1
+        return int(self.view_ids.max())
+
+
+class LEDMap3D:
+    """A column per attribute of a set of 3D leds, sorted by led id with one entry per id.
+
+    Views are stored once in a pose table, with a visibility matrix recording which views saw each led.
+    """
+
+    def __init__(
+        self,
+        led_ids=(),
+        positions=(),
+        normals=None,
+        errors=None,
+        merged=None,
+        interpolated=None,
+        view_ids=(),
+        view_positions=(),
+        view_rotations=(),
+        visibility=None,
+    ):
+        led_ids = np.asarray(led_ids, dtype=np.int64)
+        led_count = len(led_ids)
+
+        self.led_ids: np.ndarray = led_ids
+        self.positions: np.ndarray = np.asarray(positions, dtype=float).reshape(-1, 3)
+        self.normals: np.ndarray = (
+            np.zeros((led_count, 3))
+            if normals is None
+            else np.asarray(normals, dtype=float).reshape(-1, 3)
+        )
+        self.errors: np.ndarray = (
+            np.zeros(led_count) if errors is None else np.asarray(errors, dtype=float)
+        )
+        self.merged: np.ndarray = (
+            np.zeros(led_count, dtype=bool)
+            if merged is None
+            else np.asarray(merged, dtype=bool)
+        )
+        self.interpolated: np.ndarray = (
+            np.zeros(led_count, dtype=bool)
+            if interpolated is None
+            else np.asarray(interpolated, dtype=bool)
+        )
+
+        self.view_ids: np.ndarray = np.asarray(view_ids, dtype=np.int64)
+        self.view_positions: np.ndarray = np.asarray(
+            view_positions, dtype=float
+        ).reshape(-1, 3)
+        self.view_rotations: np.ndarray = np.asarray(
+            view_rotations, dtype=float
+        ).reshape(-1, 3, 3)
+        self.visibility: np.ndarray = (
+            np.zeros((led_count, len(self.view_ids)), dtype=bool)
+            if visibility is None
+            else np.asarray(visibility, dtype=bool)
+        )
+
+        self._sort_and_merge()
+
+    @staticmethod
+    def from_leds(leds: list[LED3D]) -> "LEDMap3D":
+        views: dict[int, View] = {}
+        for led in leds:
+            for view in led.views:
+                views.setdefault(view.view_id, view)
+
+        view_ids = sorted(views.keys())
+        view_index = {view_id: i for i, view_id in enumerate(view_ids)}
+
+        visibility = np.zeros((len(leds), len(view_ids)), dtype=bool)
+        for i, led in enumerate(leds):
+            visibility[i, [view_index[view.view_id] for view in led.views]] = True
+
+        return LEDMap3D(
+            led_ids=[led.led_id for led in leds],
+            positions=[led.point.position for led in leds],
+            normals=[led.point.normal for led in leds],
+            errors=[led.point.error for led in leds],
+            merged=[led.merged for led in leds],
+            interpolated=[led.interpolated for led in leds],
+            view_ids=view_ids,
+            view_positions=[views[view_id].position for view_id in view_ids],
+            view_rotations=[views[view_id].rotation for view_id in view_ids],
+            visibility=visibility,
+        )
+
+    def _get_views(self, index: int) -> list[View]:
+        return [
+            View(int(self.view_ids[v]), self.view_positions[v], self.view_rotations[v])
+            for v in np.flatnonzero(self.visibility[index])
+        ]
+
+    def _to_led(self, index: int) -> LED3D:
+        led = LED3D(int(self.led_ids[index]))
+        led.point.position = self.positions[index].copy()
+        led.point.normal = self.normals[index].copy()
+        led.point.error = float(self.errors[index])
+        led.merged = bool(self.merged[index])
+        led.interpolated = bool(self.interpolated[index])
+        led.views = self._get_views(index)
+        return led
+
+    def to_leds(self) -> list[LED3D]:
+        return [self._to_led(i) for i in range(len(self))]
+
+    def __len__(self) -> int:
+        return len(self.led_ids)
+
+    def _sort_and_merge(self):
+        """Sorts everything by led id and averages any leds that share an id."""
+
+        unique_ids, inverse, counts = np.unique(
+            self.led_ids, return_inverse=True, return_counts=True
+        )
+
+        if len(unique_ids) == len(self.led_ids):
+            order = np.argsort(self.led_ids, kind="stable")
+            self.led_ids = self.led_ids[order]
+            self.positions = self.positions[order]
+            self.normals = self.normals[order]
+            self.errors = self.errors[order]
+            self.merged = self.merged[order]
+            self.interpolated = self.interpolated[order]
+            self.visibility = self.visibility[order]
+            return
+
+        def average(values):
+            sums = np.zeros((len(unique_ids), values.shape[1]))
+            np.add.at(sums, inverse, values)
+            return sums / counts[:, None]
+
+        duplicated = counts > 1
+
+        self.positions = average(self.positions)
+        self.normals = average(self.normals)
+
+        errors = np.zeros(len(unique_ids))
+        np.add.at(errors, inverse, self.errors)
+        self.errors = errors
+
+        merged = np.zeros(len(unique_ids), dtype=bool)
+        merged[inverse] = self.merged
+        self.merged = merged | duplicated
+
+        # merged leds are no longer just interpolated, which matches merge() in led.py
+        interpolated = np.zeros(len(unique_ids), dtype=bool)
+        interpolated[inverse] = self.interpolated
+        self.interpolated = interpolated & ~duplicated
+
+        visibility = np.zeros((len(unique_ids), self.visibility.shape[1]), dtype=bool)
+        np.logical_or.at(visibility, inverse, self.visibility)
+        self.visibility = visibility
+
+        self.led_ids = unique_ids
+
+        logger.debug(f"merged {int(np.sum(counts[duplicated]))} leds")
+
+    def get_index(self, led_id: int) -> Optional[int]:
+        index = int(np.searchsorted(self.led_ids, led_id))
+        if index < len(self.led_ids) and self.led_ids[index] == led_id:
+            return index
+        return None
+
+    def get_led(self, led_id: int) -> Optional[LED3D]:
+        index = self.get_index(led_id)
+        return None if index is None else self._to_led(index)
+
+    def find_inter_led_distance(self) -> float:
+        consecutive = np.diff(self.led_ids) == 1
+        distances = np.linalg.norm(np.diff(self.positions, axis=0), axis=1)
+        return np.median(distances[consecutive])
+
+    def rescale(self, target_inter_distance=1.0) -> float:
+        scale = (1.0 / self.find_inter_led_distance()) * target_inter_distance
+
+        # this matches Point3D.__mul__, which scales the normal and error along with the position
+        self.positions *= scale
+        self.normals *= scale
+        self.errors *= scale
+        self.view_positions *= scale
+
+        return scale
+
+    def recenter(self):
+        center = np.median(self.positions, axis=0)
+        self.positions -= center
+        self.view_positions -= center
+
+    def fill_gaps(
+        self,
+        min_distance: float = 0.8,
+        max_distance: float = 1.2,
+        max_missing=5,
+    ):
+        if len(self) < 2:
+            return
+
+        gaps = np.diff(self.led_ids) - 1
+        distances = np.linalg.norm(np.diff(self.positions, axis=0), axis=1)
+        distance_per_led = distances / (gaps + 1)
+
+        fillable = np.flatnonzero(
+            (gaps >= 1)
+            & (gaps <= max_missing)
+            & (distance_per_led > min_distance)
+            & (distance_per_led < max_distance)
+        )
+
+        new_led_count = int(np.sum(gaps[fillable]))
+
+        if new_led_count == 0:
+            return
+
+        # one row per new led, pointing at the led before the gap it fills
+        starts = np.repeat(fillable, gaps[fillable])
+        ends = starts + 1
+        offsets = np.arange(new_led_count) - np.repeat(
+            np.cumsum(gaps[fillable]) - gaps[fillable], gaps[fillable]
+        )
+        offsets += 1
+
+        fractions = (offsets / (gaps[starts] + 1))[:, None]
+
+        def interpolate(values):
+            return values[starts] * (1 - fractions) + values[ends] * fractions
+
+        new_led_ids = self.led_ids[starts] + offsets
+
+        self.led_ids = np.concatenate([self.led_ids, new_led_ids])
+        self.positions = np.concatenate([self.positions, interpolate(self.positions)])
+        self.normals = np.concatenate([self.normals, interpolate(self.normals)])
+        self.errors = np.concatenate(
+            [self.errors, interpolate(self.errors[:, None])[:, 0]]
+        )
+        self.merged = np.concatenate([self.merged, np.zeros(new_led_count, bool)])
+        self.interpolated = np.concatenate(
+            [self.interpolated, np.ones(new_led_count, bool)]
+        )
+        self.visibility = np.concatenate(
+            [self.visibility, self.visibility[starts] | self.visibility[ends]]
+        )
+
+        self._sort_and_merge()
+
+        logger.debug(f"filled {new_led_count} LEDs")
+
+    def get_camera_positions(self) -> np.ndarray:
+        """Returns the average position of the views that saw each led, nan if no view saw it."""
+        view_counts = self.visibility.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.visibility @ self.view_positions) / view_counts[:, None]
+
+    def get_info(self, leds_2d: LEDMap2D) -> dict[int, LEDInfo]:
+        led_ids, info = self.get_info_codes(leds_2d)
+        return {
+            int(led_id): LEDInfo(int(value)) for led_id, value in zip(led_ids, info)
+        }
+
+    def get_info_codes(self, leds_2d: LEDMap2D) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the id and LEDInfo value of every led that's either detected or in this map."""
+
+        led_ids = np.union1d(self.led_ids, leds_2d.led_ids)
+
+        detected_ids, detection_counts = np.unique(leds_2d.led_ids, return_counts=True)
+        detections = np.zeros(len(led_ids), dtype=int)
+        detections[np.searchsorted(led_ids, detected_ids)] = detection_counts
+
+        in_3d = np.searchsorted(led_ids, self.led_ids)
+        interpolated = np.zeros(len(led_ids), dtype=bool)
+        interpolated[in_3d] = self.interpolated
+        merged = np.zeros(len(led_ids), dtype=bool)
+        merged[in_3d] = self.merged
+        has_position = np.zeros(len(led_ids), dtype=bool)
+        has_position[in_3d] = self.positions.any(axis=1)
+
+        # this has the same precedence as LED3D.get_info
+        info = np.select(
+            [
+                interpolated,
+                merged,
+                has_position,
+                detections >= 2,
+                detections == 1,
+            ],
+            [
+                LEDInfo.INTERPOLATED.value,
+                LEDInfo.MERGED.value,
+                LEDInfo.RECONSTRUCTED.value,
+                LEDInfo.UNRECONSTRUCTABLE.value,
+                LEDInfo.DETECTED.value,
+            ],
+            default=LEDInfo.NONE.value,
+        )
+
+        return led_ids, info
+
+    def get_overlap_and_percentage(
+        self, leds_2d: LEDMap2D, view_id: int
+    ) -> tuple[int, int]:
+
+        if len(leds_2d) == 0 or len(self) == 0:
+            return 0, 0
+
+        view_led_ids = leds_2d.led_ids[leds_2d.view_ids == view_id]
+        overlap_len = int(np.isin(view_led_ids, self.led_ids).sum())
+
+        if len(view_led_ids) > 0:
+            overlap_percentage = int((overlap_len / len(view_led_ids)) * 100)
+        else:
+            overlap_percentage = 0
+
+        return overlap_len, overlap_percentage
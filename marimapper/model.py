@@ -1,43 +1,88 @@
 import os
 from pathlib import Path
+import numpy as np
+import pycolmap
 from marimapper.pycolmap_tools.read_write_model import (
     qvec2rotmat,
-    read_images_binary,
-    read_points3D_binary,
+    read_images_binary_arrays,
+    read_points3D_binary_arrays,
 )
 
-from marimapper.led import LED3D, View
-from marimapper.led import remove_duplicates
+from marimapper.led_map import LEDMap3D
 
 
-def binary_to_led_map_3d(path: Path) -> list[LED3D]:
+def reconstruction_to_led_map_3d(reconstruction: pycolmap.Reconstruction) -> LEDMap3D:
 
-    points_bin = read_points3D_binary(os.path.join(path, "0", "points3D.bin"))
-    images_bin = read_images_binary(os.path.join(path, "0", "images.bin"))
+    # views keep colmap's image id, matching what binary_to_led_map_3d reads from disk
+    view_ids = np.array(sorted(reconstruction.reg_image_ids()), dtype=np.int64)
 
-    views = {}
-    leds = []
+    view_positions = np.zeros((len(view_ids), 3))
+    view_rotations = np.zeros((len(view_ids), 3, 3))
+    for i, view_id in enumerate(view_ids):
+        cam_from_world = reconstruction.image(int(view_id)).cam_from_world
+        rotation = cam_from_world.rotation.matrix().T
+        view_rotations[i] = rotation
+        view_positions[i] = -rotation @ cam_from_world.translation
 
-    for img in images_bin.values():
+    # pycolmap 3.11 only hands out points one at a time, so gather their attributes in a single pass
+    # and do everything else on whole arrays
+    points = list(reconstruction.points3D.values())
+    tracks = [point.track.elements for point in points]
 
-        rotation = qvec2rotmat(img.qvec).T
-        translation = -rotation @ img.tvec
+    positions = np.array([point.xyz for point in points]).reshape(-1, 3)
+    errors = np.array([point.error for point in points], dtype=float)
+    track_lengths = np.array([len(track) for track in tracks], dtype=np.int64)
+    track_image_ids = np.array(
+        [element.image_id for track in tracks for element in track], dtype=np.int64
+    )
 
-        views[img.id] = (img.id, translation, rotation)
+    # keypoints are indexed by led id, so any observation tells us which led this is
+    led_ids = np.array([track[0].point2D_idx for track in tracks], dtype=np.int64)
 
-    for (
-        led_data
-    ) in points_bin.values():  # this will overwrite previous data! needs filtering
-        led_id = led_data.point2D_idxs[0]
+    point_indices = np.repeat(np.arange(len(points)), track_lengths)
+    visibility = np.zeros((len(points), len(view_ids)), dtype=bool)
+    visibility[point_indices, np.searchsorted(view_ids, track_image_ids)] = True
 
-        led = LED3D(led_id)
+    # leds that were triangulated more than once are merged here
+    return LEDMap3D(
+        led_ids=led_ids,
+        positions=positions,
+        errors=errors,
+        view_ids=view_ids,
+        view_positions=view_positions,
+        view_rotations=view_rotations,
+        visibility=visibility,
+    )
 
-        led.point.position = led_data.xyz
-        led.point.error = led_data.error
-        led.views = [View(*views[view_id]) for view_id in led_data.image_ids]
 
-        leds.append(led)
+def binary_to_led_map_3d(path: Path, map_id: int = 0, mmap: bool = False) -> LEDMap3D:
 
-    leds = remove_duplicates(leds)
+    points = read_points3D_binary_arrays(
+        os.path.join(path, str(map_id), "points3D.bin"), mmap
+    )
+    images = read_images_binary_arrays(
+        os.path.join(path, str(map_id), "images.bin"), mmap
+    )
 
-    return leds
+    order = np.argsort(images.ids)
+    view_ids = images.ids[order]
+    view_rotations = np.array([qvec2rotmat(qvec).T for qvec in images.qvecs[order]])
+    view_positions = -np.einsum("nij,nj->ni", view_rotations, images.tvecs[order])
+
+    # keypoints are indexed by led id, so the first observation of each point tells us which led it is
+    track_starts = np.cumsum(points.track_lengths) - points.track_lengths
+    point_indices = np.repeat(np.arange(len(points.ids)), points.track_lengths)
+
+    visibility = np.zeros((len(points.ids), len(view_ids)), dtype=bool)
+    visibility[point_indices, np.searchsorted(view_ids, points.image_ids)] = True
+
+    # leds that were triangulated more than once are merged here
+    return LEDMap3D(
+        led_ids=points.point2D_idxs[track_starts],
+        positions=points.xyz,
+        errors=points.errors,
+        view_ids=view_ids,
+        view_positions=view_positions,
+        view_rotations=view_rotations,
+        visibility=visibility,
+    )
@@ -54,6 +54,27 @@ class Image(BaseImage):
         return qvec2rotmat(self.qvec)
 
 
+# Whole models as flat arrays, tracks and 2D points are concatenated in record order
+Points3DArrays = collections.namedtuple(
+    "Points3DArrays",
+    ["ids", "xyz", "rgb", "errors", "track_lengths", "image_ids", "point2D_idxs"],
+)
+ImagesArrays = collections.namedtuple(
+    "ImagesArrays",
+    ["ids", "qvecs", "tvecs", "camera_ids", "names", "num_points2D", "xys", "point3D_ids"],
+)
+
+# On disk layouts of the fixed size parts of each record, these are packed so aren't aligned
+POINT3D_HEADER_DTYPE = np.dtype(
+    [("id", "<u8"), ("xyz", "<f8", 3), ("rgb", "u1", 3), ("error", "<f8"), ("track_length", "<u8")]
+)
+TRACK_ELEMENT_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+IMAGE_HEADER_DTYPE = np.dtype(
+    [("id", "<i4"), ("qvec", "<f8", 4), ("tvec", "<f8", 3), ("camera_id", "<i4")]
+)
+POINT2D_DTYPE = np.dtype([("xy", "<f8", 2), ("point3D_id", "<i8")])
+
+
 CAMERA_MODELS = {
     CameraModel(model_id=0, model_name="SIMPLE_PINHOLE", num_params=3),
     CameraModel(model_id=1, model_name="PINHOLE", num_params=4),
@@ -250,47 +271,22 @@ def read_images_binary(path_to_model_file):
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
+    arrays = read_images_binary_arrays(path_to_model_file)
+    points2D_ends = np.cumsum(arrays.num_points2D)
+    points2D_starts = points2D_ends - arrays.num_points2D
+
     images = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi"
-            )
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            binary_image_name = b""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                binary_image_name += current_char
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            image_name = binary_image_name.decode("utf-8")
-            num_points2D = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            x_y_id_s = read_next_bytes(
-                fid,
-                num_bytes=24 * num_points2D,
-                format_char_sequence="ddq" * num_points2D,
-            )
-            xys = np.column_stack(
-                [
-                    tuple(map(float, x_y_id_s[0::3])),
-                    tuple(map(float, x_y_id_s[1::3])),
-                ]
-            )
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
-            )
+    for i, image_id in enumerate(arrays.ids.tolist()):
+        points2D = slice(points2D_starts[i], points2D_ends[i])
+        images[image_id] = Image(
+            id=image_id,
+            qvec=arrays.qvecs[i],
+            tvec=arrays.tvecs[i],
+            camera_id=int(arrays.camera_ids[i]),
+            name=arrays.names[i],
+            xys=arrays.xys[points2D],
+            point3D_ids=arrays.point3D_ids[points2D],
+        )
     return images
 
 
@@ -340,19 +336,20 @@ def write_images_binary(images, path_to_model_file):
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(images), "Q")
-        for _, img in images.items():
-            write_next_bytes(fid, img.id, "i")
-            write_next_bytes(fid, img.qvec.tolist(), "dddd")
-            write_next_bytes(fid, img.tvec.tolist(), "ddd")
-            write_next_bytes(fid, img.camera_id, "i")
-            for char in img.name:
-                write_next_bytes(fid, char.encode("utf-8"), "c")
-            write_next_bytes(fid, b"\x00", "c")
-            write_next_bytes(fid, len(img.point3D_ids), "Q")
-            for xy, p3d_id in zip(img.xys, img.point3D_ids):
-                write_next_bytes(fid, [*xy, p3d_id], "ddq")
+    images = list(images.values())
+    write_images_binary_arrays(
+        ImagesArrays(
+            ids=[img.id for img in images],
+            qvecs=np.reshape([img.qvec for img in images], (-1, 4)),
+            tvecs=np.reshape([img.tvec for img in images], (-1, 3)),
+            camera_ids=[img.camera_id for img in images],
+            names=[img.name for img in images],
+            num_points2D=[len(img.point3D_ids) for img in images],
+            xys=np.concatenate([np.reshape(img.xys, (-1, 2)) for img in images] + [np.zeros((0, 2))]),
+            point3D_ids=np.concatenate([img.point3D_ids for img in images] + [np.zeros(0)]),
+        ),
+        path_to_model_file,
+    )
 
 
 def read_points3D_text(path):
@@ -393,35 +390,21 @@ def read_points3D_binary(path_to_model_file):
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    arrays = read_points3D_binary_arrays(path_to_model_file)
+    track_ends = np.cumsum(arrays.track_lengths)
+    track_starts = track_ends - arrays.track_lengths
+
     points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd"
-            )
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            track_elems = read_next_bytes(
-                fid,
-                num_bytes=8 * track_length,
-                format_char_sequence="ii" * track_length,
-            )
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id,
-                xyz=xyz,
-                rgb=rgb,
-                error=error,
-                image_ids=image_ids,
-                point2D_idxs=point2D_idxs,
-            )
+    for i, point3D_id in enumerate(arrays.ids.tolist()):
+        track = slice(track_starts[i], track_ends[i])
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=arrays.xyz[i],
+            rgb=arrays.rgb[i].astype(int),
+            error=np.array(arrays.errors[i]),
+            image_ids=arrays.image_ids[track].astype(int),
+            point2D_idxs=arrays.point2D_idxs[track].astype(int),
+        )
     return points3D
 
 
@@ -462,17 +445,194 @@ def write_points3D_binary(points3D, path_to_model_file):
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
-    with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(points3D), "Q")
-        for _, pt in points3D.items():
-            write_next_bytes(fid, pt.id, "Q")
-            write_next_bytes(fid, pt.xyz.tolist(), "ddd")
-            write_next_bytes(fid, pt.rgb.tolist(), "BBB")
-            write_next_bytes(fid, pt.error, "d")
-            track_length = pt.image_ids.shape[0]
-            write_next_bytes(fid, track_length, "Q")
-            for image_id, point2D_id in zip(pt.image_ids, pt.point2D_idxs):
-                write_next_bytes(fid, [image_id, point2D_id], "ii")
+    points3D = list(points3D.values())
+    write_points3D_binary_arrays(
+        Points3DArrays(
+            ids=[pt.id for pt in points3D],
+            xyz=np.reshape([pt.xyz for pt in points3D], (-1, 3)),
+            rgb=np.reshape([pt.rgb for pt in points3D], (-1, 3)),
+            errors=[pt.error for pt in points3D],
+            track_lengths=[len(pt.image_ids) for pt in points3D],
+            image_ids=np.concatenate([pt.image_ids for pt in points3D] + [np.zeros(0)]),
+            point2D_idxs=np.concatenate([pt.point2D_idxs for pt in points3D] + [np.zeros(0)]),
+        ),
+        path_to_model_file,
+    )
+
+
+def load_binary(path_to_model_file, mmap=False):
+    """Loads a whole binary model file as bytes, or maps it into memory without reading it."""
+    if mmap:
+        return np.memmap(path_to_model_file, dtype=np.uint8, mode="r")
+    return np.fromfile(path_to_model_file, dtype=np.uint8)
+
+
+def records_view(data, dtype):
+    """A view of data with a record of dtype starting at every byte, so records at any offset can be
+    gathered in one go, regardless of alignment, without copying the rest of the file."""
+    return np.ndarray(
+        shape=(max(len(data) - dtype.itemsize + 1, 0),),
+        dtype=dtype,
+        buffer=data,
+        strides=(1,),
+    )
+
+
+def element_offsets(starts, counts, element_size):
+    """Byte offsets of every element in a set of variable length arrays."""
+    counts = np.asarray(counts, dtype=np.int64)
+    first_elements = np.cumsum(counts) - counts
+    return (
+        np.repeat(np.asarray(starts, dtype=np.int64) - first_elements * element_size, counts)
+        + np.arange(int(counts.sum()), dtype=np.int64) * element_size
+    )
+
+
+def read_points3D_binary_arrays(path_to_model_file, mmap=False):
+    """Reads points3D.bin in a handful of array operations, set mmap to avoid reading the file up front."""
+    data = load_binary(path_to_model_file, mmap)
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+
+    # records change length with their tracks, so the track lengths are walked to find each record
+    offsets = []
+    track_lengths = []
+    offset = 8
+    for _ in range(num_points):
+        track_length = struct.unpack_from("<Q", data, offset + 43)[0]
+        offsets.append(offset)
+        track_lengths.append(track_length)
+        offset += POINT3D_HEADER_DTYPE.itemsize + TRACK_ELEMENT_DTYPE.itemsize * track_length
+
+    offsets = np.array(offsets, dtype=np.int64)
+    track_lengths = np.array(track_lengths, dtype=np.int64)
+
+    headers = records_view(data, POINT3D_HEADER_DTYPE)[offsets]
+    tracks = records_view(data, TRACK_ELEMENT_DTYPE)[
+        element_offsets(
+            offsets + POINT3D_HEADER_DTYPE.itemsize, track_lengths, TRACK_ELEMENT_DTYPE.itemsize
+        )
+    ]
+
+    return Points3DArrays(
+        ids=headers["id"].astype(np.int64),
+        xyz=headers["xyz"].copy(),
+        rgb=headers["rgb"].copy(),
+        errors=headers["error"].copy(),
+        track_lengths=track_lengths,
+        image_ids=tracks["image_id"].copy(),
+        point2D_idxs=tracks["point2D_idx"].copy(),
+    )
+
+
+def write_points3D_binary_arrays(points3D, path_to_model_file):
+    num_points = len(points3D.ids)
+    track_lengths = np.asarray(points3D.track_lengths, dtype=np.int64)
+    record_sizes = POINT3D_HEADER_DTYPE.itemsize + TRACK_ELEMENT_DTYPE.itemsize * track_lengths
+    offsets = 8 + np.cumsum(record_sizes) - record_sizes
+
+    data = np.zeros(8 + int(record_sizes.sum()), dtype=np.uint8)
+    struct.pack_into("<Q", data, 0, num_points)
+
+    headers = np.zeros(num_points, dtype=POINT3D_HEADER_DTYPE)
+    headers["id"] = points3D.ids
+    headers["xyz"] = points3D.xyz
+    headers["rgb"] = points3D.rgb
+    headers["error"] = points3D.errors
+    headers["track_length"] = track_lengths
+    records_view(data, POINT3D_HEADER_DTYPE)[offsets] = headers
+
+    tracks = np.zeros(int(track_lengths.sum()), dtype=TRACK_ELEMENT_DTYPE)
+    tracks["image_id"] = points3D.image_ids
+    tracks["point2D_idx"] = points3D.point2D_idxs
+    records_view(data, TRACK_ELEMENT_DTYPE)[
+        element_offsets(
+            offsets + POINT3D_HEADER_DTYPE.itemsize, track_lengths, TRACK_ELEMENT_DTYPE.itemsize
+        )
+    ] = tracks
+
+    data.tofile(path_to_model_file)
+
+
+def read_images_binary_arrays(path_to_model_file, mmap=False):
+    """Reads images.bin in a handful of array operations, set mmap to avoid reading the file up front."""
+    data = load_binary(path_to_model_file, mmap)
+    num_reg_images = struct.unpack_from("<Q", data, 0)[0]
+
+    # names are null terminated, so the records are walked to find each one
+    offsets = []
+    names = []
+    points2D_offsets = []
+    num_points2D = []
+    offset = 8
+    for _ in range(num_reg_images):
+        offsets.append(offset)
+        name_start = offset + IMAGE_HEADER_DTYPE.itemsize
+        name_end = name_start
+        while data[name_end] != 0:
+            name_end += 1
+        names.append(bytes(data[name_start:name_end]).decode("utf-8"))
+        image_num_points2D = struct.unpack_from("<Q", data, name_end + 1)[0]
+        points2D_offsets.append(name_end + 9)
+        num_points2D.append(image_num_points2D)
+        offset = name_end + 9 + POINT2D_DTYPE.itemsize * image_num_points2D
+
+    num_points2D = np.array(num_points2D, dtype=np.int64)
+
+    headers = records_view(data, IMAGE_HEADER_DTYPE)[np.array(offsets, dtype=np.int64)]
+    points2D = records_view(data, POINT2D_DTYPE)[
+        element_offsets(points2D_offsets, num_points2D, POINT2D_DTYPE.itemsize)
+    ]
+
+    return ImagesArrays(
+        ids=headers["id"].astype(np.int64),
+        qvecs=headers["qvec"].copy(),
+        tvecs=headers["tvec"].copy(),
+        camera_ids=headers["camera_id"].astype(np.int64),
+        names=names,
+        num_points2D=num_points2D,
+        xys=points2D["xy"].copy(),
+        point3D_ids=points2D["point3D_id"].copy(),
+    )
+
+
+def write_images_binary_arrays(images, path_to_model_file):
+    num_reg_images = len(images.ids)
+    encoded_names = [name.encode("utf-8") + b"\x00" for name in images.names]
+    num_points2D = np.asarray(images.num_points2D, dtype=np.int64)
+
+    record_sizes = (
+        IMAGE_HEADER_DTYPE.itemsize
+        + np.array([len(name) for name in encoded_names], dtype=np.int64)
+        + 8
+        + POINT2D_DTYPE.itemsize * num_points2D
+    )
+    offsets = 8 + np.cumsum(record_sizes) - record_sizes
+
+    data = np.zeros(8 + int(record_sizes.sum()), dtype=np.uint8)
+    struct.pack_into("<Q", data, 0, num_reg_images)
+
+    headers = np.zeros(num_reg_images, dtype=IMAGE_HEADER_DTYPE)
+    headers["id"] = images.ids
+    headers["qvec"] = images.qvecs
+    headers["tvec"] = images.tvecs
+    headers["camera_id"] = images.camera_ids
+    records_view(data, IMAGE_HEADER_DTYPE)[offsets] = headers
+
+    points2D_offsets = []
+    for offset, name, image_num_points2D in zip(offsets, encoded_names, num_points2D):
+        name_start = offset + IMAGE_HEADER_DTYPE.itemsize
+        data[name_start : name_start + len(name)] = np.frombuffer(name, dtype=np.uint8)
+        struct.pack_into("<Q", data, name_start + len(name), image_num_points2D)
+        points2D_offsets.append(name_start + len(name) + 8)
+
+    points2D = np.zeros(int(num_points2D.sum()), dtype=POINT2D_DTYPE)
+    points2D["xy"] = images.xys
+    points2D["point3D_id"] = images.point3D_ids
+    records_view(data, POINT2D_DTYPE)[
+        element_offsets(points2D_offsets, num_points2D, POINT2D_DTYPE.itemsize)
+    ] = points2D
+
+    data.tofile(path_to_model_file)
 
 
 def detect_model_format(path, ext):
@@ -1,7 +1,16 @@
-from marimapper.led import LED2D, LED3D, LEDInfo
-from multiprocessing import Queue
-from typing import Union, Any
+from marimapper.led import LED2D, LEDInfo
+from marimapper.led_map import LEDMap3D
+from marimapper.shared_led_map import read_shared_info, read_shared_map
+from multiprocessing import Queue, Event, Pipe
+from multiprocessing.connection import wait
+from typing import Optional, Union, Any
+from collections import deque
 from enum import Enum
+import pickle
+import time
+
+# how long a Bus2D holds on to detections before sending them on
+BATCH_MAX_DELAY = 0.1
 
 
 class DetectionControlEnum(Enum):
@@ -20,6 +29,57 @@ class BaseQueue:
     def empty(self) -> bool:
         return self._queue.empty()
 
+    def _get_reader(self):
+        # the pipe a multiprocessing Queue reads from becomes readable as soon as something is put in it
+        return self._queue._reader
+
+    def _has_buffered(self) -> bool:
+        # whether there's something already read off the pipe waiting to be returned by get
+        return False
+
+
+class WaitableEvent:
+    """A multiprocessing Event that can also be waited on alongside queues with wait_for_queues.
+
+    Setting it also writes a byte down a pipe so a process blocked in wait_for_queues wakes up straight away.
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._reader, self._writer = Pipe(duplex=False)
+
+    def set(self) -> None:
+        if not self._event.is_set():
+            self._event.set()
+            self._writer.send_bytes(b"\0")
+
+    def clear(self) -> None:
+        self._event.clear()
+        while self._reader.poll():
+            self._reader.recv_bytes()
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def _get_reader(self):
+        return self._reader
+
+
+def wait_for_queues(
+    queues: list[Union[BaseQueue, WaitableEvent]], timeout: Optional[float] = None
+) -> list[Union[BaseQueue, WaitableEvent]]:
+    # blocks until any of the queues has something in it or any of the events is set, returning which ones did
+    buffered = [
+        queue
+        for queue in queues
+        if isinstance(queue, BaseQueue) and queue._has_buffered()
+    ]
+    if len(buffered) > 0:
+        return buffered
+
+    readers = {queue._get_reader(): queue for queue in queues}
+    return [readers[reader] for reader in wait(list(readers), timeout)]
+
 
 class RequestDetectionsQueue(BaseQueue):
 
@@ -31,27 +91,95 @@ class RequestDetectionsQueue(BaseQueue):
 
 
 class Queue2D(BaseQueue):
+    # Messages arrive in pickled batches, usually from a Bus2D, but are still put and got one at a time
+
+    def __init__(self):
+        super().__init__()
+        self._buffered: deque = deque()
+
+    def empty(self) -> bool:
+        return len(self._buffered) == 0 and self._queue.empty()
+
+    def _has_buffered(self) -> bool:
+        return len(self._buffered) > 0
 
     def put(self, control: DetectionControlEnum, data: Union[LED2D, int, None]) -> None:
-        self._queue.put((control, data))
+        self._put_batch(pickle.dumps([(control, data)]))
+
+    def _put_batch(self, batch: bytes) -> None:
+        self._queue.put(batch)
 
     def get(self, timeout=None) -> tuple[DetectionControlEnum, Any]:
-        return self._queue.get(timeout=timeout)
+        if len(self._buffered) == 0:
+            self._buffered.extend(pickle.loads(self._queue.get(timeout=timeout)))
+        return self._buffered.popleft()
+
+
+class Bus2D:
+    """Publishes 2D detection messages to every subscribed Queue2D.
+
+    Messages are collected into batches, each batch is pickled once and the same bytes are sent to every
+    subscriber. A batch goes out once it's older than max_delay, as soon as a view is done, failed or deleted,
+    or when flush is called.
+    """
+
+    def __init__(self, max_delay: float = BATCH_MAX_DELAY):
+        self._subscribers: list[Queue2D] = []
+        self._max_delay = max_delay
+        self._pending: list[tuple[DetectionControlEnum, Any]] = []
+        self._pending_since = 0.0
+
+    def subscribe(self, queue: Queue2D) -> None:
+        self._subscribers.append(queue)
+
+    def put(self, control: DetectionControlEnum, data: Union[LED2D, int, None]) -> None:
+        if len(self._pending) == 0:
+            self._pending_since = time.monotonic()
+        self._pending.append((control, data))
+
+        if (
+            control not in [DetectionControlEnum.DETECT, DetectionControlEnum.SKIP]
+            or time.monotonic() - self._pending_since >= self._max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self._pending) == 0:
+            return
+
+        batch = pickle.dumps(self._pending)
+        self._pending = []
+        for queue in self._subscribers:
+            queue._put_batch(batch)
 
 
 class Queue3D(BaseQueue):
+    # The maps themselves are shared through shared memory, this only says which version to read
 
-    def put(self, leds: list[LED3D]) -> None:
-        self._queue.put(leds)
+    def put(self, version: int, block_name: str) -> None:
+        self._queue.put((version, block_name))
 
-    def get(self, timeout=None) -> list[LED3D]:
+    def get(self, timeout=None) -> tuple[int, str]:
         return self._queue.get(timeout=timeout)
 
+    def _read(self, block_name: str) -> Optional[LEDMap3D]:
+        return read_shared_map(block_name)
 
-class Queue3DInfo(BaseQueue):
+    def get_latest(self) -> Optional[LEDMap3D]:
+        # consumers only ever want the newest map, so skip past any versions we've fallen behind on
+        notification = None
+        while not self.empty():
+            notification = self.get()
 
-    def put(self, led_states: dict[int, LEDInfo]) -> None:
-        self._queue.put(led_states)
+        if notification is None:
+            return None
 
-    def get(self, timeout=None) -> dict[int, LEDInfo]:
-        return self._queue.get(timeout=timeout)
+        _, block_name = notification
+        return self._read(block_name)
+
+
+class Queue3DInfo(Queue3D):
+    # The info for each led is published in the same block as the map it came from
+
+    def _read(self, block_name: str) -> Optional[dict[int, LEDInfo]]:
+        return read_shared_info(block_name)
@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import Optional
+
+from marimapper.led import LED2D
+
+
+class ReconstructionJob:
+    def __init__(
+        self,
+        generation: int,
+        leds_2d: list[LED2D],
+        rebuild: bool = False,
+        view_ids: Optional[list[int]] = None,
+        preview_view_id: Optional[int] = None,
+        rescanned_views: Optional[dict[int, set[int]]] = None,
+        use_cache: bool = True,
+    ):
+        self.generation = generation
+        self.leds_2d = leds_2d
+        self.rebuild = rebuild
+        self.view_ids = view_ids if view_ids is not None else []
+        self.preview_view_id = preview_view_id
+        # led id to the views it has been rescanned in
+        self.rescanned_views = rescanned_views if rescanned_views is not None else {}
+        self.use_cache = use_cache
+
+    def is_preview(self) -> bool:
+        return self.preview_view_id is not None
+
+
+class ReconstructionScheduler:
+    """Hands reconstruction jobs from the SFM process loop to a single worker thread.
+
+    Only one job is ever pending, new requests are merged into it rather than queued behind it.
+    Previews of a view that is still being captured are rate limited and are dropped in favour of any
+    full reconstruction, which happens when a view is done or deleted.
+    """
+
+    def __init__(self, preview_interval: float = 5.0):
+        self._preview_interval = preview_interval
+        self._condition = threading.Condition()
+        self._pending: Optional[ReconstructionJob] = None
+        self._generation = 0
+        self._last_full_generation = 0
+        self._last_preview_time: Optional[float] = None
+        self._closed = False
+
+    def request_full(
+        self,
+        leds_2d: list[LED2D],
+        rebuild: bool = False,
+        view_ids=(),
+        rescanned_views: Optional[dict[int, set[int]]] = None,
+        use_cache: bool = True,
+    ) -> None:
+        with self._condition:
+            self._generation += 1
+            self._last_full_generation = self._generation
+
+            view_ids = list(view_ids)
+            rescanned_views = {
+                led_id: set(led_view_ids)
+                for led_id, led_view_ids in (rescanned_views or {}).items()
+            }
+            if self._pending is not None and not self._pending.is_preview():
+                rebuild = rebuild or self._pending.rebuild
+                use_cache = use_cache and self._pending.use_cache
+                view_ids = self._pending.view_ids + view_ids
+                for led_id, led_view_ids in self._pending.rescanned_views.items():
+                    rescanned_views.setdefault(led_id, set()).update(led_view_ids)
+
+            self._pending = ReconstructionJob(
+                self._generation,
+                list(leds_2d),
+                rebuild,
+                view_ids,
+                rescanned_views=rescanned_views,
+                use_cache=use_cache,
+            )
+            self._condition.notify()
+
+    def request_rebuild(self, leds_2d: list[LED2D]) -> None:
+        # falls back to rebuilding from scratch, keeping any newer detections that are already pending
+        with self._condition:
+            if self._pending is not None and not self._pending.is_preview():
+                self._pending.rebuild = True
+                self._condition.notify()
+            else:
+                self.request_full(leds_2d, rebuild=True)
+
+    def request_preview(
+        self, leds_2d: list[LED2D], view_id: int, now: Optional[float] = None
+    ) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            # a full reconstruction is already on its way
+            if self._pending is not None and not self._pending.is_preview():
+                return False
+
+            if (
+                self._last_preview_time is not None
+                and now - self._last_preview_time < self._preview_interval
+            ):
+                return False
+
+            self._generation += 1
+            self._last_preview_time = now
+            self._pending = ReconstructionJob(
+                self._generation, list(leds_2d), preview_view_id=view_id
+            )
+            self._condition.notify()
+            return True
+
+    def get_job(self, timeout: Optional[float] = None) -> Optional[ReconstructionJob]:
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._pending is not None or self._closed, timeout
+            )
+            job, self._pending = self._pending, None
+            return job
+
+    def is_stale(self, job: ReconstructionJob) -> bool:
+        # previews are superseded by anything newer, full jobs only by a newer full job as
+        # their views have already been added to the reconstruction
+        with self._condition:
+            if job.is_preview():
+                return self._closed or job.generation != self._generation
+            return self._closed or job.generation != self._last_full_generation
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def is_closed(self) -> bool:
+        return self._closed
@@ -10,9 +10,10 @@ from multiprocessing import get_logger, set_start_method
 from marimapper.file_tools import get_all_2d_led_maps
 from marimapper.utils import get_user_confirmation
 from marimapper.visualize_process import VisualiseProcess
-from marimapper.led import last_view
+from marimapper.led import last_view, get_view_ids
 from marimapper.file_writer_process import FileWriterProcess
 from functools import partial
+from typing import Optional
 
 # This is to do with an issue with open3d bug in estimate normals
 # https://github.com/isl-org/Open3D/issues/1428
@@ -60,6 +61,12 @@ class Scanner:
         interpolation_max_error: float,
         check_movement: bool,
         camera_model_name: str,
+        visibility_block_size: int = 0,
+        rescan_views: Optional[list[int]] = None,
+        view_prediction: bool = False,
+        detection_mode: str = "sequential",
+        rebuild: bool = False,
+        max_pairs_per_view: Optional[int] = None,
     ):
         logger.debug("initialising scanner")
         set_start_method("spawn")  # VERY important, see top of file
@@ -72,6 +79,10 @@ class Scanner:
             backend_factory=backend_factory,
             display=True,
             check_movement=check_movement,
+            visibility_block_size=visibility_block_size,
+            view_prediction=view_prediction,
+            camera_fov=60,
+            detection_mode=detection_mode,
         )
 
         self.file_writer = FileWriterProcess(self.output_dir)
@@ -87,10 +98,20 @@ class Scanner:
             led_count,
             camera_model_name=camera_model_name,
             camera_fov=60,
+            cache_dir=Path(self.output_dir, "sfm_cache"),
+            max_pairs_per_view=max_pairs_per_view,
         )
 
         self.current_view = last_view(existing_leds) + 1
 
+        self.rescan_views = list(rescan_views) if rescan_views is not None else []
+        for rescan_view in self.rescan_views:
+            if rescan_view not in get_view_ids(existing_leds):
+                raise Exception(
+                    f"Cannot rescan view {rescan_view} as it does not exist"
+                )
+        self.rescan_index = 0
+
         self.renderer3d = VisualiseProcess()
 
         self.detector_update_queue = Queue2D()
@@ -102,7 +123,11 @@ class Scanner:
         self.sfm.add_output_queue(self.renderer3d.get_input_queue())
         self.sfm.add_output_queue(self.file_writer.get_3d_input_queue())
         self.sfm.add_output_info_queue(self.detector.get_input_3d_info_queue())
+        if view_prediction:
+            self.sfm.add_output_queue(self.detector.get_input_3d_queue())
         self.sfm.start()
+        if rebuild and len(existing_leds) > 0:
+            self.sfm.request_rebuild()
         self.renderer3d.start()
         self.detector.start()
         self.file_writer.start()
@@ -189,11 +214,20 @@ class Scanner:
                 print("LED range is zero, are you using a dummy backend?")
                 continue
 
+            # rescans go into the existing views in turn so they keep their camera poses
+            if len(self.rescan_views) > 0:
+                view_id = self.rescan_views[self.rescan_index % len(self.rescan_views)]
+                print(f"Rescanning view {view_id}")
+            else:
+                view_id = self.current_view
+
             self.detector.detect(
-                self.led_id_range.start, self.led_id_range.stop, self.current_view
+                self.led_id_range.start, self.led_id_range.stop, view_id
             )
 
             success = self.wait_for_scan()
 
-            if success:
+            if success and len(self.rescan_views) > 0:
+                self.rescan_index += 1
+            elif success:
                 self.current_view += 1
@@ -1,7 +1,11 @@
 import logging
 import importlib.metadata
 from marimapper.database_populator import camera_models, camera_model_radial
-from marimapper.backends.backend_utils import backend_arg_setters
+from marimapper.backends.backend_utils import (
+    get_backend_names,
+    get_backend_arg_setter,
+)
+from marimapper.import_report import enable_import_report
 
 from pathlib import Path
 import os
@@ -46,6 +50,13 @@ def add_common_args(parser) -> None:
 
     parser.add_argument("-v", "--verbose", action="store_true")
 
+    parser.add_argument(
+        "--import_report",
+        action="store_true",
+        help="Report how long the CLI and each process took to start and which heavy modules they loaded, "
+        "run with python -X importtime for a per module breakdown",
+    )
+
 
 def add_scanner_args(parser) -> None:
 
@@ -97,10 +108,63 @@ def add_scanner_args(parser) -> None:
         help="Sets the camera model used for reconstruction, choose camera_model_opencv_full for higher accuracy",
     )
 
+    scanner_options.add_argument(
+        "--detection_mode",
+        type=str,
+        choices=["sequential", "colored", "gray_code"],
+        default="sequential",
+        help="sequential lights one LED at a time. colored lights three at a time in red, green and blue "
+        "and needs RGB LEDs. gray_code lights LEDs in patterns to find them all in 2 * log2(LED count) frames, "
+        "this needs a completely dark and still scene. Both colored and gray_code need a backend with set_leds",
+    )
+
+    scanner_options.add_argument(
+        "--visibility_block_size",
+        type=int,
+        default=0,
+        help="Lights blocks of this many LEDs at once to skip LEDs the camera can't see, "
+        "requires a backend with set_leds. Set to 0 to disable",
+    )
+
+    scanner_options.add_argument(
+        "--rescan_view",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Rescan LEDs from the camera positions of existing views, one view per scan in the order given, "
+        "keeping every camera pose and only re-triangulating the rescanned LEDs. The camera must be where it "
+        "was when each view was taken. LEDs are only moved once they've been rescanned from at least two views, "
+        "as the other views still see them where they used to be",
+    )
+
+    scanner_options.add_argument(
+        "--view_prediction",
+        action="store_true",
+        help="Once a 3D model exists, estimate where the camera is from the first LEDs found in each new view "
+        "and use it to scan likely visible LEDs first, only searching where they are expected to be",
+    )
+
+    scanner_options.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Rebuild the 3D model from scratch on startup rather than loading it from the cache. "
+        "New views are added to the model one at a time, use this if it has drifted over a long scan",
+    )
+
+    scanner_options.add_argument(
+        "--max_pairs_per_view",
+        type=int,
+        default=-1,
+        help="Only match each view against this many of the views it shares the most LEDs with, "
+        "which speeds up reconstructing scans with lots of views. Set to -1 to match every pair of views",
+    )
+
 
 def parse_common_args(args: argparse.Namespace, logger: logging.Logger) -> None:
     if args.verbose:
         logger.setLevel(logging.DEBUG)
+    if args.import_report:
+        enable_import_report()
     if args.version:
         version = importlib.metadata.version("marimapper")
         print(f"Marimapper version: {version}")
@@ -117,7 +181,7 @@ def add_all_backend_parsers(parser, required=False) -> list[argparse.ArgumentPar
         help="Backend to use to control the LEDs", required=required
     )
 
-    for backend_name, backend_arg_setter in backend_arg_setters.items():
+    for backend_name in get_backend_names():
         backend_parser = backend_subparser.add_parser(
             backend_name,
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -128,7 +192,7 @@ def add_all_backend_parsers(parser, required=False) -> list[argparse.ArgumentPar
             f"{backend_name} options"
         )
 
-        backend_arg_setter(backend_parser_group)
+        get_backend_arg_setter(backend_name)(backend_parser_group)
 
         backend_subparsers.append(backend_parser)
 
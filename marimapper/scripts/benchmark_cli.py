@@ -0,0 +1,79 @@
+# sfm_process has to be imported before anything else pulls in pycolmap, see scanner.py
+from marimapper.benchmark import run_benchmark
+
+import argparse
+import json
+from pathlib import Path
+from marimapper.scripts.arg_tools import add_common_args, parse_common_args
+from multiprocessing import log_to_stderr
+import logging
+
+logger = log_to_stderr()
+logger.setLevel(level=logging.WARNING)
+
+# the recorded test data and example maps only exist in a checkout of the repository
+REPO_ROOT = Path(__file__).parents[2]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks detection and reconstruction against recorded scans, no hardware required",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        usage=argparse.SUPPRESS,
+    )
+
+    add_common_args(parser)
+
+    parser.add_argument(
+        "--sequences",
+        type=Path,
+        nargs="*",
+        default=[REPO_ROOT / "test" / "MariMapper-Test-Data" / "9_point_box"],
+        help="Folders of cam_N/capture_%%04d.png recordings to replay through detection and reconstruction",
+    )
+
+    parser.add_argument(
+        "--maps",
+        type=Path,
+        nargs="*",
+        default=[REPO_ROOT / "docs" / "highbeam_example"],
+        help="Folders of led_map_2d csv files to replay through reconstruction",
+    )
+
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="How many times to run each reconstruction stage",
+    )
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Write the results to this json file rather than printing them",
+    )
+
+    args = parser.parse_args()
+
+    parse_common_args(args, logger)
+
+    sequences = [path for path in args.sequences if path.is_dir()]
+    maps = [path for path in args.maps if path.is_dir()]
+
+    for path in set(args.sequences + args.maps) - set(sequences + maps):
+        logger.warning(f"skipping {path} as it doesn't exist")
+
+    results = run_benchmark(sequences, maps, args.repeats)
+
+    results_json = json.dumps(results, indent=4)
+
+    if args.output is None:
+        print(results_json)
+    else:
+        args.output.write_text(results_json)
+
+
+if __name__ == "__main__":
+    main()
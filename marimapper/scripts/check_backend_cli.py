@@ -2,7 +2,7 @@ import argparse
 import time
 from multiprocessing import log_to_stderr
 import logging
-from marimapper.backends.backend_utils import backend_factories
+from marimapper.backends.backend_utils import get_backend_factory
 from marimapper.scripts.arg_tools import add_all_backend_parsers
 from marimapper.scripts.arg_tools import parse_common_args, add_common_args
 
@@ -32,7 +32,7 @@ def main():
 
     logger.info(f"Loading {args.backend} backend")
 
-    backend_factory = backend_factories[args.backend](args)
+    backend_factory = get_backend_factory(args.backend)(args)
 
     led_backend = backend_factory()
 
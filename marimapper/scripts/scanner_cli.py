@@ -14,8 +14,8 @@ from marimapper.scripts.arg_tools import (
     add_scanner_args,
     add_all_backend_parsers,
 )
-from marimapper.backends.backend_utils import backend_factories
-from marimapper.scanner import Scanner
+from marimapper.backends.backend_utils import get_backend_factory
+from marimapper.import_report import report_imports
 import os
 
 
@@ -45,7 +45,12 @@ def main():
     if args.start > args.end:
         raise Exception(f"Start point {args.start} is greater the end point {args.end}")
 
-    backend_factory = backend_factories[args.backend](args)
+    backend_factory = get_backend_factory(args.backend)(args)
+
+    report_imports("cli")
+
+    # imported here so that spawned processes, which import this module again, don't pay for it
+    from marimapper.scanner import Scanner
 
     scanner = Scanner(
         args.dir,
@@ -59,6 +64,12 @@ def main():
         args.interpolation_max_error if args.interpolation_max_error != -1 else 10000,
         args.disable_movement_check,
         args.camera_model,
+        args.visibility_block_size,
+        args.rescan_view,
+        args.view_prediction,
+        args.detection_mode,
+        args.rebuild,
+        args.max_pairs_per_view if args.max_pairs_per_view != -1 else None,
     )
 
     scanner.mainloop()
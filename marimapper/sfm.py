@@ -1,20 +1,61 @@
+import os
+from math import radians
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Optional
+import numpy as np
 import pycolmap
 
 from marimapper.database_populator import (
     populate_database,
+    get_visibility,
     camera_model_radial,
     camera_model_type,
 )
 from marimapper.led import LED3D, LED2D, get_view_ids
-from marimapper.model import binary_to_led_map_3d
+from marimapper.led_map import LEDMap3D
+from marimapper.model import reconstruction_to_led_map_3d
+from marimapper.sfm_cache import ReconstructionCache, get_reconstruction_key
 from marimapper.utils import SupressLogging
 from multiprocessing import get_logger
 
 logger = get_logger()
 
 
+def get_pipeline_options() -> pycolmap.IncrementalPipelineOptions:
+    options = pycolmap.IncrementalPipelineOptions()
+    options.triangulation.ignore_two_view_tracks = False  # used to be true
+    options.min_num_matches = 9  # default 15
+    options.mapper.abs_pose_min_num_inliers = 9  # default 30
+    options.mapper.init_min_num_inliers = 50  # used to be 100
+    return options
+
+
+def get_largest_reconstruction(
+    reconstructions: dict[int, pycolmap.Reconstruction],
+) -> Optional[pycolmap.Reconstruction]:
+
+    # NOTE!
+    # There might be more maps than just the largest, however we only use one.
+    # We could use all of the avaliable maps,
+    # However I think it might be misleading or confusing as they will appear with no relative transform.
+    # Because of this, lots of existing functionality like inter-led distance might break
+    # Leaving it out for now but perhaps something to come back to.
+
+    if len(reconstructions) == 0:
+        return None
+
+    for map_id, reconstruction in reconstructions.items():
+        logger.debug(
+            f"sfm managed to reconstruct {reconstruction.num_points3D()} points in map {map_id}"
+        )
+
+    return max(
+        reconstructions.values(),
+        key=lambda reconstruction: reconstruction.num_points3D(),
+    )
+
+
 def sfm(
     leds_2d: list[LED2D],
     camera_model: camera_model_type = camera_model_radial,
@@ -37,38 +78,396 @@ def sfm(
 
         populate_database(database_path, leds_2d, camera_model, camera_fov)
 
-        options = pycolmap.IncrementalPipelineOptions()
-        options.triangulation.ignore_two_view_tracks = False  # used to be true
-        options.min_num_matches = 9  # default 15
-        options.mapper.abs_pose_min_num_inliers = 9  # default 30
-        options.mapper.init_min_num_inliers = 50  # used to be 100
+        options = get_pipeline_options()
 
         with SupressLogging():
-            pycolmap.incremental_mapping(
+            reconstructions = pycolmap.incremental_mapping(
                 database_path=database_path,
                 image_path=temp_dir,
                 output_path=temp_dir,
                 options=options,
             )
 
-        # NOTE!
-        # There might be more map folders than just "0", however this is the base section and only the one we're
-        # interested in at the moment. We could iterate through all avaliable maps
-        # However I think it might be misleading or confusing as they will appear with no relative transform.
-        # Because of this, lots of existing functionality like inter-led distance might break
-        # Leaving it out for now but perhaps something to come back to.
+        reconstruction = get_largest_reconstruction(reconstructions)
+        if reconstruction is None:
+            return []
+
+        return reconstruction_to_led_map_3d(reconstruction).to_leds()
+
+
+def get_keypoint_count(leds_2d: list[LED2D]) -> int:
+    # COLMAP can only extend a reconstruction if every image keeps the same number of keypoints,
+    # so we round up to leave room for higher led ids in later views
+    max_led_id = max(led.led_id for led in leds_2d)
+    return 1 << max_led_id.bit_length()
+
 
-        leds_3d = []
-        for map_id in range(0, 10):
-            if not Path(temp_dir, f"{map_id}", "points3D.bin").exists():
-                break
+class IncrementalSFM:
+    """Keeps a reconstruction alive between views.
 
-            new_map = binary_to_led_map_3d(Path(temp_dir))
+    When a view is complete it is registered and triangulated against the existing model followed by a
+    local bundle adjustment, rather than re-running incremental mapping over every view.
+    A full rebuild only happens when requested or when the new view cannot be registered.
+    If a cache_dir is given, every reconstruction is stored there and rebuilding from the same
+    detections loads it back instead of re-running the mapper.
+    If max_pairs_per_view is given, each view is only matched against the views it shares the most leds with.
+    """
 
-            logger.debug(
-                f"sfm managed to reconstruct {len(new_map)} leds in map {map_id}"
+    def __init__(
+        self,
+        camera_model: camera_model_type = camera_model_radial,
+        camera_fov: int = 60,
+        cache_dir: Optional[Path] = None,
+        max_pairs_per_view: Optional[int] = None,
+    ):
+        self._camera_model = camera_model
+        self._camera_fov = camera_fov
+        self._options = get_pipeline_options()
+        self._working_dir = TemporaryDirectory()
+        self._reconstruction: Optional[pycolmap.Reconstruction] = None
+        self._keypoint_count = 0
+        self._cache = ReconstructionCache(cache_dir) if cache_dir is not None else None
+        self._max_pairs_per_view = max_pairs_per_view
+
+    def close(self):
+        self._working_dir.cleanup()
+
+    def has_reconstruction(self) -> bool:
+        return self._reconstruction is not None
+
+    def _populate_database(self, leds_2d: list[LED2D]) -> Path:
+        database_path = Path(self._working_dir.name, "database.db")
+        if database_path.exists():
+            os.remove(database_path)
+
+        populate_database(
+            database_path,
+            leds_2d,
+            self._camera_model,
+            self._camera_fov,
+            self._keypoint_count,
+            self._max_pairs_per_view,
+        )
+
+        return database_path
+
+    def _get_leds(self) -> LEDMap3D:
+        return reconstruction_to_led_map_3d(self._reconstruction)
+
+    def _get_cache_key(self, leds_2d: list[LED2D]) -> str:
+        return get_reconstruction_key(
+            leds_2d,
+            self._camera_model.__name__,
+            self._camera_fov,
+            self._options,
+            self._max_pairs_per_view,
+        )
+
+    def _load_cached(self, leds_2d: list[LED2D]) -> bool:
+        if self._cache is None:
+            return False
+
+        cached = self._cache.load(self._get_cache_key(leds_2d))
+        if cached is None:
+            return False
+
+        self._reconstruction, self._keypoint_count = cached
+        return True
+
+    def _store_cached(self, leds_2d: list[LED2D]) -> None:
+        if self._cache is not None and self._reconstruction is not None:
+            self._cache.store(
+                self._get_cache_key(leds_2d), self._reconstruction, self._keypoint_count
             )
 
-            leds_3d = new_map if len(new_map) > len(leds_3d) else leds_3d
+    def rebuild(self, leds_2d: list[LED2D], use_cache: bool = True) -> LEDMap3D:
+
+        self._reconstruction = None
+
+        if len(leds_2d) == 0 or len(get_view_ids(leds_2d)) <= 1:
+            return LEDMap3D()
+
+        # the cache holds the last reconstruction of these detections, which may have been built up view by view
+        if use_cache and self._load_cached(leds_2d):
+            logger.debug("Loaded reconstruction from cache")
+            return self._get_leds()
+
+        logger.debug("Rebuilding reconstruction from scratch")
+
+        self._keypoint_count = get_keypoint_count(leds_2d)
+        database_path = self._populate_database(leds_2d)
+
+        output_path = Path(self._working_dir.name, "output")
+        os.makedirs(output_path, exist_ok=True)
+
+        with SupressLogging():
+            reconstructions = pycolmap.incremental_mapping(
+                database_path=database_path,
+                image_path=self._working_dir.name,
+                output_path=output_path,
+                options=self._options,
+            )
+
+        self._reconstruction = get_largest_reconstruction(reconstructions)
+        if self._reconstruction is None:
+            return LEDMap3D()
+
+        self._store_cached(leds_2d)
+
+        return self._get_leds()
+
+    def _register_image(
+        self, mapper: pycolmap.IncrementalMapper, image_id: int
+    ) -> bool:
+
+        mapper_options = self._options.get_mapper()
+        if not mapper.register_next_image(mapper_options, image_id):
+            return False
+
+        triangulation_options = self._options.get_triangulation()
+        mapper.triangulate_image(triangulation_options, image_id)
+        mapper.iterative_local_refinement(
+            self._options.ba_local_max_refinements,
+            self._options.ba_local_max_refinement_change,
+            mapper_options,
+            self._options.get_local_bundle_adjustment(),
+            triangulation_options,
+            image_id,
+        )
+        return True
+
+    def _needs_rebuild(self, leds_2d: list[LED2D]) -> bool:
+        return (
+            self._reconstruction is None
+            or get_keypoint_count(leds_2d) > self._keypoint_count
+        )
+
+    def _register_view(
+        self,
+        reconstruction: pycolmap.Reconstruction,
+        leds_2d: list[LED2D],
+        view_id: int,
+    ) -> Optional[bool]:
+        # returns None if the view has nothing to register, otherwise whether it was registered
+
+        database_path = self._populate_database(leds_2d)
+
+        database = pycolmap.Database(str(database_path))
+        database_cache = pycolmap.DatabaseCache.create(
+            database,
+            self._options.min_num_matches,
+            self._options.ignore_watermarks,
+            set(),
+        )
+        # DatabaseCache.find_image_with_name corrupts the heap in pycolmap 3.11, so look it up here
+        image_id = next(
+            image.image_id
+            for image in database.read_all_images()
+            if image.name == str(view_id)
+        )
+        database.close()
+
+        # images without any correspondences never make it into the cache
+        if not database_cache.exists_image(image_id):
+            return None
+
+        mapper = pycolmap.IncrementalMapper(database_cache)
+
+        with SupressLogging():
+            mapper.begin_reconstruction(reconstruction)
+
+            registered = reconstruction.is_image_registered(
+                image_id
+            ) or self._register_image(mapper, image_id)
+
+            # The new view might link up views that previously failed to register
+            if registered:
+                for next_image_id in mapper.find_next_images(
+                    self._options.get_mapper()
+                ):
+                    self._register_image(mapper, next_image_id)
+
+            mapper.end_reconstruction(False)
+
+        return registered
+
+    def add_view(self, leds_2d: list[LED2D], view_id: int) -> LEDMap3D:
+
+        if self._needs_rebuild(leds_2d):
+            return self.rebuild(leds_2d)
+
+        if view_id not in get_view_ids(leds_2d):
+            logger.debug(f"View {view_id} has no detections, nothing to register")
+            return self._get_leds()
+
+        registered = self._register_view(self._reconstruction, leds_2d, view_id)
+
+        if registered is None:
+            logger.debug(f"View {view_id} has no matches, nothing to register")
+            return self._get_leds()
+
+        if not registered:
+            logger.debug(f"Failed to register view {view_id}, rebuilding")
+            return self.rebuild(leds_2d)
+
+        logger.debug(f"Registered view {view_id} into existing reconstruction")
+
+        self._store_cached(leds_2d)
+
+        return self._get_leds()
+
+    def preview_view(self, leds_2d: list[LED2D], view_id: int) -> Optional[LEDMap3D]:
+        """Registers a view that is still being captured into a copy of the reconstruction.
+
+        The copy is thrown away afterwards as COLMAP keeps the first set of keypoints it sees for an image,
+        so the view is added for real once it's complete. Returns None rather than falling back to a rebuild.
+        """
+
+        if self._needs_rebuild(leds_2d) or view_id not in get_view_ids(leds_2d):
+            return None
+
+        reconstruction = pycolmap.Reconstruction(self._reconstruction)
+
+        if not self._register_view(reconstruction, leds_2d, view_id):
+            return None
+
+        return reconstruction_to_led_map_3d(reconstruction)
+
+    def _triangulate_led(
+        self,
+        reconstruction: pycolmap.Reconstruction,
+        led_id: int,
+        image_ids: list[int],
+        points: list[np.ndarray],
+    ) -> Optional[tuple[np.ndarray, pycolmap.Track]]:
+        # returns the new position and track, or None if the views don't agree on one
+
+        images = [reconstruction.image(image_id) for image_id in image_ids]
+
+        # the same thresholds COLMAP's own triangulator uses when creating new points
+        triangulation_options = self._options.get_triangulation()
+        options = pycolmap.EstimateTriangulationOptions()
+        options.min_tri_angle = radians(triangulation_options.min_angle)
+        options.ransac.max_error = radians(triangulation_options.create_max_angle_error)
+
+        result = pycolmap.estimate_triangulation(
+            points,
+            [image.cam_from_world for image in images],
+            [reconstruction.camera(image.camera_id) for image in images],
+            options,
+        )
+        if result is None:
+            return None
+
+        track = pycolmap.Track()
+        for image_id, inlier in zip(image_ids, result["inliers"]):
+            if inlier:
+                track.add_element(image_id, led_id)
+
+        if track.length() < 2:
+            return None
+
+        return result["xyz"], track
+
+    def retriangulate(
+        self, leds_2d: list[LED2D], rescanned_views: dict[int, set[int]]
+    ) -> LEDMap3D:
+        """Re-triangulates only the rescanned leds, keeping every camera pose and intrinsic as they are.
+
+        This is for rescanning leds from views that have already been reconstructed, for example after
+        repairing part of a strip. rescanned_views is the view ids each led has been rescanned from.
+        Other views still hold where the led was before it moved, so each led is only triangulated from the
+        views it was rescanned in, and keeps its old position until it has been rescanned from at least two.
+        The new points are refined with a bundle adjustment that only moves them.
+        Falls back to a rebuild if there's nothing to keep.
+        """
+
+        if self._needs_rebuild(leds_2d):
+            return self.rebuild(leds_2d)
+
+        reconstruction = pycolmap.Reconstruction(self._reconstruction)
+
+        _, features, visibility = get_visibility(leds_2d, self._keypoint_count)
+
+        # registered images are named after their view id, views without a pose can't be used here
+        view_to_image_id = {
+            int(reconstruction.image(image_id).name): image_id
+            for image_id in reconstruction.reg_image_ids()
+        }
+        view_to_image_id = {
+            view_id: image_id
+            for view_id, image_id in view_to_image_id.items()
+            if view_id < len(visibility)
+        }
+
+        # the registered views each led has been seen from since it was rescanned
+        led_view_ids = {
+            led_id: [
+                view_id
+                for view_id in sorted(view_ids)
+                if view_id in view_to_image_id and visibility[view_id, led_id]
+            ]
+            for led_id, view_ids in rescanned_views.items()
+            if led_id < self._keypoint_count
+        }
+        led_view_ids = {
+            led_id: view_ids
+            for led_id, view_ids in led_view_ids.items()
+            if len(view_ids) >= 2
+        }
+
+        old_point3D_ids: dict[int, list[int]] = {}
+        for point3D_id, point in reconstruction.points3D.items():
+            led_id = point.track.elements[0].point2D_idx
+            if led_id in led_view_ids:
+                old_point3D_ids.setdefault(led_id, []).append(point3D_id)
+
+        config = pycolmap.BundleAdjustmentConfig()
+        new_point3D_ids = []
+
+        for led_id, view_ids in sorted(led_view_ids.items()):
+            image_ids = [view_to_image_id[view_id] for view_id in view_ids]
+            points = [features[view_id, led_id] for view_id in view_ids]
+
+            # a led keeps its old point unless the rescanned views agree on a new one
+            triangulation = self._triangulate_led(
+                reconstruction, led_id, image_ids, points
+            )
+            if triangulation is None:
+                continue
+
+            for point3D_id in old_point3D_ids.get(led_id, []):
+                reconstruction.delete_point3D(point3D_id)
+
+            for image_id, point in zip(image_ids, points):
+                reconstruction.image(image_id).points2D[led_id].xy = point
+
+            xyz, track = triangulation
+            new_point3D_ids.append(reconstruction.add_point3D(xyz, track))
+
+        if len(new_point3D_ids) > 0:
+            for point3D_id in new_point3D_ids:
+                config.add_variable_point(point3D_id)
+
+            # only the new points move, the cameras they are seen from are held constant
+            ba_options = self._options.get_global_bundle_adjustment()
+            ba_options.refine_focal_length = False
+            ba_options.refine_principal_point = False
+            ba_options.refine_extra_params = False
+            ba_options.refine_extrinsics = False
+            ba_options.print_summary = False
+
+            with SupressLogging():
+                pycolmap.create_default_bundle_adjuster(
+                    ba_options, config, reconstruction
+                ).solve()
+
+        logger.debug(
+            f"Re-triangulated {len(new_point3D_ids)} of {len(rescanned_views)} leds with fixed poses, "
+            f"{len(rescanned_views) - len(led_view_ids)} are waiting to be rescanned from another view"
+        )
+
+        self._reconstruction = reconstruction
+        self._store_cached(leds_2d)
 
-        return leds_3d
+        return self._get_leds()
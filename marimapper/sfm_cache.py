@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Optional
+
+import numpy as np
+import pycolmap
+
+from marimapper.led import LED2D
+from marimapper.led_map import LEDMap2D
+from multiprocessing import get_logger
+
+logger = get_logger()
+
+
+def get_reconstruction_key(
+    leds_2d: list[LED2D],
+    camera_model_name: str,
+    camera_fov: int,
+    options: pycolmap.IncrementalPipelineOptions,
+    max_pairs_per_view: Optional[int] = None,
+) -> str:
+    # LEDMap2D sorts the detections, so the order they were captured in doesn't change the key
+    led_map = LEDMap2D.from_leds(leds_2d)
+
+    key = hashlib.sha256()
+    key.update(led_map.led_ids.tobytes())
+    key.update(led_map.view_ids.tobytes())
+    # hashed as they're written to the 2D map files, so detections reloaded on resume give the same key
+    key.update(" ".join(np.char.mod("%f", led_map.positions).ravel()).encode())
+    key.update(camera_model_name.encode())
+    key.update(str(camera_fov).encode())
+    key.update(json.dumps(options.todict(), sort_keys=True, default=str).encode())
+    # only hashed when set so the keys of existing caches don't change
+    if max_pairs_per_view is not None:
+        key.update(f"max_pairs_per_view={max_pairs_per_view}".encode())
+    return key.hexdigest()
+
+
+class ReconstructionCache:
+    """Reconstructions stored on disk by the hash of everything that went into them.
+
+    Each entry is a COLMAP binary model plus the keypoint count it was built with, so it can carry on being
+    extended view by view. The least recently used entries are removed once there are more than max_entries.
+    """
+
+    METADATA_FILE = "marimapper.json"
+
+    def __init__(self, cache_dir: Path, max_entries: int = 8):
+        self._cache_dir = Path(cache_dir)
+        self._max_entries = max_entries
+
+    def load(self, key: str) -> Optional[tuple[pycolmap.Reconstruction, int]]:
+        entry_dir = Path(self._cache_dir, key)
+        metadata_path = Path(entry_dir, self.METADATA_FILE)
+
+        if not metadata_path.exists():
+            return None
+
+        try:
+            metadata = json.loads(metadata_path.read_text())
+            reconstruction = pycolmap.Reconstruction(str(entry_dir))
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.warning(
+                f"Failed to load cached reconstruction {key}, ignoring it: {e}"
+            )
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        # touching the entry marks it as recently used
+        os.utime(entry_dir)
+
+        return reconstruction, metadata["keypoint_count"]
+
+    def store(
+        self, key: str, reconstruction: pycolmap.Reconstruction, keypoint_count: int
+    ) -> None:
+        entry_dir = Path(self._cache_dir, key)
+        if entry_dir.exists():
+            os.utime(entry_dir)
+            return
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+        # written somewhere else first so a half written entry can never be loaded
+        temp_dir = Path(mkdtemp(dir=self._cache_dir, prefix=".tmp_"))
+        try:
+            reconstruction.write(str(temp_dir))
+            Path(temp_dir, self.METADATA_FILE).write_text(
+                json.dumps({"keypoint_count": keypoint_count})
+            )
+            os.replace(temp_dir, entry_dir)
+        except OSError as e:
+            logger.warning(f"Failed to cache reconstruction {key}: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = [
+            entry
+            for entry in self._cache_dir.iterdir()
+            if entry.is_dir() and not entry.name.startswith(".")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+        for entry in entries[self._max_entries :]:
+            logger.debug(f"Evicting cached reconstruction {entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
@@ -1,53 +1,55 @@
-from multiprocessing import Process, Event, get_logger
-from marimapper.led import (
-    rescale,
-    recenter,
-    LED3D,
-    fill_gaps,
-    get_overlap_and_percentage,
-    LED2D,
-    last_view,
-    combine_2d_3d,
-)
-from marimapper.sfm import sfm
+from multiprocessing import Process, get_logger
+from marimapper.led import LED2D, last_view, get_view_ids
+from marimapper.led_map import LEDMap2D, LEDMap3D
 from marimapper.database_populator import camera_models, camera_model_radial
-from marimapper.queues import Queue2D, Queue3D, DetectionControlEnum, Queue3DInfo
-import open3d
+from marimapper.queues import (
+    Queue2D,
+    Queue3D,
+    DetectionControlEnum,
+    Queue3DInfo,
+    WaitableEvent,
+    wait_for_queues,
+)
+from marimapper.reconstruction_scheduler import (
+    ReconstructionScheduler,
+    ReconstructionJob,
+)
+from marimapper.shared_led_map import SharedMapPublisher
+from marimapper.import_report import report_imports
 import numpy as np
-import math
+import threading
 import time
-from typing import Union
+from typing import Optional, Union, TYPE_CHECKING
+from pathlib import Path
+
+if TYPE_CHECKING:
+    from marimapper.sfm import IncrementalSFM
 
 logger = get_logger()
 
 
 # this is here for now as there is some weird import dependency going on...
 # See https://github.com/TheMariday/marimapper/issues/46
-def add_normals(leds: list[LED3D]):
+def add_normals(leds: LEDMap3D):
+    import open3d
 
     pcd = open3d.geometry.PointCloud()
 
-    pcd.points = open3d.utility.Vector3dVector([led.point.position for led in leds])
+    pcd.points = open3d.utility.Vector3dVector(leds.positions)
 
     pcd.normals = open3d.utility.Vector3dVector(np.zeros((len(leds), 3)))
 
     pcd.estimate_normals()
 
-    camera_normals = []
-    for led in leds:
-        views = [view.position for view in led.views]
-        camera_normals.append(np.average(views, axis=0) if views else None)
+    open3d_normals = np.asarray(pcd.normals)
 
-    for led, camera_normal, open3d_normal in zip(leds, camera_normals, pcd.normals):
+    leds.normals = open3d_normals / np.linalg.norm(open3d_normals, axis=1)[:, None]
 
-        led.point.normal = open3d_normal / np.linalg.norm(open3d_normal)
+    # flip any normals that point more than 90 degrees away from the average camera position
+    camera_normals = leds.get_camera_positions()
+    facing_away = np.einsum("ij,ij->i", camera_normals, open3d_normals) < 0
 
-        if camera_normal is not None:
-
-            angle = np.arccos(np.clip(np.dot(camera_normal, open3d_normal), -1.0, 1.0))
-
-            if angle > math.pi / 2.0:
-                led.point.normal *= -1
+    leds.normals[facing_away] *= -1
 
 
 def print_without_hiding_scan_message(message: str):
@@ -64,12 +66,16 @@ class SFM(Process):
         led_count: int = 0,
         camera_model_name: str = camera_model_radial.__name__,
         camera_fov: int = 60,
+        preview_interval: float = 5.0,
+        cache_dir: Optional[Path] = None,
+        max_pairs_per_view: Optional[int] = None,
     ):
         super().__init__()
         self._input_queue: Queue2D = Queue2D()
         self._output_queues: list[Queue3D] = []
         self._output_info_queues: list[Queue3DInfo] = []
-        self._exit_event = Event()
+        self._exit_event = WaitableEvent()
+        self._rebuild_event = WaitableEvent()
         self._led_count = led_count
 
         assert camera_model_name in [
@@ -80,10 +86,13 @@ class SFM(Process):
             m for m in camera_models if m.__name__ == camera_model_name
         )
         self._camera_fov = camera_fov
+        self._preview_interval = preview_interval
+        self._cache_dir = cache_dir
+        self._max_pairs_per_view = max_pairs_per_view
         self.interpolation_max_fill = interpolation_max_fill
         self.interpolation_max_error = interpolation_max_error
         self.leds_2d = existing_leds if existing_leds is not None else []
-        self.leds_3d: list[LED3D] = []
+        self.leds_3d: LEDMap3D = LEDMap3D()
         self.daemon = True
 
     def get_input_queue(self) -> Queue2D:
@@ -98,114 +107,244 @@ class SFM(Process):
     def stop(self):
         self._exit_event.set()
 
-    def run(self):
+    def request_rebuild(self):
+        """Asks for the reconstruction to be rebuilt from scratch rather than extended view by view.
 
-        needs_initial_reconstruction = len(self.leds_2d) > 0
-        update_info = True
-        while not self._exit_event.is_set():
+        This skips the cache, which may hold a reconstruction that was itself built up view by view.
+        """
+        self._rebuild_event.set()
 
-            update_sfm = False
-            print_overlap = False
-            print_reconstructed = False
+    def _post_process(self, leds_3d: LEDMap3D):
+        leds_3d.rescale()
 
-            while not self._input_queue.empty():
+        leds_3d.fill_gaps(
+            min_distance=1 - self.interpolation_max_error,
+            max_distance=1 + self.interpolation_max_error,
+            max_missing=self.interpolation_max_fill,
+        )
 
-                control, data = self._input_queue.get()
-                if control == DetectionControlEnum.DETECT:
-                    led2d = data
-                    self.leds_2d.append(led2d)
-                    update_sfm = True
-                    print_reconstructed = False
+        leds_3d.recenter()
 
-                if control == DetectionControlEnum.DONE:
-                    print_overlap = True
-                    print_reconstructed = True
-                    update_info = True
-                if control == DetectionControlEnum.DELETE:
-                    view_id = data
-                    self.leds_2d = [
-                        led for led in self.leds_2d if led.view_id != view_id
-                    ]
-                    update_sfm = True
+        add_normals(leds_3d)
+
+    def _check_overlap(self, leds_2d: list[LED2D]):
+        last_view_id = last_view(leds_2d)
+        overlap, overlap_percentage = self.leds_3d.get_overlap_and_percentage(
+            LEDMap2D.from_leds(leds_2d), last_view_id
+        )
+
+        logger.debug(
+            f"Scan {last_view_id} has overlap of {overlap} or {overlap_percentage}%"
+        )
+
+        if overlap < 10:
+            print_without_hiding_scan_message(
+                f"Warning! Scan {last_view_id} has a very low overlap with the reconstructed model "
+                f"(only {overlap} points) and therefore may be disregarded when reconstructing "
+                "unless scans are added between this and the prior scan"
+            )
+        if overlap_percentage < 50:
+            print_without_hiding_scan_message(
+                f"Warning! Scan {last_view_id} has a low overlap with the reconstructed model "
+                f"(only {overlap_percentage}%) and therefore may be disregarded when reconstructing "
+                "unless scans are added between this and the prior scan"
+            )
+
+    def _reconstruction_worker(
+        self,
+        scheduler: ReconstructionScheduler,
+        incremental_sfm: "IncrementalSFM",
+        publisher: SharedMapPublisher,
+    ):
+
+        while not scheduler.is_closed():
+
+            job = scheduler.get_job(timeout=1)
+            if job is None:
+                continue
 
-            start_time = 0
-            end_sfm_time = 0
-            end_post_process_time = 0
+            try:
+                self._run_job(job, scheduler, incremental_sfm, publisher)
+            except Exception:
+                logger.exception("Reconstruction failed")
 
-            if (update_sfm or needs_initial_reconstruction) and len(self.leds_2d) > 0:
+                if job.rebuild:
+                    # there's nothing left to fall back on, so stop and let the scanner report it
+                    logger.error("SFM stopping as the reconstruction can't be rebuilt")
+                    self._exit_event.set()
+                    return
 
-                start_time = time.time()
-                self.leds_3d = sfm(
-                    self.leds_2d,
-                    camera_model=self._camera_model,
-                    camera_fov=self._camera_fov,
+                # the reconstruction may have been left half updated, so start again from the detections
+                if not job.is_preview():
+                    scheduler.request_rebuild(job.leds_2d)
+
+    def _run_job(
+        self,
+        job: ReconstructionJob,
+        scheduler: ReconstructionScheduler,
+        incremental_sfm: "IncrementalSFM",
+        publisher: SharedMapPublisher,
+    ):
+        start_time = time.time()
+
+        if job.is_preview():
+            leds_3d = incremental_sfm.preview_view(job.leds_2d, job.preview_view_id)
+            if leds_3d is None:
+                return
+        elif job.rebuild:
+            leds_3d = incremental_sfm.rebuild(job.leds_2d, job.use_cache)
+        else:
+            for view_id in job.view_ids:
+                leds_3d = incremental_sfm.add_view(job.leds_2d, view_id)
+            if len(job.rescanned_views) > 0:
+                leds_3d = incremental_sfm.retriangulate(
+                    job.leds_2d, job.rescanned_views
                 )
-                end_sfm_time = time.time()
 
-                if len(self.leds_3d) > 0:
-                    rescale(self.leds_3d)
+        end_sfm_time = time.time()
+
+        # newer data has arrived while we were reconstructing, so don't bother finishing this one
+        if scheduler.is_stale(job):
+            logger.debug("abandoning stale reconstruction")
+            return
 
-                    fill_gaps(
-                        self.leds_3d,
-                        min_distance=1 - self.interpolation_max_error,
-                        max_distance=1 + self.interpolation_max_error,
-                        max_missing=self.interpolation_max_fill,
-                    )
+        if len(leds_3d) > 0:
+            self._post_process(leds_3d)
 
-                    recenter(self.leds_3d)
+        # previews are only shown, the info, warnings and model only come from complete views
+        led_info = (
+            None
+            if job.is_preview()
+            else leds_3d.get_info_codes(LEDMap2D.from_leds(job.leds_2d))
+        )
 
-                    add_normals(self.leds_3d)
+        # the info goes out even without a model, so detected leds still show up
+        if len(leds_3d) > 0 or led_info is not None:
+            version, block_name = publisher.publish(leds_3d, led_info)
+            if len(leds_3d) > 0:
+                for queue in self._output_queues:
+                    queue.put(version, block_name)
+            if led_info is not None:
+                for queue in self._output_info_queues:
+                    queue.put(version, block_name)
 
-                    for queue in self._output_queues:
-                        queue.put(self.leds_3d)
+        end_post_process_time = time.time()
 
-                if update_info:
-                    update_info = False
-                    led_info = {}
+        if job.is_preview():
+            return
 
-                    for led in combine_2d_3d(self.leds_2d, self.leds_3d):
-                        led_info[led.led_id] = led.get_info()
+        self.leds_3d = leds_3d
 
-                    for queue in self._output_info_queues:
-                        queue.put(led_info)
+        if len(self.leds_3d) == 0:
+            return
 
-                end_post_process_time = time.time()
+        sfm_time = end_sfm_time - start_time
+        post_time = end_post_process_time - end_sfm_time
 
-            if (print_reconstructed or needs_initial_reconstruction) and len(
-                self.leds_3d
-            ) > 0:
+        print_without_hiding_scan_message(
+            f"Reconstructed {len(self.leds_3d)} / {self._led_count} in {sfm_time:.2f} seconds "
+            f"(post process took {post_time:.2f} seconds)"
+        )
 
-                sfm_time = end_sfm_time - start_time
-                post_time = end_post_process_time - end_sfm_time
+        if len(job.view_ids) > 0:
+            self._check_overlap(job.leds_2d)
 
-                print_without_hiding_scan_message(
-                    f"Reconstructed {len(self.leds_3d)} / {self._led_count} in {sfm_time:.2f} seconds "
-                    f"(post process took {post_time:.2f} seconds)"
-                )
+    def run(self):
+        # pycolmap and open3d are only imported here so the processes that only need this class don't load them
+        from marimapper.sfm import IncrementalSFM
+        import open3d  # noqa: F401, loaded up front so the first reconstruction doesn't wait for it
 
-            needs_initial_reconstruction = False
+        report_imports("sfm")
 
-            if print_overlap and len(self.leds_3d) > 0:
-                last_view_id = last_view(self.leds_2d)
-                overlap, overlap_percentage = get_overlap_and_percentage(
-                    self.leds_2d, self.leds_3d, last_view_id
-                )
+        incremental_sfm = IncrementalSFM(
+            camera_model=self._camera_model,
+            camera_fov=self._camera_fov,
+            cache_dir=self._cache_dir,
+            max_pairs_per_view=self._max_pairs_per_view,
+        )
 
-                logger.debug(
-                    f"Scan {last_view_id} has overlap of {overlap} or {overlap_percentage}%"
-                )
+        scheduler = ReconstructionScheduler(self._preview_interval)
+        publisher = SharedMapPublisher()
+
+        # reconstruction happens on a separate thread so we can keep draining the input queue
+        worker = threading.Thread(
+            target=self._reconstruction_worker,
+            args=(scheduler, incremental_sfm, publisher),
+            daemon=True,
+        )
+        worker.start()
+
+        if len(self.leds_2d) > 0:
+            scheduler.request_full(self.leds_2d, rebuild=True)
+
+        # detections for a view we already have are a rescan from the same camera position
+        complete_view_ids = get_view_ids(self.leds_2d)
+        # view id to the leds rescanned in it so far, only merged in once the rescan completes
+        pending_rescans: dict[int, dict[int, LED2D]] = {}
+        # led id to every view it has been rescanned in
+        rescanned_views: dict[int, set[int]] = {}
+
+        while not self._exit_event.is_set():
+
+            wait_for_queues([self._input_queue, self._rebuild_event, self._exit_event])
+
+            if self._rebuild_event.is_set():
+                self._rebuild_event.clear()
+                scheduler.request_full(self.leds_2d, rebuild=True, use_cache=False)
+
+            capturing_view_id = None
+
+            while not self._input_queue.empty():
+
+                control, data = self._input_queue.get()
+                if control == DetectionControlEnum.DETECT:
+                    led2d = data
+                    if led2d.view_id in complete_view_ids:
+                        rescan = pending_rescans.setdefault(led2d.view_id, {})
+                        rescan[led2d.led_id] = led2d
+                    else:
+                        capturing_view_id = led2d.view_id
+                        self.leds_2d.append(led2d)
+
+                if control == DetectionControlEnum.DONE:
+                    capturing_view_id = None
+                    view_id = data
+                    if view_id in pending_rescans:
+                        # the camera hasn't moved so only the rescanned leds need triangulating again
+                        rescanned = pending_rescans.pop(view_id)
+                        self.leds_2d = [
+                            led
+                            for led in self.leds_2d
+                            if led.view_id != view_id or led.led_id not in rescanned
+                        ] + list(rescanned.values())
+                        for led_id in rescanned:
+                            rescanned_views.setdefault(led_id, set()).add(view_id)
+                        scheduler.request_full(
+                            self.leds_2d,
+                            rescanned_views={
+                                led_id: rescanned_views[led_id] for led_id in rescanned
+                            },
+                        )
+                    elif view_id not in complete_view_ids:
+                        complete_view_ids.add(view_id)
+                        scheduler.request_full(self.leds_2d, view_ids=[view_id])
+
+                if control == DetectionControlEnum.DELETE:
+                    capturing_view_id = None
+                    view_id = data
+                    if view_id in complete_view_ids:
+                        # only the rescan is thrown away, the view keeps its original detections
+                        pending_rescans.pop(view_id, None)
+                        continue
+                    self.leds_2d = [
+                        led for led in self.leds_2d if led.view_id != view_id
+                    ]
+                    scheduler.request_full(self.leds_2d, rebuild=True)
+
+            if capturing_view_id is not None:
+                scheduler.request_preview(self.leds_2d, capturing_view_id)
 
-                if overlap < 10:
-                    print_without_hiding_scan_message(
-                        f"Warning! Scan {last_view_id} has a very low overlap with the reconstructed model "
-                        f"(only {overlap} points) and therefore may be disregarded when reconstructing "
-                        "unless scans are added between this and the prior scan"
-                    )
-                if overlap_percentage < 50:
-                    print_without_hiding_scan_message(
-                        f"Warning! Scan {last_view_id} has a low overlap with the reconstructed model "
-                        f"(only {overlap_percentage}%) and therefore may be disregarded when reconstructing "
-                        "unless scans are added between this and the prior scan"
-                    )
-
-            time.sleep(1)
+        scheduler.close()
+        worker.join()
+        incremental_sfm.close()
+        publisher.close()
@@ -0,0 +1,167 @@
+from multiprocessing import get_logger, shared_memory
+from typing import Optional
+import os
+
+import numpy as np
+
+from marimapper.led import LEDInfo
+from marimapper.led_map import LEDMap3D
+
+logger = get_logger()
+
+# every column of LEDMap3D as it's laid out in a block followed by the LEDInfo of every led we know about,
+# n is the led count, v the view count and i the number of leds with info
+FIELDS = [
+    ("led_ids", np.int64, lambda n, v, i: (n,)),
+    ("positions", np.float64, lambda n, v, i: (n, 3)),
+    ("normals", np.float64, lambda n, v, i: (n, 3)),
+    ("errors", np.float64, lambda n, v, i: (n,)),
+    ("merged", np.bool_, lambda n, v, i: (n,)),
+    ("interpolated", np.bool_, lambda n, v, i: (n,)),
+    ("view_ids", np.int64, lambda n, v, i: (v,)),
+    ("view_positions", np.float64, lambda n, v, i: (v, 3)),
+    ("view_rotations", np.float64, lambda n, v, i: (v, 3, 3)),
+    ("visibility", np.bool_, lambda n, v, i: (n, v)),
+    ("info_led_ids", np.int64, lambda n, v, i: (i,)),
+    ("info", np.int8, lambda n, v, i: (i,)),
+]
+
+INFO_FIELDS = ["info_led_ids", "info"]
+
+# version, led count, view count and info count
+HEADER_DTYPE = np.dtype(
+    [
+        ("version", "<i8"),
+        ("led_count", "<i8"),
+        ("view_count", "<i8"),
+        ("info_count", "<i8"),
+    ]
+)
+
+# readers are only told about new versions, so keep a few around for anyone who is a little behind
+KEEP_VERSIONS = 3
+
+
+def get_layout(
+    led_count: int, view_count: int, info_count: int
+) -> tuple[list[tuple], int]:
+    # returns each field's name, dtype, shape and offset along with the total block size
+    layout = []
+    offset = HEADER_DTYPE.itemsize
+    for name, dtype, get_shape in FIELDS:
+        shape = get_shape(led_count, view_count, info_count)
+        layout.append((name, dtype, shape, offset))
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -(-size // 8) * 8  # keep every array 8 byte aligned
+    return layout, offset
+
+
+class SharedMapPublisher:
+    """Publishes every new 3D map into its own shared memory block rather than pickling it to each consumer.
+
+    A block is never changed once published, consumers are only sent its version and name and copy out what
+    they need with read_shared_map and read_shared_info. Older blocks are unlinked as new versions come in.
+    """
+
+    def __init__(self):
+        self._prefix = f"marimapper_{os.getpid()}_{id(self):x}"
+        self._version = 0
+        self._blocks: list[shared_memory.SharedMemory] = []
+
+    def publish(
+        self,
+        led_map: LEDMap3D,
+        info: Optional[tuple[np.ndarray, np.ndarray]] = None,
+    ) -> tuple[int, str]:
+        # info is the led ids and LEDInfo values from LEDMap3D.get_info_codes
+        self._version += 1
+
+        columns = {
+            name: getattr(led_map, name)
+            for name, _, _ in FIELDS
+            if name not in INFO_FIELDS
+        }
+        columns["info_led_ids"], columns["info"] = (
+            info if info is not None else (np.zeros(0), np.zeros(0))
+        )
+
+        led_count, view_count = len(led_map), len(led_map.view_ids)
+        info_count = len(columns["info"])
+        layout, size = get_layout(led_count, view_count, info_count)
+
+        block = shared_memory.SharedMemory(
+            name=f"{self._prefix}_{self._version}", create=True, size=size
+        )
+
+        np.ndarray((1,), HEADER_DTYPE, block.buf)[0] = (
+            self._version,
+            led_count,
+            view_count,
+            info_count,
+        )
+        for name, dtype, shape, offset in layout:
+            np.ndarray(shape, dtype, block.buf, offset)[...] = columns[name]
+
+        self._blocks.append(block)
+        while len(self._blocks) > KEEP_VERSIONS:
+            self._release(self._blocks.pop(0))
+
+        return self._version, block.name
+
+    def _release(self, block: shared_memory.SharedMemory) -> None:
+        block.close()
+        block.unlink()
+
+    def close(self) -> None:
+        for block in self._blocks:
+            self._release(block)
+        self._blocks = []
+
+
+def read_shared_columns(name: str) -> Optional[dict[str, np.ndarray]]:
+    # returns None if the block has already been unlinked because newer versions have been published
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        logger.debug(f"shared map {name} has already been released")
+        return None
+
+    try:
+        header = np.ndarray((1,), HEADER_DTYPE, block.buf)[0]
+        layout, _ = get_layout(
+            int(header["led_count"]),
+            int(header["view_count"]),
+            int(header["info_count"]),
+        )
+
+        columns = {
+            name: np.ndarray(shape, dtype, block.buf, offset).copy()
+            for name, dtype, shape, offset in layout
+        }
+        del header
+    finally:
+        block.close()
+
+    return columns
+
+
+def read_shared_map(name: str) -> Optional[LEDMap3D]:
+    columns = read_shared_columns(name)
+    if columns is None:
+        return None
+
+    for info_field in INFO_FIELDS:
+        del columns[info_field]
+
+    return LEDMap3D(**columns)
+
+
+def read_shared_info(name: str) -> Optional[dict[int, LEDInfo]]:
+    columns = read_shared_columns(name)
+    if columns is None:
+        return None
+
+    return {
+        int(led_id): LEDInfo(int(value))
+        for led_id, value in zip(columns["info_led_ids"], columns["info"])
+    }
@@ -0,0 +1,202 @@
+from math import cos, radians, tan
+from multiprocessing import get_logger
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from marimapper.led import LED2D
+from marimapper.led_map import LEDMap3D
+
+logger = get_logger()
+
+# how many leds of a new view need to be found in the 3D model before we try to estimate where the camera is
+MIN_CORRESPONDENCES = 8
+
+# an led seen by an earlier view from within this angle of the new view is expected to be visible again
+MAX_VIEW_ANGLE_DEGREES = 60
+
+# all in the same normalised units as Point2D, so a fraction of the image width
+PNP_MAX_ERROR = 0.01
+ROI_RADIUS = 0.05
+
+# leds we don't expect to see still get a look, just not for as long
+UNLIKELY_TIMEOUT_FACTOR = 0.25
+
+
+def get_focal_length(camera_fov: int) -> float:
+    # the same camera database_populator gives COLMAP, in units of image width
+    return 0.5 / tan(radians(camera_fov / 2.0))
+
+
+def project_points(
+    positions: np.ndarray,
+    rotation: np.ndarray,
+    translation: np.ndarray,
+    camera_fov: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # returns the Point2D style u, v of every position along with whether it's in front of the camera
+
+    points_cam = positions @ rotation.T + translation
+    in_front = points_cam[:, 2] > 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        projected = get_focal_length(camera_fov) * points_cam[:, :2] / points_cam[:, 2:]
+
+    # database_populator flips detections so the model comes out y+ up, so we flip back here
+    return 0.5 - projected, in_front
+
+
+class ViewPredictor:
+    """Predicts which leds a new view can see from the partial 3D model.
+
+    Once enough leds of the new view have been found, the camera pose is estimated from them with PnP.
+    Every reconstructed led is then projected into the view, giving the order to scan the remaining leds in,
+    a region of interest to search for each of them and which ones probably can't be seen at all.
+    """
+
+    def __init__(
+        self, leds_3d: LEDMap3D, camera_fov: int = 60, frame_aspect: float = 1.0
+    ):
+        self._leds_3d = leds_3d
+        self._camera_fov = camera_fov
+
+        # the range of v inside the frame, see find_led_in_image for how v is normalised
+        self._v_range = ((1 - frame_aspect) / 2, (1 + frame_aspect) / 2)
+
+        self._object_points: list[np.ndarray] = []
+        self._image_points: list[np.ndarray] = []
+        self._estimated_correspondences = 0
+
+        self._predicted: Optional[np.ndarray] = None
+        self._likely: Optional[np.ndarray] = None
+        self._roi_radius = ROI_RADIUS
+
+    def add_detection(self, led: LED2D) -> None:
+        index = self._leds_3d.get_index(led.led_id)
+        if index is None:
+            return
+
+        self._object_points.append(self._leds_3d.positions[index])
+        self._image_points.append(led.point.position)
+
+    def has_pose(self) -> bool:
+        return self._predicted is not None
+
+    def update_pose(self) -> bool:
+        # re-estimate every time the number of correspondences has grown by half, returns whether we did
+        correspondences = len(self._object_points)
+        if correspondences < max(
+            MIN_CORRESPONDENCES, int(self._estimated_correspondences * 1.5)
+        ):
+            return False
+
+        self._estimated_correspondences = correspondences
+
+        f = get_focal_length(self._camera_fov)
+        camera_matrix = np.array([[f, 0, 0.5], [0, f, 0.5], [0, 0, 1]])
+
+        success, rotation_vector, translation, inliers = cv2.solvePnPRansac(
+            np.array(self._object_points),
+            1 - np.array(self._image_points),
+            camera_matrix,
+            None,
+            reprojectionError=PNP_MAX_ERROR,
+        )
+
+        if not success or inliers is None or len(inliers) < MIN_CORRESPONDENCES:
+            logger.debug(
+                f"Failed to estimate view pose from {correspondences} correspondences"
+            )
+            return False
+
+        rotation = cv2.Rodrigues(rotation_vector)[0]
+        translation = translation.ravel()
+
+        inliers = inliers.ravel()
+        projected, _ = project_points(
+            np.array(self._object_points)[inliers],
+            rotation,
+            translation,
+            self._camera_fov,
+        )
+        errors = np.linalg.norm(
+            projected - np.array(self._image_points)[inliers], axis=1
+        )
+        self._roi_radius = ROI_RADIUS + 3 * float(np.sqrt(np.mean(errors**2)))
+
+        self._predict(rotation, translation)
+
+        logger.debug(
+            f"Estimated view pose from {len(inliers)} / {correspondences} correspondences, "
+            f"expecting to see {int(self._likely.sum())} of {len(self._leds_3d)} reconstructed leds"
+        )
+        return True
+
+    def _predict(self, rotation: np.ndarray, translation: np.ndarray) -> None:
+        predicted, in_front = project_points(
+            self._leds_3d.positions, rotation, translation, self._camera_fov
+        )
+
+        in_frame = (
+            in_front
+            & (predicted[:, 0] >= 0)
+            & (predicted[:, 0] <= 1)
+            & (predicted[:, 1] >= self._v_range[0])
+            & (predicted[:, 1] <= self._v_range[1])
+        )
+
+        # leds facing away or hidden behind something haven't been seen from anywhere near this direction
+        camera_position = -rotation.T @ translation
+        to_camera = camera_position - self._leds_3d.positions
+        to_views = (
+            self._leds_3d.view_positions[None, :, :]
+            - self._leds_3d.positions[:, None, :]
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cosines = np.einsum("nd,nvd->nv", to_camera, to_views) / (
+                np.linalg.norm(to_camera, axis=1)[:, None]
+                * np.linalg.norm(to_views, axis=2)
+            )
+        cosines = np.where(self._leds_3d.visibility, np.nan_to_num(cosines, nan=-1), -1)
+        seen_nearby = cosines.max(axis=1, initial=-1) >= cos(
+            radians(MAX_VIEW_ANGLE_DEGREES)
+        )
+
+        # leds that have never been seen have nothing to say about their direction
+        never_seen = ~self._leds_3d.visibility.any(axis=1)
+
+        self._predicted = predicted
+        self._likely = in_frame & (seen_nearby | never_seen)
+
+    def _get_likely(self, led_id: int) -> Optional[bool]:
+        # None if we can't say either way
+        if not self.has_pose():
+            return None
+
+        index = self._leds_3d.get_index(led_id)
+        if index is None:
+            return None
+
+        return bool(self._likely[index])
+
+    def sort_led_ids(self, led_ids: list[int]) -> list[int]:
+        # likely leds first, then the ones we know nothing about, then the ones we don't expect to see
+        order = {True: 0, None: 1, False: 2}
+        return sorted(led_ids, key=lambda led_id: order[self._get_likely(led_id)])
+
+    def is_unlikely(self, led_id: int) -> bool:
+        return self._get_likely(led_id) is False
+
+    def get_roi(self, led_id: int) -> Optional[tuple[float, float, float, float]]:
+        # where to look for a likely led as u_min, v_min, u_max, v_max, None means the whole frame
+        if not self._get_likely(led_id):
+            return None
+
+        u, v = self._predicted[self._leds_3d.get_index(led_id)]
+        return (
+            u - self._roi_radius,
+            v - self._roi_radius,
+            u + self._roi_radius,
+            v + self._roi_radius,
+        )
@@ -1,24 +1,20 @@
 import numpy as np
-import open3d
-from multiprocessing import get_logger, Process, Event
-from marimapper.queues import Queue3D
-from marimapper.led import LED3D, View, get_next, get_distance
-import time
+from multiprocessing import get_logger, Process
+from marimapper.import_report import report_imports
+from marimapper.queues import Queue3D, WaitableEvent, wait_for_queues
+from marimapper.led import View, get_next, get_distance
+from marimapper.led_map import LEDMap3D
 
 logger = get_logger()
 
-# Temporary fix to stop the zero points issue when visualising
-open3d.utility.set_verbosity_level(open3d.utility.VerbosityLevel.Error)
 
-
-def get_all_views(leds: list[LED3D]) -> list[View]:
-    views = []
-    for led in leds:
-        for view in led.views:
-            if view.view_id not in [v.view_id for v in views]:
-                views.append(view)
-
-    return views
+def get_all_views(led_map: LEDMap3D) -> list[View]:
+    return [
+        View(int(view_id), position, rotation)
+        for view_id, position, rotation in zip(
+            led_map.view_ids, led_map.view_positions, led_map.view_rotations
+        )
+    ]
 
 
 class VisualiseProcess(Process):
@@ -28,7 +24,7 @@ class VisualiseProcess(Process):
         super().__init__()
         self._vis = None
         self._input_queue = Queue3D()
-        self._exit_event = Event()
+        self._exit_event = WaitableEvent()
         self.point_cloud = None
         self.line_set = None
         self.strip_set = None
@@ -43,32 +39,42 @@ class VisualiseProcess(Process):
 
     def run(self):
         logger.debug("Renderer3D process starting")
+        report_imports("visualiser")
         initialised = False
 
         while not self._exit_event.is_set():
 
+            # once the window is open it needs polling every frame, until then there's nothing to do but wait
+            wait_for_queues(
+                [self._input_queue, self._exit_event],
+                timeout=1 / 60 if initialised else None,
+            )
+
             if not self._input_queue.empty():
-                leds = self._input_queue.get()
-                if len(leds) < 9:
+                led_map = self._input_queue.get_latest()
+                if led_map is None or len(led_map) < 9:
                     continue
 
                 if not initialised:
                     self.initialise_visualiser__()
-                    self.reload_geometry__(leds, True)
+                    self.reload_geometry__(led_map, True)
                     initialised = True
                 else:
-                    self.reload_geometry__(leds)
+                    self.reload_geometry__(led_map)
 
             if initialised:
                 self._vis.poll_events()
                 self._vis.update_renderer()
-                time.sleep(1 / 60)
-            else:
-                time.sleep(1)
 
     def initialise_visualiser__(self):
+        # open3d is only imported once there's something to show
+        import open3d
+
         logger.debug("Renderer3D process initialising visualiser")
 
+        # Temporary fix to stop the zero points issue when visualising
+        open3d.utility.set_verbosity_level(open3d.utility.VerbosityLevel.Error)
+
         self._vis = (
             open3d.visualization.Visualizer()
         )  # This needs to be updated to O3DVisualizer
@@ -94,12 +100,14 @@ class VisualiseProcess(Process):
 
         logger.debug("Renderer3D process initialised visualiser")
 
-    def reload_geometry__(self, leds: list[LED3D], first=False):
+    def reload_geometry__(self, led_map: LEDMap3D, first=False):
+        import open3d
 
         logger.debug("Renderer3D process reloading geometry")
 
-        logger.debug(f"Fetched led map with size {len(leds)}")
-        all_views = get_all_views(leds)
+        logger.debug(f"Fetched led map with size {len(led_map)}")
+        all_views = get_all_views(led_map)
+        leds = led_map.to_leds()
 
         p, l, c = view_to_points_lines_colors(all_views)
 
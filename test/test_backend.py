@@ -98,40 +98,126 @@ def test_wled(monkeypatch):
 
     import requests
 
-    def return_response_patch(*arg, **kwargs):
-        class ResponsePatch:
-            status_code = 200
+    posted_payloads = []
 
-            def json(self):
-                return {"leds": {"count": 1}}
+    class ResponsePatch:
+        status_code = 200
 
-        return ResponsePatch()
+        def json(self):
+            return {"leds": {"count": 1}}
 
-    monkeypatch.setattr(requests, "post", return_response_patch)
-    monkeypatch.setattr(requests, "get", return_response_patch)
+    class SessionPatch:
+        def get(self, *arg, **kwargs):
+            return ResponsePatch()
+
+        def post(self, *arg, json=None, **kwargs):
+            posted_payloads.append(json)
+            return ResponsePatch()
+
+    monkeypatch.setattr(requests, "Session", SessionPatch)
 
     from marimapper.backends.wled import wled_backend
 
     wled_backend.Backend("1.2.3.4")
 
+    # the strip is blanked in one request rather than one per led
+    assert posted_payloads == [
+        {
+            "seg": [
+                {"start": 0, "stop": 1, "sel": True, "i": [0, 1, "000000"]},
+                {"stop": 0},
+            ]
+        }
+    ]
+
     with pytest.raises(RuntimeError):
         wled_backend.Backend("bananas")
 
 
+def test_wled_color_ranges():
+
+    from marimapper.backends.wled.wled_backend import get_color_ranges
+
+    buffer = [[0, 0, 0], [0, 0, 0], [255, 255, 255], [0, 0, 0]]
+
+    assert get_color_ranges(buffer) == [0, 2, "000000", 2, 3, "FFFFFF", 3, 4, "000000"]
+    assert get_color_ranges([]) == []
+
+
+def test_wled_udp(monkeypatch):
+
+    import requests
+    import socket
+
+    class ResponsePatch:
+        status_code = 200
+
+        def json(self):
+            return {"leds": {"count": 600}}
+
+    class SessionPatch:
+        def get(self, *arg, **kwargs):
+            return ResponsePatch()
+
+        def post(self, *arg, **kwargs):
+            raise AssertionError("udp mode should only use http for discovery")
+
+    monkeypatch.setattr(requests, "Session", SessionPatch)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.settimeout(1)
+
+    from marimapper.backends.wled import wled_backend
+
+    backend = wled_backend.Backend("127.0.0.1", True, listener.getsockname()[1])
+
+    try:
+        # blanking 600 leds takes two DNRGB packets
+        packet = listener.recv(2048)
+        assert packet[:4] == bytes([4, 2, 0, 0])
+        assert len(packet) == 4 + 489 * 3
+        packet = listener.recv(2048)
+        assert packet[:4] == bytes([4, 2, 1, 233])
+        assert len(packet) == 4 + 111 * 3
+
+        backend.set_led(300, True)
+        assert listener.recv(2048) == bytes([4, 2, 1, 44, 255, 255, 255])
+
+        # only the changed led is sent
+        buffer = [[0, 0, 0] for _ in range(600)]
+        buffer[300] = [255, 255, 255]
+        buffer[5] = [1, 2, 3]
+        backend.set_leds(buffer)
+        assert listener.recv(2048) == bytes([4, 2, 0, 5, 1, 2, 3])
+
+        # once idle, the whole strip is resent before WLED leaves realtime mode
+        backend.REALTIME_REFRESH = 0.1
+        packet = listener.recv(2048)
+        assert packet[:4] == bytes([4, 2, 0, 0])
+        assert packet[4 + 5 * 3 : 4 + 6 * 3] == bytes([1, 2, 3])
+    finally:
+        backend.stop()
+        listener.close()
+
+
 def test_fcmega(monkeypatch):
 
+    import struct
     import serial.tools.list_ports
 
+    writes = []
+
     class SerialPatch:
 
         def __init__(self, _):
             self.is_open = True
 
-        def write(self, _):
-            pass
+        def write(self, data):
+            writes.append(data)
 
         def read(self, _):
-            return b"1"
+            return b"\x01"
 
     def comports_patch():
         class ComportPatch:
@@ -145,7 +231,25 @@ def test_fcmega(monkeypatch):
 
     from marimapper.backends.fcmega import fcmega_backend
 
-    fcmega_backend.Backend()
+    backend = fcmega_backend.Backend()
+    backend.running = False
+    backend.update_thread.join()
+    backend._send_dirty()  # in case the thread never got to the first frame
+    writes.clear()
+
+    # only the changed led is sent, at its offset
+    backend.set_led(5, True)
+    assert backend._send_dirty()
+    assert writes == [
+        struct.pack("<BHH", 1, 5, 1) + bytes([100, 100, 100]),
+        struct.pack("<B", 2),
+    ]
+
+    # nothing changed, so nothing is written
+    writes.clear()
+    backend.set_leds([[0, 0, 0] for _ in range(5)] + [[100, 100, 100]])
+    assert not backend._send_dirty()
+    assert writes == []
 
 
 def test_pixelblaze(monkeypatch):
@@ -159,7 +263,10 @@ def test_pixelblaze(monkeypatch):
         def setActivePatternByName(self, _):
             pass
 
-    monkeypatch.setattr(pixelblaze_backend.pixelblaze, "Pixelblaze", PixelblazePatch)
+    # the backend only imports pixelblaze when it starts, so patch the module itself
+    import pixelblaze
+
+    monkeypatch.setattr(pixelblaze, "Pixelblaze", PixelblazePatch)
 
     pixelblaze_backend.Backend("1.2.3.4")
 
@@ -172,3 +279,60 @@ def test_dummy_backend():
 
     dummy = dummy_backend.Backend()
     assert dummy.get_led_count() == 0
+
+
+def test_artnet():
+    import socket
+    from marimapper.backends.artnet import artnet_backend
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.settimeout(1)
+
+    def receive_frame():
+        # collects universes until the ArtSync that ends the frame
+        universes = {}
+        while True:
+            packet = listener.recv(1024)
+            assert packet.startswith(b"Art-Net\0")
+            if packet[8:10] == (0x5200).to_bytes(2, byteorder="little"):
+                return universes
+            universe = int.from_bytes(packet[14:16], byteorder="little")
+            universes[universe] = packet[18:]
+
+    # 200 fixtures of 4 channels spans 2 universes
+    backend = artnet_backend.Backend(
+        200, 0, 4, "127.0.0.1", False, listener.getsockname()[1]
+    )
+
+    try:
+        backend.set_led(150, True)  # channels 600 to 603, in universe 1
+        receive_frame()  # might have been sent before set_led
+        universes = receive_frame()
+
+        assert universes[0] == bytes(512)
+        assert universes[1][88:92] == bytes([255] * 4)
+        assert sum(universes[1]) == 255 * 4
+
+        backend.set_leds([[0, 0, 0] for _ in range(151)] + [[0, 0, 100]])
+        receive_frame()
+        universes = receive_frame()
+
+        assert universes[1][88:96] == bytes([0] * 4 + [100] * 4)
+
+        # a failed send doesn't stop the refresh thread
+        send_packet = backend.send_packet
+
+        def fail_once(packet):
+            backend.send_packet = send_packet
+            raise OSError("Network is unreachable")
+
+        backend.send_packet = fail_once
+        backend.set_led(150, False)
+        receive_frame()
+        universes = receive_frame()
+
+        assert universes[1][88:92] == bytes(4)
+    finally:
+        backend.stop()
+        listener.close()
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+
+from marimapper.benchmark import benchmark_detection, get_stage_stats
+
+
+def test_stage_stats():
+
+    stats = get_stage_stats([0.1, 0.1, 0.1, 0.5], 10)
+
+    assert stats["runs"] == 4
+    assert stats["p50_ms"] == pytest.approx(100)
+    assert stats["p99_ms"] > 400
+    assert stats["leds_per_second"] == pytest.approx(40 / 0.8)
+
+
+def test_detection_benchmark(tmp_path):
+
+    for view_id in range(2):
+        sequence_dir = tmp_path / f"cam_{view_id}"
+        sequence_dir.mkdir()
+        for frame_id in range(3):
+            image = np.zeros((100, 100), dtype=np.uint8)
+            if frame_id != 1:  # led 1 is hidden
+                cv2.circle(image, (20 + frame_id * 20, 50), 3, 255, -1)
+            cv2.imwrite(str(sequence_dir / f"capture_{frame_id:04d}.png"), image)
+
+    leds_2d, stats = benchmark_detection(tmp_path)
+
+    assert [(led.view_id, led.led_id) for led in leds_2d] == [
+        (0, 0),
+        (0, 2),
+        (1, 0),
+        (1, 2),
+    ]
+    assert stats["runs"] == 6
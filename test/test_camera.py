@@ -1,5 +1,16 @@
 import pytest
-from marimapper.camera import Camera
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from marimapper.camera import (
+    Camera,
+    get_brightness,
+    is_brightness_settled,
+    SETTLE_STABLE_FRAMES,
+    SETTLE_UNCHANGED_FRAMES,
+)
 from utils import get_test_dir
 
 
@@ -20,3 +31,62 @@ def test_invalid_device():
 
     with pytest.raises(RuntimeError):
         Camera(device_id="bananas")
+
+
+def test_capture_thread():
+
+    with tempfile.TemporaryDirectory() as image_dir:
+        for frame_id in range(10):
+            frame = np.full((48, 64, 3), frame_id * 10, dtype=np.uint8)
+            cv2.imwrite(str(Path(image_dir, f"capture_{frame_id:04d}.png")), frame)
+
+        cam = Camera(str(Path(image_dir, "capture_%04d.png")))
+
+        start_time = time.monotonic()
+        cam.start_capture(buffer_size=10)
+
+        first_frame = cam.read_after(start_time)
+        second_frame = cam.read_after(start_time)
+
+        assert first_frame[0, 0, 0] == 0
+        assert second_frame[0, 0, 0] == 10  # frames are never returned twice
+
+        with pytest.raises(Exception, match="image"):
+            cam.read_after(time.monotonic() + 60)
+
+        cam.stop_capture()
+
+
+def test_brightness_settled():
+
+    # still ramping down from the reference
+    assert not is_brightness_settled([150, 100, 50], reference=200)
+
+    assert is_brightness_settled([150, 100, 50, 20, 20, 20], reference=200)
+
+    # a little noise doesn't count as still changing
+    assert is_brightness_settled([100, 101, 100.5], reference=200)
+
+    # nothing has moved yet, the change might still be on its way
+    assert not is_brightness_settled([200] * SETTLE_STABLE_FRAMES, reference=200)
+    assert is_brightness_settled([200] * SETTLE_UNCHANGED_FRAMES, reference=200)
+
+    assert is_brightness_settled([200] * SETTLE_STABLE_FRAMES)
+
+
+def test_wait_for_settle():
+
+    # the camera takes a few frames to come down from 200 to 20 after a change
+    brightness = [200] * 6 + [150, 100, 50] + [20] * 21
+
+    with tempfile.TemporaryDirectory() as image_dir:
+        for frame_id, value in enumerate(brightness):
+            frame = np.full((48, 64, 3), value, dtype=np.uint8)
+            cv2.imwrite(str(Path(image_dir, f"capture_{frame_id:04d}.png")), frame)
+
+        cam = Camera(str(Path(image_dir, "capture_%04d.png")))
+
+        frame_count = cam.wait_for_settle(reference=200)
+
+        assert frame_count < len(brightness) - 10
+        assert get_brightness(cam.read()) == 20
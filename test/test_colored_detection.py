@@ -0,0 +1,61 @@
+import numpy as np
+
+from marimapper.detector import find_leds_in_channels
+from marimapper.detector_process import detect_leds_colored, get_colored_led_groups
+from marimapper.queues import DetectionControlEnum
+from marimapper.timeout_controller import TimeoutController
+from utils import MockQueue, MockScene
+
+
+def test_find_leds_in_channels():
+
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    image[10:13, 10:13] = [0, 80, 250]  # red with some green crosstalk
+    image[50:53, 50:53] = [250, 60, 0]  # blue
+    image[80:83, 80:83] = [250, 250, 250]  # white light shouldn't count as any colour
+
+    red, green, blue = find_leds_in_channels(image)
+
+    assert red.u() == 11 / 100
+    assert green is None
+    assert blue.u() == 51 / 100
+
+
+def test_colored_led_groups():
+
+    groups = get_colored_led_groups(5, 15)
+
+    assert groups == [[5, 9, 13], [6, 10, 14], [7, 11], [8, 12]]
+
+
+def test_detect_leds_colored():
+
+    scene = MockScene(60, {4, 30}, color=True)
+    queue = MockQueue()
+
+    leds = detect_leds_colored(
+        0,
+        60,
+        scene,
+        scene,
+        2,
+        TimeoutController(default_timeout_sec=0.01),
+        128,
+        False,
+        queue,
+    )
+
+    assert [led.led_id for led in leds] == [
+        led_id for led_id in range(60) if led_id not in {4, 30}
+    ]
+    for led in leds:
+        x, y = scene.get_position(led.led_id)
+        assert led.point.u() * 640 == x
+        assert led.view_id == 2
+
+    skipped = [
+        data for control, data in queue.items if control == DetectionControlEnum.SKIP
+    ]
+    assert sorted(skipped) == [4, 30]
+
+    assert scene.lit == set()
@@ -0,0 +1,56 @@
+import numpy as np
+
+from marimapper.database_populator import get_visibility, get_view_pairs
+from marimapper.led import LED2D, Point2D
+
+
+def test_visibility():
+
+    leds = [
+        LED2D(0, 0, Point2D(0.25, 0.5)),
+        LED2D(2, 0, Point2D(0.5, 0.5)),
+        LED2D(2, 2, Point2D(0.5, 0.5)),
+    ]
+
+    views, map_features, visibility = get_visibility(leds, keypoint_count=4)
+
+    assert list(views) == [0, 2]
+    assert map_features.shape == (3, 4, 2)
+    assert list(map_features[0][0]) == [1500, 1000]
+    assert visibility.tolist() == [
+        [True, False, True, False],
+        [False, False, False, False],
+        [False, False, True, False],
+    ]
+
+
+def test_view_pairs():
+
+    # view 0 shares 3 leds with view 1, 2 with view 2 and 1 with view 3, view 3 only overlaps view 0
+    visibility = np.array(
+        [
+            [1, 1, 1, 1, 1, 1],
+            [1, 1, 1, 0, 0, 0],
+            [0, 0, 0, 1, 1, 0],
+            [0, 0, 0, 0, 0, 1],
+        ],
+        dtype=bool,
+    )
+    views = np.arange(4)
+
+    assert get_view_pairs(views, visibility) == [(0, 1), (0, 2), (0, 3)]
+
+    # view 3's only partner is kept even though it isn't in view 0's top pair
+    assert get_view_pairs(views, visibility, max_pairs_per_view=1) == [
+        (0, 1),
+        (0, 2),
+        (0, 3),
+    ]
+
+    visibility[1, 3] = True  # now views 1 and 2 overlap too
+    assert get_view_pairs(views, visibility, max_pairs_per_view=1) == [
+        (0, 1),
+        (0, 2),
+        (0, 3),
+    ]
+    assert len(get_view_pairs(views, visibility)) == 4
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from marimapper.detector_fast import (
+    decode_gray_code,
+    detect_leds_fast,
+    get_gray_code_patterns,
+)
+from marimapper.queues import DetectionControlEnum
+from marimapper.timeout_controller import TimeoutController
+from utils import MockQueue, MockScene
+
+
+def test_gray_code_patterns():
+
+    patterns = get_gray_code_patterns(100)
+
+    assert len(patterns) == 7
+
+    # every led gets its own code and neighbouring codes only differ by one bit
+    assert len({tuple(code) for code in patterns.T}) == 100
+    assert (np.diff(patterns.astype(int), axis=1) != 0).sum(axis=0).tolist() == [1] * 99
+
+
+def test_decode_gray_code():
+
+    # one pixel per code, 2 bits, with the second pixel glowing above the threshold in a frame it should be dark in
+    patterns = get_gray_code_patterns(4)
+    positives = np.where(patterns, 250, 20).astype(np.uint8)[:, None, :]
+    negatives = np.where(patterns, 20, 250).astype(np.uint8)[:, None, :]
+    negatives[1, 0, 1] = 200
+
+    # and the last pixel is never lit at all
+    positives[:, 0, 3] = negatives[:, 0, 3] = 20
+
+    codes, _ = decode_gray_code(positives, negatives, 128)
+
+    assert codes.tolist() == [[0, 1, 2, -1]]
+
+
+def test_detect_leds_fast():
+
+    scene = MockScene(300, {7, 150}, ambient=20)
+    queue = MockQueue()
+
+    leds = detect_leds_fast(
+        0,
+        200,
+        scene,
+        scene,
+        3,
+        TimeoutController(default_timeout_sec=0),
+        128,
+        False,
+        queue,
+    )
+
+    assert scene.frames == 2 * 8
+
+    # led 0 is found as well now the codes come with complementary frames
+    assert [led.led_id for led in leds] == [
+        led_id for led_id in range(200) if led_id not in {7, 150}
+    ]
+    for led in leds:
+        x, y = scene.get_position(led.led_id)
+        assert led.point.u() * 640 == pytest.approx(x)
+        assert led.point.v() * 640 == pytest.approx(y + 80)
+        assert led.view_id == 3
+
+    assert len(queue.items) == 200
+    assert [
+        data for control, data in queue.items if control == DetectionControlEnum.SKIP
+    ] == [7, 150]
+
+    # nothing is left on afterwards
+    assert scene.lit == set()
+
+
+def test_detect_leds_fast_offset():
+
+    scene = MockScene(300, ambient=20)
+
+    leds = detect_leds_fast(
+        250,
+        300,
+        scene,
+        scene,
+        0,
+        TimeoutController(default_timeout_sec=0),
+        128,
+        False,
+        MockQueue(),
+    )
+
+    assert [led.led_id for led in leds] == list(range(250, 300))
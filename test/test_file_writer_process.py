@@ -0,0 +1,81 @@
+import time
+
+from marimapper.file_tools import get_all_2d_led_maps, write_2d_leds_to_file
+from marimapper.file_writer_process import FileWriterProcess
+from marimapper.led import LED2D, Point2D, get_leds_with_view
+from marimapper.queues import DetectionControlEnum
+
+
+def test_rescan_rewrites_existing_view(tmp_path):
+
+    # two views from an earlier session
+    write_2d_leds_to_file(
+        [LED2D(led_id, 0, Point2D(0.1 * led_id, 0.5)) for led_id in range(5)],
+        tmp_path / "led_map_2d_20240101-000000.csv",
+    )
+    write_2d_leds_to_file(
+        [LED2D(led_id, 1, Point2D(0.5, 0.1 * led_id)) for led_id in range(5)],
+        tmp_path / "led_map_2d_20240101-000100.csv",
+    )
+
+    file_writer = FileWriterProcess(tmp_path)
+    file_writer.start()
+
+    # rescan led 2 and add led 7 in the first view
+    queue = file_writer.get_2d_input_queue()
+    queue.put(DetectionControlEnum.DETECT, LED2D(2, 0, Point2D(0.25, 0.75)))
+    queue.put(DetectionControlEnum.DETECT, LED2D(7, 0, Point2D(0.7, 0.5)))
+    queue.put(DetectionControlEnum.DONE, 0)
+
+    timeout = time.time() + 5
+    while len(get_leds_with_view(get_all_2d_led_maps(tmp_path), 0)) != 6:
+        assert time.time() < timeout, "file writer has failed to write the rescan"
+        time.sleep(0.01)
+
+    file_writer.stop()
+    file_writer.join(5)
+
+    # resuming finds the same two views, with the rescanned led replaced rather than duplicated
+    assert len(list(tmp_path.iterdir())) == 2
+    leds = get_all_2d_led_maps(tmp_path)
+    view_0 = {led.led_id: led for led in get_leds_with_view(leds, 0)}
+    assert sorted(view_0) == [0, 1, 2, 3, 4, 7]
+    assert (view_0[2].point.u(), view_0[2].point.v()) == (0.25, 0.75)
+    assert view_0[1].point.u() == 0.1
+    assert len(get_leds_with_view(leds, 1)) == 5
+
+
+def test_deleted_rescan_keeps_existing_view(tmp_path):
+
+    original = [LED2D(led_id, 0, Point2D(0.1 * led_id, 0.5)) for led_id in range(5)]
+    write_2d_leds_to_file(original, tmp_path / "led_map_2d_20240101-000000.csv")
+
+    file_writer = FileWriterProcess(tmp_path)
+    file_writer.start()
+
+    # the camera moved during the rescan, then the retry succeeds
+    queue = file_writer.get_2d_input_queue()
+    queue.put(DetectionControlEnum.DETECT, LED2D(1, 0, Point2D(0.9, 0.9)))
+    queue.put(DetectionControlEnum.DELETE, 0)
+    queue.put(DetectionControlEnum.DETECT, LED2D(2, 0, Point2D(0.25, 0.75)))
+    queue.put(DetectionControlEnum.DONE, 0)
+
+    def get_led_2_u():
+        leds = get_leds_with_view(get_all_2d_led_maps(tmp_path), 0)
+        return next(led.point.u() for led in leds if led.led_id == 2)
+
+    timeout = time.time() + 5
+    while get_led_2_u() != 0.25:
+        assert time.time() < timeout, "file writer has failed to write the rescan"
+        time.sleep(0.01)
+
+    file_writer.stop()
+    file_writer.join(5)
+
+    assert len(list(tmp_path.iterdir())) == 1
+    view_0 = {
+        led.led_id: led for led in get_leds_with_view(get_all_2d_led_maps(tmp_path), 0)
+    }
+    assert sorted(view_0) == [0, 1, 2, 3, 4]
+    assert view_0[1].point.u() == 0.1
+    assert (view_0[2].point.u(), view_0[2].point.v()) == (0.25, 0.75)
@@ -0,0 +1,61 @@
+import subprocess
+import sys
+
+import pytest
+
+from marimapper.import_report import HEAVY_MODULES
+
+
+def get_loaded_heavy_modules(module: str) -> list[str]:
+    # imported in a fresh interpreter, the same as a spawned process would
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import {module}\n"
+            "from marimapper.import_report import get_loaded_heavy_modules\n"
+            "print(','.join(get_loaded_heavy_modules()))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "marimapper.scripts.scanner_cli",
+        "marimapper.backends.backend_utils",
+        "marimapper.sfm_process",
+        "marimapper.visualize_process",
+        "marimapper.file_writer_process",
+    ],
+)
+def test_no_heavy_imports(module):
+    assert get_loaded_heavy_modules(module) == []
+
+
+def test_backends_register_lazily():
+    from marimapper.backends.backend_utils import get_backend_names
+
+    # building the cli imports every backend's arg setter, which shouldn't pull in their dependencies
+    imports = "\n".join(
+        f"get_backend_arg_setter('{backend_name}')"
+        for backend_name in get_backend_names()
+    )
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from marimapper.backends.backend_utils import get_backend_arg_setter\n"
+            f"{imports}\n"
+            "import sys\n"
+            f"print([module for module in {HEAVY_MODULES} if module in sys.modules])",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -1,4 +1,6 @@
 import pytest
+import cv2
+import numpy as np
 
 from marimapper.detector import find_led_in_image, draw_led_detections
 from marimapper.camera import Camera
@@ -37,3 +39,67 @@ def test_draw_results():
     frame = mock_camera.read()
     led_detection = find_led_in_image(frame)
     draw_led_detections(frame, led_detection)
+
+
+def test_brightest_blob_chosen():
+
+    frame = np.zeros((480, 640), dtype=np.uint8)
+    cv2.circle(frame, (100, 100), 2, 150, -1)  # dim
+    cv2.circle(frame, (320, 240), 3, 255, -1)  # bright
+    for x in range(0, 640, 40):  # lots of dim specks
+        frame[20, x] = 140
+
+    led_detection = find_led_in_image(frame)
+
+    assert led_detection.u() == pytest.approx(320 / 640, abs=0.002)
+    assert led_detection.v() == pytest.approx((240 + 80) / 640, abs=0.002)
+
+
+def test_dark_frame():
+
+    frame = np.full((480, 640), 128, dtype=np.uint8)
+
+    assert find_led_in_image(frame, threshold=128) is None
+
+
+def test_detection_record():
+
+    frame = np.zeros((480, 640), dtype=np.uint8)
+    cv2.rectangle(frame, (300, 200), (310, 210), 200, -1)
+    frame[205, 305] = 250
+
+    led_detection = find_led_in_image(frame)
+
+    assert led_detection.area == pytest.approx(100)
+    assert led_detection.peak == 250
+    assert led_detection.outline is None  # only produced when asked for
+
+    led_detection = find_led_in_image(frame, outline=True)
+
+    # the outline is normalised the same way as the centre
+    assert led_detection.outline.min(axis=0) == pytest.approx(
+        [300 / 640, (200 + 80) / 640]
+    )
+    draw_led_detections(frame, led_detection)
+
+
+def test_region_of_interest():
+
+    frame = np.zeros((480, 640), dtype=np.uint8)
+    cv2.rectangle(frame, (100, 100), (110, 110), 250, -1)
+    cv2.rectangle(frame, (500, 300), (510, 310), 200, -1)
+
+    full_frame = find_led_in_image(frame)
+    assert full_frame.u() < 0.5  # the brightest led wins
+
+    # only searching around the dimmer led finds it, in whole frame coordinates
+    u, v = (505 / 640, (305 + 80) / 640)
+    led_detection = find_led_in_image(
+        frame, roi=(u - 0.05, v - 0.05, u + 0.05, v + 0.05)
+    )
+
+    assert led_detection.u() == pytest.approx(u, abs=1 / 640)
+    assert led_detection.v() == pytest.approx(v, abs=1 / 640)
+
+    assert find_led_in_image(frame, roi=(0.4, 0.4, 0.5, 0.5)) is None
+    assert find_led_in_image(frame, roi=(2, 2, 3, 3)) is None
@@ -0,0 +1,94 @@
+import numpy as np
+from marimapper.led import LED3D, LED2D, Point2D, View, LEDInfo
+from marimapper.led_map import LEDMap2D, LEDMap3D
+
+
+def test_remove_duplicates():
+
+    led_0 = LED3D(0)
+    led_0.point.set_position(1, 0, 0)
+    led_1 = LED3D(0)
+
+    led_map = LEDMap3D.from_leds([led_0, led_1])
+
+    assert len(led_map) == 1
+
+    assert led_map.positions[0][0] == 0.5
+    assert led_map.merged[0]
+
+
+def test_get_led():
+
+    led_map = LEDMap3D.from_leds([LED3D(2), LED3D(0), LED3D(1)])
+
+    assert list(led_map.led_ids) == [0, 1, 2]
+    assert led_map.get_led(2).led_id == 2
+    assert led_map.get_led(5) is None
+
+
+def test_fill_gaps():
+
+    led_0 = LED3D(0)
+    led_0.point.set_position(0, 0, 0)
+    led_6 = LED3D(6)
+    led_6.point.set_position(6, 0, 0)
+    led_20 = LED3D(20)  # too far away to be filled
+    led_20.point.set_position(50, 0, 0)
+
+    led_map = LEDMap3D.from_leds([led_0, led_6, led_20])
+    led_map.fill_gaps()
+
+    assert len(led_map) == 8
+
+    for led_id in range(7):
+        assert led_map.get_led(led_id).point.position[0] == led_id
+
+    assert led_map.get_led(3).get_info() == LEDInfo.INTERPOLATED
+
+
+def test_rescale_and_recenter():
+
+    views = [View(0, np.array([4.0, 0, 0]), np.eye(3))]
+
+    leds = []
+    for led_id in range(3):
+        led = LED3D(led_id)
+        led.point.set_position(led_id * 2, 0, 0)
+        led.views = views
+        leds.append(led)
+
+    led_map = LEDMap3D.from_leds(leds)
+
+    assert led_map.rescale() == 0.5
+    assert list(led_map.positions[:, 0]) == [0, 1, 2]
+    assert led_map.view_positions[0][0] == 2
+
+    led_map.recenter()
+
+    assert list(led_map.positions[:, 0]) == [-1, 0, 1]
+    assert led_map.to_leds()[0].views[0].position[0] == 1
+
+
+def test_info_and_overlap():
+
+    led_0 = LED3D(0)
+    led_0.point.set_position(1, 1, 1)
+
+    leds_2d = LEDMap2D.from_leds(
+        [
+            LED2D(0, 0, Point2D(0.5, 0.5)),
+            LED2D(1, 0, Point2D(0.5, 0.5)),
+            LED2D(2, 0, Point2D(0.5, 0.5)),
+            LED2D(2, 1, Point2D(0.5, 0.5)),
+        ]
+    )
+
+    led_map = LEDMap3D.from_leds([led_0])
+
+    assert led_map.get_info(leds_2d) == {
+        0: LEDInfo.RECONSTRUCTED,
+        1: LEDInfo.DETECTED,
+        2: LEDInfo.UNRECONSTRUCTABLE,
+    }
+
+    assert led_map.get_overlap_and_percentage(leds_2d, 0) == (1, 33)
@@ -0,0 +1,114 @@
+import time
+from multiprocessing import Process
+
+from marimapper.led import LED2D, Point2D
+from marimapper.queues import (
+    Queue2D,
+    Bus2D,
+    DetectionControlEnum,
+    WaitableEvent,
+    wait_for_queues,
+)
+
+
+def test_wait_for_queues_timeout():
+    queue = Queue2D()
+    event = WaitableEvent()
+
+    start = time.monotonic()
+    assert wait_for_queues([queue, event], timeout=0.1) == []
+    assert time.monotonic() - start >= 0.1
+
+
+def test_wait_for_queues_wakes_on_put():
+    queue = Queue2D()
+    event = WaitableEvent()
+
+    queue.put(DetectionControlEnum.DETECT, LED2D(0, 0, Point2D(0.5, 0.5)))
+
+    assert wait_for_queues([queue, event], timeout=5) == [queue]
+    control, led = queue.get()
+    assert control == DetectionControlEnum.DETECT
+    assert led.led_id == 0
+
+
+def test_waitable_event():
+    event = WaitableEvent()
+
+    event.set()
+    assert event.is_set()
+    assert wait_for_queues([event], timeout=5) == [event]
+
+    # clearing it consumes the wake up so waiting doesn't return straight away again
+    event.clear()
+    assert not event.is_set()
+    assert wait_for_queues([event], timeout=0) == []
+
+
+def wait_then_put(queue: Queue2D, exit_event: WaitableEvent):
+    wait_for_queues([exit_event])
+    queue.put(DetectionControlEnum.DONE, 0)
+
+
+def test_waitable_event_across_processes():
+    queue = Queue2D()
+    exit_event = WaitableEvent()
+
+    process = Process(target=wait_then_put, args=(queue, exit_event))
+    process.start()
+
+    exit_event.set()
+    assert queue.get(timeout=5) == (DetectionControlEnum.DONE, 0)
+    process.join(5)
+    assert process.exitcode == 0
+
+
+def test_bus_batches_detections():
+    queues = [Queue2D(), Queue2D(), Queue2D()]
+    bus = Bus2D(max_delay=60)
+    for queue in queues:
+        bus.subscribe(queue)
+
+    for led_id in range(10):
+        bus.put(DetectionControlEnum.DETECT, LED2D(led_id, 0, Point2D(0.5, 0.5)))
+    bus.put(DetectionControlEnum.SKIP, 10)
+
+    # detections are held back until the view is done
+    assert wait_for_queues(queues, timeout=0.1) == []
+
+    bus.put(DetectionControlEnum.DONE, 0)
+
+    for queue in queues:
+        messages = [queue.get(timeout=5) for _ in range(12)]
+        assert [data.led_id for _, data in messages[:10]] == list(range(10))
+        assert messages[10:] == [
+            (DetectionControlEnum.SKIP, 10),
+            (DetectionControlEnum.DONE, 0),
+        ]
+        assert queue.empty()
+
+
+def test_bus_max_delay():
+    queue = Queue2D()
+    bus = Bus2D(max_delay=0)
+    bus.subscribe(queue)
+
+    bus.put(DetectionControlEnum.SKIP, 0)
+
+    assert queue.get(timeout=5) == (DetectionControlEnum.SKIP, 0)
+
+
+def test_wait_for_queues_buffered():
+    queue = Queue2D()
+    bus = Bus2D()
+    bus.subscribe(queue)
+
+    bus.put(DetectionControlEnum.SKIP, 0)
+    bus.put(DetectionControlEnum.SKIP, 1)
+    bus.flush()
+
+    assert queue.get(timeout=5) == (DetectionControlEnum.SKIP, 0)
+
+    # the rest of the batch has already been read off the pipe
+    assert wait_for_queues([queue], timeout=0) == [queue]
+    assert queue.get(timeout=0) == (DetectionControlEnum.SKIP, 1)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from marimapper.pycolmap_tools.read_write_model import (
+    ImagesArrays,
+    Points3DArrays,
+    read_images_binary,
+    read_images_binary_arrays,
+    read_points3D_binary,
+    read_points3D_binary_arrays,
+    write_images_binary_arrays,
+    write_points3D_binary_arrays,
+)
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_points3D_round_trip(tmp_path, mmap):
+
+    points = Points3DArrays(
+        ids=np.array([7, 3, 12]),
+        xyz=np.arange(9, dtype=float).reshape(3, 3),
+        rgb=np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8),
+        errors=np.array([0.5, 1.5, 2.5]),
+        track_lengths=np.array([2, 0, 3]),
+        image_ids=np.array([1, 2, 1, 3, 4]),
+        point2D_idxs=np.array([10, 10, 11, 11, 11]),
+    )
+
+    path = tmp_path / "points3D.bin"
+    write_points3D_binary_arrays(points, path)
+
+    read_points = read_points3D_binary_arrays(path, mmap)
+    for field in Points3DArrays._fields:
+        assert np.array_equal(getattr(read_points, field), getattr(points, field))
+
+    points_dict = read_points3D_binary(path)
+    assert list(points_dict[12].image_ids) == [1, 3, 4]
+    assert len(points_dict[3].image_ids) == 0
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_images_round_trip(tmp_path, mmap):
+
+    images = ImagesArrays(
+        ids=np.array([1, 2]),
+        qvecs=np.array([[1.0, 0, 0, 0], [0, 1.0, 0, 0]]),
+        tvecs=np.array([[1.0, 2, 3], [4, 5, 6]]),
+        camera_ids=np.array([1, 1]),
+        names=["0", "view_10"],
+        num_points2D=np.array([1, 2]),
+        xys=np.array([[1.0, 2], [3, 4], [5, 6]]),
+        point3D_ids=np.array([-1, 7, 8]),
+    )
+
+    path = tmp_path / "images.bin"
+    write_images_binary_arrays(images, path)
+
+    read_images = read_images_binary_arrays(path, mmap)
+    assert read_images.names == images.names
+    for field in [
+        "ids",
+        "qvecs",
+        "tvecs",
+        "camera_ids",
+        "num_points2D",
+        "xys",
+        "point3D_ids",
+    ]:
+        assert np.array_equal(getattr(read_images, field), getattr(images, field))
+
+    images_dict = read_images_binary(path)
+    assert images_dict[2].name == "view_10"
+    assert list(images_dict[2].point3D_ids) == [7, 8]
@@ -1,8 +1,12 @@
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
 import numpy as np
 
-from marimapper.sfm import sfm
+from marimapper.sfm import sfm, IncrementalSFM
+from marimapper.model import binary_to_led_map_3d
 from marimapper.file_tools import get_all_2d_led_maps
-from marimapper.led import get_led, get_leds_with_views
+from marimapper.led import LED2D, Point2D, get_led, get_leds_with_views, get_view_ids
 from utils import get_test_dir
 
 
@@ -83,3 +87,184 @@ def test_invalid_reconstruction_views():
     map_3d = sfm(leds_invalid)
 
     assert map_3d == []
+
+
+def test_incremental_reconstruction():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    map_3d_full = sfm(leds)
+
+    incremental_sfm = IncrementalSFM()
+
+    map_3d = incremental_sfm.rebuild(get_leds_with_views(leds, range(5)))
+    for view_id in range(5, 8):
+        map_3d = incremental_sfm.add_view(
+            get_leds_with_views(leds, range(view_id + 1)), view_id
+        )
+
+    incremental_sfm.close()
+
+    assert len(map_3d) > 0.9 * len(map_3d_full)
+
+
+def test_reconstruction_with_limited_view_pairs():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    map_3d_full = sfm(leds)
+
+    incremental_sfm = IncrementalSFM(max_pairs_per_view=4)
+    map_3d = incremental_sfm.rebuild(leds)
+    incremental_sfm.close()
+
+    assert len(map_3d) > 0.9 * len(map_3d_full)
+
+
+def test_reconstruction_to_led_map():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM()
+    map_3d = incremental_sfm.rebuild(get_leds_with_views(leds, range(4)))
+
+    # the in memory conversion should match reading the same model back from disk
+    with TemporaryDirectory() as temp_dir:
+        os.makedirs(Path(temp_dir, "0"))
+        incremental_sfm._reconstruction.write(Path(temp_dir, "0"))
+        map_3d_disk = binary_to_led_map_3d(Path(temp_dir), mmap=True)
+
+    incremental_sfm.close()
+
+    assert len(map_3d) > 0
+    assert np.array_equal(map_3d.led_ids, map_3d_disk.led_ids)
+    assert np.allclose(map_3d.positions, map_3d_disk.positions)
+    assert np.array_equal(map_3d.visibility, map_3d_disk.visibility)
+    assert np.allclose(map_3d.view_positions, map_3d_disk.view_positions)
+
+
+def test_preview_reconstruction():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM()
+
+    map_3d = incremental_sfm.rebuild(get_leds_with_views(leds, range(5)))
+
+    view_5 = get_leds_with_views(leds, [5])
+    partial_leds = get_leds_with_views(leds, range(5)) + view_5[: len(view_5) // 2]
+
+    preview = incremental_sfm.preview_view(partial_leds, 5)
+
+    assert len(preview) > len(map_3d)
+
+    # the preview must not leave the partial view behind in the reconstruction
+    assert len(incremental_sfm._get_leds()) == len(map_3d)
+
+    incremental_sfm.close()
+
+
+def test_fixed_pose_retriangulation():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM()
+    map_3d = incremental_sfm.rebuild(leds)
+
+    # rescan some of the leds as though they were slightly moved
+    rescanned_led_ids = set(map_3d.led_ids[:100].tolist())
+    rescanned_leds = [
+        (
+            LED2D(
+                led.led_id, led.view_id, Point2D(led.point.u() + 0.001, led.point.v())
+            )
+            if led.led_id in rescanned_led_ids
+            else led
+        )
+        for led in leds
+    ]
+
+    # rescanned from every view
+    map_3d_rescanned = incremental_sfm.retriangulate(
+        rescanned_leds,
+        {led_id: set(get_view_ids(leds)) for led_id in rescanned_led_ids},
+    )
+
+    incremental_sfm.close()
+
+    assert set(map_3d_rescanned.led_ids.tolist()) == set(map_3d.led_ids.tolist())
+    assert np.allclose(map_3d_rescanned.view_positions, map_3d.view_positions)
+
+    moved = np.isin(map_3d.led_ids, list(rescanned_led_ids))
+    assert np.array_equal(map_3d_rescanned.positions[~moved], map_3d.positions[~moved])
+    assert not np.allclose(map_3d_rescanned.positions[moved], map_3d.positions[moved])
+
+
+def test_retriangulation_only_uses_rescanned_views():
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM()
+    map_3d = incremental_sfm.rebuild(leds)
+
+    # the two leds seen from the most views
+    led_ids = map_3d.led_ids[np.argsort(-map_3d.visibility.sum(axis=1))[:2]].tolist()
+    # the 3D map's views keep COLMAP's image ids, which are one more than the view id
+    seen_from = {
+        led_id: (
+            map_3d.view_ids[map_3d.visibility[map_3d.get_index(led_id)]] - 1
+        ).tolist()
+        for led_id in led_ids
+    }
+    assert all(len(view_ids) >= 3 for view_ids in seen_from.values())
+
+    # the first led has been rescanned from two views and the second from just one
+    rescanned_views = {
+        led_ids[0]: set(seen_from[led_ids[0]][:2]),
+        led_ids[1]: set(seen_from[led_ids[1]][:1]),
+    }
+    rescanned_leds = [
+        (
+            LED2D(
+                led.led_id, led.view_id, Point2D(led.point.u() + 0.002, led.point.v())
+            )
+            if led.view_id in rescanned_views.get(led.led_id, set())
+            else led
+        )
+        for led in leds
+    ]
+
+    map_3d_rescanned = incremental_sfm.retriangulate(rescanned_leds, rescanned_views)
+
+    incremental_sfm.close()
+
+    # the stale detections from the other views aren't part of the new point
+    index = map_3d_rescanned.get_index(led_ids[0])
+    assert set(
+        (map_3d_rescanned.view_ids[map_3d_rescanned.visibility[index]] - 1).tolist()
+    ) == set(rescanned_views[led_ids[0]])
+
+    # and a led rescanned from a single view keeps its old position until there's another
+    assert np.array_equal(
+        map_3d_rescanned.positions[map_3d_rescanned.get_index(led_ids[1])],
+        map_3d.positions[map_3d.get_index(led_ids[1])],
+    )
+
+
+def test_failed_retriangulation_keeps_led(monkeypatch):
+    import pycolmap
+
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM()
+    map_3d = incremental_sfm.rebuild(leds)
+
+    led_id = int(map_3d.led_ids[0])
+
+    # the rescanned views don't agree on a new position
+    monkeypatch.setattr(pycolmap, "estimate_triangulation", lambda *args: None)
+    map_3d_rescanned = incremental_sfm.retriangulate(
+        leds, {led_id: set(get_view_ids(leds))}
+    )
+
+    incremental_sfm.close()
+
+    index = map_3d.get_index(led_id)
+    assert np.array_equal(
+        map_3d_rescanned.positions[map_3d_rescanned.get_index(led_id)],
+        map_3d.positions[index],
+    )
@@ -0,0 +1,91 @@
+from marimapper.reconstruction_scheduler import ReconstructionScheduler
+
+
+def test_full_requests_are_merged():
+
+    scheduler = ReconstructionScheduler()
+
+    scheduler.request_full([], view_ids=[1])
+    scheduler.request_full([], view_ids=[2])
+    scheduler.request_full([], rebuild=True)
+
+    job = scheduler.get_job(timeout=0)
+
+    assert job.view_ids == [1, 2]
+    assert job.rebuild
+    assert job.use_cache
+    assert scheduler.get_job(timeout=0) is None
+
+    # a requested rebuild skips the cache even if merged with one that doesn't
+    scheduler.request_full([], rebuild=True, use_cache=False)
+    scheduler.request_full([], view_ids=[3])
+    assert not scheduler.get_job(timeout=0).use_cache
+
+    scheduler.request_full([], rescanned_views={3: {0}, 4: {0}})
+    scheduler.request_full([], rescanned_views={4: {1}, 5: {1}})
+
+    assert scheduler.get_job(timeout=0).rescanned_views == {
+        3: {0},
+        4: {0, 1},
+        5: {1},
+    }
+    assert scheduler.get_job(timeout=0) is None
+
+    # a view finishing while a rescan is pending is still registered
+    scheduler.request_full([], rescanned_views={5: {0}})
+    scheduler.request_full([], view_ids=[3])
+    scheduler.request_full([], view_ids=[4])
+
+    job = scheduler.get_job(timeout=0)
+    assert job.view_ids == [3, 4]
+    assert job.rescanned_views == {5: {0}}
+
+
+def test_previews_are_rate_limited():
+
+    scheduler = ReconstructionScheduler(preview_interval=5)
+
+    assert scheduler.request_preview([], 0, now=0)
+    assert not scheduler.request_preview([], 0, now=1)
+    assert scheduler.request_preview([], 0, now=6)
+
+    # previews never get in the way of a full reconstruction
+    scheduler.request_full([], view_ids=[0])
+    assert not scheduler.request_preview([], 1, now=20)
+    assert not scheduler.get_job(timeout=0).is_preview()
+
+
+def test_stale_jobs():
+
+    scheduler = ReconstructionScheduler(preview_interval=0)
+
+    scheduler.request_preview([], 0, now=0)
+    preview = scheduler.get_job(timeout=0)
+    scheduler.request_preview([], 0, now=1)
+    assert scheduler.is_stale(preview)
+
+    scheduler.request_full([], view_ids=[0])
+    full = scheduler.get_job(timeout=0)
+    scheduler.request_preview([], 1, now=2)
+    assert not scheduler.is_stale(full)  # a preview can't replace a full reconstruction
+
+    scheduler.request_full([], view_ids=[1])
+    assert scheduler.is_stale(full)
+
+    scheduler.close()
+    assert scheduler.is_stale(scheduler.get_job(timeout=0))
+
+
+def test_rebuild_keeps_pending_detections():
+
+    scheduler = ReconstructionScheduler()
+
+    scheduler.request_full(["newer"], view_ids=[2])
+    scheduler.request_rebuild(["older"])
+
+    job = scheduler.get_job(timeout=0)
+    assert job.rebuild
+    assert job.leds_2d == ["newer"]
+
+    scheduler.request_rebuild(["older"])
+    assert scheduler.get_job(timeout=0).leds_2d == ["older"]
@@ -0,0 +1,107 @@
+import os
+import time
+
+from marimapper.file_tools import get_all_2d_led_maps, write_2d_leds_to_file
+from marimapper.led import LED2D, Point2D
+from marimapper.sfm import IncrementalSFM, get_pipeline_options
+from marimapper.sfm_cache import ReconstructionCache, get_reconstruction_key
+from utils import get_test_dir
+
+
+def test_reconstruction_key():
+
+    leds = [LED2D(0, 0, Point2D(0.1, 0.2)), LED2D(1, 1, Point2D(0.3, 0.4))]
+    options = get_pipeline_options()
+
+    key = get_reconstruction_key(leds, "camera_model_radial", 60, options)
+
+    assert key == get_reconstruction_key(leds[::-1], "camera_model_radial", 60, options)
+    assert key != get_reconstruction_key(leds, "camera_model_radial", 50, options)
+    assert key != get_reconstruction_key(leds[:1], "camera_model_radial", 60, options)
+
+    assert key != get_reconstruction_key(
+        leds, "camera_model_radial", 60, options, max_pairs_per_view=1
+    )
+
+    options.min_num_matches = 20
+    assert key != get_reconstruction_key(leds, "camera_model_radial", 60, options)
+
+
+def test_reconstruction_key_survives_resume(tmp_path):
+
+    leds = [
+        LED2D(0, 0, Point2D(0.123456789, 0.2)),
+        LED2D(1, 0, Point2D(0.3, 0.987654321)),
+        LED2D(0, 1, Point2D(1 / 3, 2 / 3)),
+    ]
+    options = get_pipeline_options()
+
+    # as the file writer saves them during a scan and they're loaded on resume
+    write_2d_leds_to_file(leds[:2], tmp_path / "led_map_2d_0.csv")
+    write_2d_leds_to_file(leds[2:], tmp_path / "led_map_2d_1.csv")
+    reloaded_leds = get_all_2d_led_maps(tmp_path)
+
+    assert get_reconstruction_key(
+        leds, "camera_model_radial", 60, options
+    ) == get_reconstruction_key(reloaded_leds, "camera_model_radial", 60, options)
+
+
+def test_cached_rebuild(tmp_path):
+
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM(cache_dir=tmp_path)
+    map_3d = incremental_sfm.rebuild(leds)
+    incremental_sfm.close()
+
+    assert len(os.listdir(tmp_path)) == 1
+
+    cached_sfm = IncrementalSFM(cache_dir=tmp_path)
+    start = time.perf_counter()
+    cached_map_3d = cached_sfm.rebuild(leds)
+    assert time.perf_counter() - start < 1
+
+    assert list(cached_map_3d.led_ids) == list(map_3d.led_ids)
+    assert (abs(cached_map_3d.positions - map_3d.positions) < 1e-6).all()
+
+    # a cached reconstruction can still be extended
+    assert len(cached_sfm.add_view(leds, 0)) == len(map_3d)
+    cached_sfm.close()
+
+
+def test_rebuild_without_cache(tmp_path, monkeypatch):
+
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    incremental_sfm = IncrementalSFM(cache_dir=tmp_path)
+    map_3d = incremental_sfm.rebuild(leds)
+
+    def load_cached(_):
+        raise AssertionError("rebuild loaded from the cache")
+
+    monkeypatch.setattr(incremental_sfm, "_load_cached", load_cached)
+
+    assert len(incremental_sfm.rebuild(leds, use_cache=False)) == len(map_3d)
+    incremental_sfm.close()
+
+
+def test_cache_eviction(tmp_path):
+
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+    incremental_sfm = IncrementalSFM()
+    incremental_sfm.rebuild(leds)
+    reconstruction = incremental_sfm._reconstruction
+
+    cache = ReconstructionCache(tmp_path, max_entries=2)
+    cache.store("a", reconstruction, 4)
+    cache.store("b", reconstruction, 4)
+    os.utime(tmp_path / "a", (0, 0))
+    os.utime(tmp_path / "b", (1, 1))
+
+    assert cache.load("a")[1] == 4  # a is now the most recently used
+    cache.store("c", reconstruction, 4)
+
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert cache.load("b") is None
+
+    incremental_sfm.close()
@@ -1,7 +1,12 @@
 from marimapper.sfm_process import SFM
+from marimapper.led_map import LEDMap3D
+from marimapper.reconstruction_scheduler import ReconstructionScheduler
+from marimapper.shared_led_map import SharedMapPublisher
 from marimapper.file_tools import get_all_2d_led_maps
-from marimapper.queues import Queue3D
+from marimapper.queues import Queue3D, Queue3DInfo
+from marimapper.shared_led_map import read_shared_info, read_shared_map
 from utils import get_test_dir
+import threading
 import time
 import pytest
 
@@ -18,7 +23,8 @@ def test_sfm_process_basic():
     sfm.add_output_queue(output_queue)
     sfm.start()
 
-    map_3d = output_queue.get(timeout=5)
+    _, block_name = output_queue.get(timeout=5)
+    map_3d = read_shared_map(block_name)
 
     assert len(map_3d) == 21
 
@@ -43,3 +49,86 @@ def test_sfm_process_exit():
     del sfm
 
     assert True
+
+
+def test_sfm_process_request_rebuild(tmp_path):
+
+    leds = get_all_2d_led_maps(get_test_dir("../docs/highbeam_example"))
+
+    sfm = SFM(existing_leds=leds, cache_dir=tmp_path)
+
+    output_queue = Queue3D()
+    info_queue = Queue3DInfo()
+    sfm.add_output_queue(output_queue)
+    sfm.add_output_info_queue(info_queue)
+    sfm.start()
+
+    first_version, _ = output_queue.get(timeout=60)
+
+    # the info for each led is published in the same block as the map
+    assert info_queue.get(timeout=5)[0] == first_version
+
+    sfm.request_rebuild()
+    version, block_name = output_queue.get(timeout=60)
+
+    assert version > first_version
+    assert len(read_shared_map(block_name)) > 0
+    assert len(read_shared_info(block_name)) > 0
+
+    sfm.stop()
+    sfm.join(10)
+
+
+class FailingIncrementalSFM:
+    def __init__(self, fail_rebuild: bool):
+        self.fail_rebuild = fail_rebuild
+        self.rebuilds = 0
+
+    def add_view(self, leds_2d, view_id):
+        raise RuntimeError("add_view failed")
+
+    def rebuild(self, leds_2d, use_cache=True):
+        self.rebuilds += 1
+        if self.fail_rebuild:
+            raise RuntimeError("rebuild failed")
+        return LEDMap3D()
+
+
+def run_worker(incremental_sfm: FailingIncrementalSFM) -> SFM:
+    sfm = SFM()
+    scheduler = ReconstructionScheduler()
+    publisher = SharedMapPublisher()
+
+    scheduler.request_full([], view_ids=[0])
+
+    worker = threading.Thread(
+        target=sfm._reconstruction_worker,
+        args=(scheduler, incremental_sfm, publisher),
+    )
+    worker.start()
+
+    timeout = time.time() + 5
+    while incremental_sfm.rebuilds == 0 or (
+        incremental_sfm.fail_rebuild and not sfm._exit_event.is_set()
+    ):
+        assert time.time() < timeout, "worker didn't recover from the failure"
+        time.sleep(0.01)
+
+    scheduler.close()
+    worker.join(5)
+    publisher.close()
+    return sfm
+
+
+def test_failed_reconstruction_rebuilds():
+
+    sfm = run_worker(FailingIncrementalSFM(fail_rebuild=False))
+
+    assert not sfm._exit_event.is_set()
+
+
+def test_failed_rebuild_stops_sfm():
+
+    sfm = run_worker(FailingIncrementalSFM(fail_rebuild=True))
+
+    assert sfm._exit_event.is_set()
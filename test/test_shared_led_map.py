@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+from marimapper.led import LED2D, LED3D, LEDInfo, Point2D, View
+from marimapper.led_map import LEDMap2D, LEDMap3D
+from marimapper.queues import Queue3D, Queue3DInfo
+from marimapper.shared_led_map import (
+    KEEP_VERSIONS,
+    SharedMapPublisher,
+    read_shared_info,
+    read_shared_map,
+)
+
+
+def get_led_map(led_count: int) -> LEDMap3D:
+    views = [
+        View(0, np.array([0.0, 0.0, 5.0]), np.eye(3)),
+        View(3, np.ones(3), np.eye(3)),
+    ]
+    leds = []
+    for led_id in range(led_count):
+        led = LED3D(led_id)
+        led.point.position = np.array([led_id, 2.0 * led_id, -led_id], dtype=float)
+        led.point.error = led_id / 10
+        led.views = views[: 1 + led_id % 2]
+        leds.append(led)
+    return LEDMap3D.from_leds(leds)
+
+
+def test_shared_map_round_trip():
+    publisher = SharedMapPublisher()
+    led_map = get_led_map(20)
+
+    try:
+        version, block_name = publisher.publish(led_map)
+        assert version == 1
+
+        shared_map = read_shared_map(block_name)
+    finally:
+        publisher.close()
+
+    assert shared_map is not None
+    assert len(shared_map) == len(led_map)
+    for name in [
+        "led_ids",
+        "positions",
+        "errors",
+        "view_ids",
+        "view_positions",
+        "view_rotations",
+        "visibility",
+    ]:
+        assert np.array_equal(getattr(shared_map, name), getattr(led_map, name))
+
+
+def test_shared_info_round_trip():
+    publisher = SharedMapPublisher()
+    led_map = get_led_map(3)
+    leds_2d = LEDMap2D.from_leds(
+        [LED2D(led_id, 0, Point2D(0.5, 0.5)) for led_id in [2, 7]]
+    )
+    info_queue = Queue3DInfo()
+
+    try:
+        block_name = publisher.publish(led_map, led_map.get_info_codes(leds_2d))[1]
+        assert len(read_shared_map(block_name)) == len(led_map)
+        assert read_shared_info(block_name) == led_map.get_info(leds_2d)
+
+        # the info still goes out before there's a model to go with it
+        info_queue.put(
+            *publisher.publish(LEDMap3D(), LEDMap3D().get_info_codes(leds_2d))
+        )
+        time.sleep(0.5)
+
+        assert info_queue.get_latest() == {
+            2: LEDInfo.DETECTED,
+            7: LEDInfo.DETECTED,
+        }
+
+        # maps published without any info have none to read
+        assert read_shared_info(publisher.publish(led_map)[1]) == {}
+    finally:
+        publisher.close()
+
+
+def test_shared_map_releases_old_versions():
+    publisher = SharedMapPublisher()
+
+    try:
+        block_names = [
+            publisher.publish(get_led_map(i + 1))[1] for i in range(KEEP_VERSIONS + 1)
+        ]
+
+        assert read_shared_map(block_names[0]) is None
+        assert len(read_shared_map(block_names[-1])) == KEEP_VERSIONS + 1
+    finally:
+        publisher.close()
+
+    assert read_shared_map(block_names[-1]) is None
+
+
+def test_queue_3d_get_latest():
+    publisher = SharedMapPublisher()
+    queue = Queue3D()
+
+    try:
+        assert queue.get_latest() is None
+
+        for led_count in [5, 10, 15]:
+            queue.put(*publisher.publish(get_led_map(led_count)))
+
+        # the queue is fed by a background thread, so give everything a moment to land
+        time.sleep(0.5)
+
+        latest = queue.get_latest()
+    finally:
+        publisher.close()
+
+    assert len(latest) == 15
+    assert queue.empty()
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+from marimapper.detector import enable_and_find_led
+from marimapper.detector_process import detect_leds
+from marimapper.led import LED2D, Point2D
+from marimapper.led_map import LEDMap3D
+from marimapper.timeout_controller import TimeoutController
+from marimapper.view_prediction import ViewPredictor, project_points
+from utils import MockQueue, MockScene
+
+
+def get_sphere_scene(led_count):
+
+    # leds on a sphere, the front half seen from one view and the back half from another
+    rng = np.random.default_rng(0)
+    positions = rng.normal(size=(led_count, 3))
+    positions /= np.linalg.norm(positions, axis=1)[:, None]
+
+    leds_3d = LEDMap3D(
+        led_ids=range(led_count),
+        positions=positions,
+        view_ids=[0, 1],
+        view_positions=[[0, 0, -6.0], [0, 0, 6.0]],
+        view_rotations=[np.eye(3), np.eye(3)],
+        visibility=np.stack([positions[:, 2] < 0, positions[:, 2] >= 0], axis=1),
+    )
+
+    # the new view is just to the side of the first one
+    rotation = cv2.Rodrigues(np.array([0, 0.2, 0]))[0]
+    translation = -rotation @ np.array([1.0, 0, -6.0])
+    uv, _ = project_points(positions, rotation, translation, 60)
+
+    return positions, leds_3d, uv
+
+
+def test_view_prediction():
+
+    positions, leds_3d, uv = get_sphere_scene(200)
+
+    predictor = ViewPredictor(leds_3d)
+    assert not predictor.update_pose()
+
+    for led_id in range(20):
+        predictor.add_detection(LED2D(led_id, 1, Point2D(*uv[led_id])))
+
+    assert predictor.update_pose()
+
+    front_led_id = int(np.argmin(positions[20:, 2])) + 20
+    back_led_id = int(np.argmax(positions[20:, 2])) + 20
+
+    roi = predictor.get_roi(front_led_id)
+    assert roi[0] < uv[front_led_id][0] < roi[2]
+    assert roi[1] < uv[front_led_id][1] < roi[3]
+
+    assert predictor.sort_led_ids([back_led_id, 500, front_led_id]) == [
+        front_led_id,
+        500,
+        back_led_id,
+    ]
+    assert predictor.is_unlikely(back_led_id)
+    assert predictor.get_roi(500) is None
+
+
+def test_detect_leds_with_prediction():
+
+    positions, leds_3d, uv = get_sphere_scene(100)
+    # only the front of the sphere can be seen
+    visible = positions[:, 2] < 0
+    scene = MockScene(
+        100, np.flatnonzero(~visible), positions=uv * 400, image_size=(400, 400)
+    )
+
+    leds = detect_leds(
+        0,
+        100,
+        scene,
+        scene,
+        1,
+        TimeoutController(default_timeout_sec=0.01),
+        128,
+        False,
+        MockQueue(),
+        leds_3d=leds_3d,
+    )
+
+    assert {led.led_id for led in leds} == set(np.flatnonzero(visible))
+
+    # once the pose is known the hidden leds are left until last
+    hidden_count = int((~visible).sum())
+    assert not visible[scene.lit_order[-hidden_count // 2 :]].any()
+
+
+def test_led_outside_roi_is_still_found():
+
+    scene = MockScene(1, image_size=(400, 400))
+
+    # the led is at the top left but a bad pose predicted it at the bottom right
+    led = enable_and_find_led(
+        scene,
+        scene,
+        0,
+        0,
+        TimeoutController(default_timeout_sec=0.05),
+        128,
+        roi=(0.8, 0.8, 1.0, 1.0),
+    )
+
+    assert led is not None
+    assert led.point.u() * 400 == scene.get_position(0)[0]
@@ -0,0 +1,60 @@
+from marimapper.detector_process import detect_leds, find_visible_led_ids
+from marimapper.queues import DetectionControlEnum
+from marimapper.timeout_controller import TimeoutController
+from utils import MockQueue, MockScene
+
+
+def get_column_scene(led_count, visible_led_ids):
+    # leds in a column down the image
+    return MockScene(
+        led_count,
+        set(range(led_count)) - visible_led_ids,
+        positions=[(51, led_id * 3 + 11) for led_id in range(led_count)],
+        image_size=(400, 400),
+    )
+
+
+def test_find_visible_led_ids():
+
+    scene = get_column_scene(100, {3, 4, 40, 99})
+
+    visible_led_ids = find_visible_led_ids(
+        0,
+        100,
+        scene,
+        scene,
+        TimeoutController(default_timeout_sec=0.01),
+        128,
+        False,
+        16,
+    )
+
+    assert set(visible_led_ids) >= {3, 4, 40, 99}
+    assert len(visible_led_ids) < 16
+    assert visible_led_ids == sorted(visible_led_ids)
+
+
+def test_detect_leds_skips_hidden_leds():
+
+    scene = get_column_scene(64, {10, 11})
+    queue = MockQueue()
+
+    leds = detect_leds(
+        0,
+        64,
+        scene,
+        scene,
+        0,
+        TimeoutController(default_timeout_sec=0.01),
+        128,
+        False,
+        queue,
+        8,
+    )
+
+    assert [led.led_id for led in leds] == [10, 11]
+    assert len(queue.items) == 64
+    skipped = [
+        data for control, data in queue.items if control == DetectionControlEnum.SKIP
+    ]
+    assert len(skipped) == 62
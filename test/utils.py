@@ -1,8 +1,89 @@
 import os
 from pathlib import Path
 
+import numpy as np
+
 
 def get_test_dir(path: str) -> Path:
 
     this_path = os.path.dirname(os.path.abspath(__file__))
     return Path(this_path) / path
+
+
+class MockScene:
+    # Pretends to be both the backend and the camera, every lit led that isn't hidden shows up as a small
+    # square at its position, which defaults to a grid. In colour each channel leaks a bit into its neighbours
+
+    def __init__(
+        self,
+        led_count,
+        hidden_led_ids=(),
+        positions=None,
+        image_size=(480, 640),
+        color=False,
+        ambient=0,
+    ):
+        self.led_count = led_count
+        self.hidden_led_ids = set(hidden_led_ids)
+        self.positions = positions
+        self.image_size = image_size
+        self.color = color
+        self.ambient = ambient
+        self.colors = {}
+        self.lit_order = []
+        self.frames = 0
+
+    @property
+    def lit(self):
+        return set(self.colors)
+
+    def get_led_count(self):
+        return self.led_count
+
+    def get_position(self, led_id):
+        if self.positions is not None:
+            return tuple(int(p) for p in self.positions[led_id])
+        return 20 + (led_id % 20) * 30, 20 + (led_id // 20) * 30
+
+    def set_led(self, led_index, on):
+        if on:
+            self.colors[led_index] = [255, 255, 255]
+            self.lit_order.append(led_index)
+        else:
+            self.colors.pop(led_index, None)
+
+    def set_leds(self, buffer):
+        self.colors = {
+            led_id: pixel for led_id, pixel in enumerate(buffer) if max(pixel) > 0
+        }
+
+    def read(self):
+        shape = (*self.image_size, 3) if self.color else self.image_size
+        image = np.full(shape, self.ambient, dtype=np.uint8)
+        for led_id, (red, green, blue) in self.colors.items():
+            if led_id in self.hidden_led_ids:
+                continue
+            if self.color:
+                pixel = np.clip(
+                    np.array([blue, green, red])
+                    + 0.3 * np.array([green, red + blue, green]),
+                    0,
+                    255,
+                )
+            else:
+                pixel = 250
+            x, y = self.get_position(led_id)
+            image[y - 1 : y + 2, x - 1 : x + 2] = pixel
+        return image
+
+    def read_after(self, _timestamp):
+        self.frames += 1
+        return self.read()
+
+
+class MockQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, control, data):
+        self.items.append((control, data))